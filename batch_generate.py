@@ -0,0 +1,335 @@
+# batch_generate.py
+"""
+Bulk Handout Generation for PostopCare
+
+Regenerates handouts for many procedures at once, e.g. after the literature
+index is refreshed. Every section of every procedure is a separate job on one
+bounded worker pool, so slow sections of one procedure never leave workers
+idle while other procedures are waiting.
+
+    - Each finished handout is written to <output_dir>/<procedure_slug>.json
+      as soon as its last section completes; output_format (--format) can
+      write compact orjson or msgpack instead, and include_source_text=False
+      (--omit-source-text) leaves chunk text out (see handout_codec.py).
+      Procedures whose slugs collide ("Knee Replacement", "knee-replacement")
+      get a hash suffix, and a handout rewritten in another format replaces
+      the old file
+    - <output_dir>/manifest.json records completed and failed procedures;
+      re-running with the same output_dir skips completed work
+    - With refresh=True (--refresh), completed handouts are regenerated
+      incrementally instead: sections whose retrieval fingerprint is
+      unchanged keep their content, so an index refresh only pays for the
+      sections it actually changed
+    - Progress and throughput (handouts per minute) are logged as handouts finish
+
+Setup:
+    Same as rag_pipeline.py
+
+Usage:
+    python batch_generate.py procedures.txt --output-dir handouts --workers 8
+    python batch_generate.py procedures.txt --output-dir handouts --refresh   # after an index refresh
+    python batch_generate.py procedures.txt --format msgpack --omit-source-text
+
+    # or from Python
+    summary = generate_handouts(["knee replacement", "appendectomy"], "handouts", max_workers=8)
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Optional
+
+import rag_pipeline
+from handout_codec import FILE_EXTENSIONS, FORMATS, decode_handout, encode_handout, format_for_path, without_source_text
+
+logger = logging.getLogger("batch_generate")
+
+MANIFEST_NAME = "manifest.json"
+
+
+def procedure_slug(procedure: str) -> str:
+    """
+    File-name-safe slug for a procedure.
+
+    Input:
+        procedure = "Total Knee Replacement (TKA)"
+    Output:
+        "total_knee_replacement_tka"
+    """
+    return re.sub(r"[^a-z0-9]+", "_", procedure.lower()).strip("_") or "procedure"
+
+
+def assign_file_stems(procedures: list[str], manifest: dict) -> dict[str, str]:
+    """
+    Output file name (without extension) of each procedure, unique within the output directory.
+
+    Procedures the manifest already has a file for keep its name. Others use
+    their slug, or the slug plus a hash of the procedure when another
+    procedure already has it.
+
+    Input:
+        procedures = ["Knee Replacement", "knee-replacement"]
+    Output:
+        {"Knee Replacement": "knee_replacement", "knee-replacement": "knee_replacement_0d301270"}
+    """
+    taken = {
+        os.path.splitext(entry["file"])[0]: procedure
+        for procedure, entry in manifest["completed"].items()
+    }
+    stems = {}
+    for procedure in procedures:
+        entry = manifest["completed"].get(procedure)
+        if entry:
+            stems[procedure] = os.path.splitext(entry["file"])[0]
+            continue
+        stem = procedure_slug(procedure)
+        if taken.get(stem, procedure) != procedure:
+            stem = f"{stem}_{hashlib.sha1(procedure.encode('utf-8')).hexdigest()[:8]}"
+        taken[stem] = procedure
+        stems[procedure] = stem
+    return stems
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Write to a temp file and rename it, so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _write_json_atomic(path: str, data: dict) -> None:
+    """Write indented JSON atomically (see _write_atomic)."""
+    _write_atomic(path, json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
+
+
+def write_handout(path: str, handout: dict, output_format: str = "json", include_source_text: bool = True) -> None:
+    """Write a handout atomically: indented JSON by default, else compact (see handout_codec.py)."""
+    if output_format == "json":
+        _write_json_atomic(path, handout if include_source_text else without_source_text(handout))
+    else:
+        _write_atomic(path, encode_handout(handout, output_format, include_text=include_source_text))
+
+
+def read_handout(path: str) -> dict:
+    """Read a handout written by write_handout, in any format."""
+    with open(path, "rb") as f:
+        return decode_handout(f.read(), format_for_path(path))
+
+
+def load_manifest(output_dir: str) -> dict:
+    """Load the checkpoint manifest, or an empty one if this is a fresh run."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"completed": {}, "failed": {}}
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest.setdefault("completed", {})
+    manifest.setdefault("failed", {})
+    return manifest
+
+
+def generate_handouts(
+    procedures: list[str],
+    output_dir: str,
+    sections: Optional[list[str]] = None,
+    max_workers: int = 8,
+    progress_callback: Optional[Callable[[dict], None]] = None,
+    refresh: bool = False,
+    output_format: str = "json",
+    include_source_text: bool = True,
+    **section_kwargs
+) -> dict:
+    """
+    Generate handouts for many procedures on one bounded worker pool.
+
+    Procedures already marked completed in the manifest (with their handout
+    file still present) are skipped. Procedures with a failed section are
+    recorded under "failed" in the manifest, not written, and retried on the
+    next run. Extra keyword arguments (top_k, retrieval_cache,
+    generation_cache, store, token_budget) are passed to every section.
+    
+    With refresh=True, completed procedures are not skipped but regenerated
+    against their existing handout file: sections with an unchanged
+    fingerprint are reused (see rag_pipeline.generate_full_handout).
+    
+    output_format is "json" (indented), "orjson" or "msgpack"; with
+    include_source_text=False chunk text is left out of all_sources. Files
+    from earlier runs are read back in whatever format they were written,
+    and a refreshed handout written in a new format replaces its old file.
+    File names come from assign_file_stems(), so procedures with the same
+    slug never overwrite each other.
+
+    Input:
+        procedures = ["knee replacement", "appendectomy", "hip replacement"]
+        output_dir = "handouts"
+        max_workers = 8
+
+    Output:
+        {
+            "total": 3,
+            "skipped": 1,
+            "completed": 1,
+            "failed": {"hip replacement": {"wound_care": "TimeoutError: LLM request timed out"}},
+            "sections_reused": 0,
+            "sections_regenerated": 6,
+            "elapsed_seconds": 41.7,
+            "handouts_per_minute": 1.4
+        }
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format: {output_format!r} (expected one of {FORMATS})")
+    encode_handout({}, output_format)  # Fails now, not after generating, if orjson/msgpack is missing
+    start_time = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    if sections is None:
+        sections = rag_pipeline.DEFAULT_SECTIONS
+
+    manifest = load_manifest(output_dir)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+
+    # Drop duplicates and anything a previous run already finished
+    pending = []
+    skipped = 0
+    previous = {}  # procedure -> sections of its existing handout, when refreshing
+    for procedure in dict.fromkeys(procedures):
+        entry = manifest["completed"].get(procedure)
+        if entry and os.path.exists(os.path.join(output_dir, entry["file"])):
+            if not refresh:
+                skipped += 1
+                continue
+            previous[procedure] = rag_pipeline.previous_sections(read_handout(os.path.join(output_dir, entry["file"])))
+        pending.append(procedure)
+
+    stems = assign_file_stems(pending, manifest)
+
+    logger.info(
+        f"Batch of {len(procedures)} procedures: {skipped} already completed, "
+        f"{len(pending)} to generate with {max_workers} workers"
+    )
+
+    outcomes = {procedure: [None] * len(sections) for procedure in pending}
+    remaining = {procedure: len(sections) for procedure in pending}
+    first_start = {}
+    completed = 0
+    failed = {}
+    section_counts = {"sections_reused": 0, "sections_regenerated": 0}
+
+    def run(procedure, section):
+        first_start.setdefault(procedure, time.perf_counter())
+        previous_section = previous.get(procedure, {}).get(section)
+        return rag_pipeline.run_section(procedure, section, previous_section=previous_section, **section_kwargs)
+
+    def finish(procedure):
+        nonlocal completed
+        elapsed = time.perf_counter() - first_start[procedure]
+        handout = rag_pipeline.assemble_handout(procedure, sections, outcomes.pop(procedure), elapsed)
+        for name in section_counts:
+            section_counts[name] += handout["quality_metrics"][name]
+        errors = {
+            section: entry["error"]
+            for section, entry in zip(sections, handout["sections"])
+            if "error" in entry
+        }
+        if errors:
+            failed[procedure] = errors
+            manifest["failed"][procedure] = {"errors": errors, "failed_at": datetime.now().isoformat()}
+        else:
+            file_name = f"{stems[procedure]}{FILE_EXTENSIONS[output_format]}"
+            write_handout(os.path.join(output_dir, file_name), handout, output_format, include_source_text)
+            old_file = manifest["completed"].get(procedure, {}).get("file")
+            if old_file and old_file != file_name:
+                # Written in another format before; don't leave a stale copy behind
+                try:
+                    os.remove(os.path.join(output_dir, old_file))
+                except FileNotFoundError:
+                    pass
+            completed += 1
+            manifest["completed"][procedure] = {"file": file_name, "completed_at": datetime.now().isoformat()}
+            manifest["failed"].pop(procedure, None)
+        _write_json_atomic(manifest_path, manifest)
+
+        done = completed + len(failed)
+        minutes = (time.perf_counter() - start_time) / 60
+        rate = completed / minutes if minutes else 0.0
+        status = "failed" if errors else "done"
+        logger.info(f"[{done}/{len(pending)}] {procedure} {status} ({rate:.1f} handouts/min)")
+        if progress_callback is not None:
+            progress_callback({
+                "procedure": procedure,
+                "status": status,
+                "done": done,
+                "total": len(pending),
+                "handouts_per_minute": round(rate, 2)
+            })
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch-section") as executor:
+        futures = {
+            executor.submit(run, procedure, section): (procedure, index)
+            for procedure in pending
+            for index, section in enumerate(sections)
+        }
+        # Results are collected and handouts finished on this thread only,
+        # so outcomes, remaining and the manifest need no lock
+        for future in as_completed(futures):
+            procedure, index = futures[future]
+            outcomes[procedure][index] = future.result()
+            remaining[procedure] -= 1
+            if remaining[procedure] == 0:
+                finish(procedure)
+
+    elapsed_time = time.perf_counter() - start_time
+    summary = {
+        "total": len(procedures),
+        "skipped": skipped,
+        "completed": completed,
+        "failed": failed,
+        **section_counts,
+        "elapsed_seconds": round(elapsed_time, 1),
+        "handouts_per_minute": round(completed / (elapsed_time / 60), 2) if elapsed_time else 0.0
+    }
+    logger.info(
+        f"Batch finished: {completed} completed, {len(failed)} failed, {skipped} skipped "
+        f"({section_counts['sections_reused']} sections reused) in {elapsed_time:.1f} seconds ({summary['handouts_per_minute']} handouts/min)"
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate handouts for many procedures")
+    parser.add_argument("procedures_file", help="Text file with one procedure per line")
+    parser.add_argument("--output-dir", default="handouts", help="Where handouts and manifest.json are written")
+    parser.add_argument("--workers", type=int, default=8, help="Maximum concurrent section jobs")
+    parser.add_argument("--top-k", type=int, default=5, help="Chunks retrieved per section")
+    parser.add_argument(
+        "--refresh", action="store_true",
+        help="Regenerate completed handouts, reusing sections whose retrieval is unchanged"
+    )
+    parser.add_argument("--format", choices=FORMATS, default="json", help="Handout file format")
+    parser.add_argument("--omit-source-text", action="store_true", help="Leave chunk text out of all_sources")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    with open(args.procedures_file, encoding="utf-8") as f:
+        procedure_list = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    result = generate_handouts(
+        procedure_list, args.output_dir, max_workers=args.workers, top_k=args.top_k, refresh=args.refresh,
+        output_format=args.format, include_source_text=not args.omit_source_text
+    )
+    print(json.dumps(result, indent=2))
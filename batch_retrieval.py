@@ -0,0 +1,178 @@
+# batch_retrieval.py
+"""
+Batched Retrieval for PostopCare
+
+One handout needs one search query per section. Sending them one at a time
+means one embedding request and one vector store query per section. This
+module sends all of a handout's queries together instead:
+
+    1. Embed every query in a single embedding call
+    2. Run all query vectors as one multi-query search
+    3. Return one chunk list per query, in the same order
+
+Batch contract:
+    A store supports batching when it exposes both of:
+        embed_texts(texts: list[str]) -> list[list[float]]
+        query_vectors(vectors: list[list[float]], top_k: int) -> list[list[dict]]
+    or a single search_batch(queries: list[str], top_k: int) -> list[list[dict]].
+    Anything else is searched query by query through search(query, top_k).
+
+Setup:
+    No additional pip installs required
+
+LocalVectorStore is an in-memory stand-in that implements the batch contract,
+so the batched pipeline can be exercised without Pinecone.
+"""
+
+import hashlib
+import math
+import re
+import threading
+from typing import Optional
+
+
+def batch_search(queries: list[str], top_k: int = 5, store: Optional[object] = None) -> list[list[dict]]:
+    """
+    Search many queries in as few round trips as the store allows.
+
+    Input:
+        queries = [
+            "knee replacement pain management post operative care instructions",
+            "knee replacement wound care post operative care instructions"
+        ]
+        top_k = 5
+        store = None  # Uses the vector_store module
+
+    Output:
+        [
+            [{"id": "pmid_12345_chunk_0", "text": "...", "score": 0.89, "metadata": {...}}, ...],
+            [{"id": "pmid_67890_chunk_2", "text": "...", "score": 0.85, "metadata": {...}}, ...]
+        ]
+    """
+    if store is None:
+        import vector_store as store
+
+    if not queries:
+        return []
+
+    if hasattr(store, "search_batch"):
+        results = store.search_batch(queries, top_k=top_k)
+    elif hasattr(store, "embed_texts") and hasattr(store, "query_vectors"):
+        vectors = store.embed_texts(queries)
+        results = store.query_vectors(vectors, top_k=top_k)
+    else:
+        results = [store.search(query, top_k=top_k) for query in queries]
+
+    if len(results) != len(queries):
+        raise ValueError(f"Store returned {len(results)} result lists for {len(queries)} queries")
+    return [list(chunks) for chunks in results]
+
+
+# Tokens used by the stand-in embedding
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def hashed_embedding(text: str, dimensions: int = 256) -> list[float]:
+    """
+    Deterministic bag-of-words embedding for offline testing.
+
+    Each token is hashed into one of `dimensions` buckets and the vector is
+    L2-normalized, so a dot product between two embeddings is their cosine
+    similarity. Texts sharing words score higher, which is all the stand-in
+    store needs.
+
+    Input:
+        text = "knee pain"
+    Output:
+        [0.0, 0.707..., 0.0, ..., 0.707..., 0.0]  # length 256
+    """
+    vector = [0.0] * dimensions
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        vector[int.from_bytes(digest, "little") % dimensions] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm:
+        vector = [v / norm for v in vector]
+    return vector
+
+
+class SearchFnStore:
+    """
+    Store over a bare search(query, top_k) function, e.g. a RAGPipeline's
+    injected search_fn. Nothing to batch: search_batch() searches query by
+    query.
+    """
+
+    def __init__(self, search_fn):
+        self.search_fn = search_fn
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        return self.search_fn(query, top_k=top_k)
+
+    def search_batch(self, queries: list[str], top_k: int = 5) -> list[list[dict]]:
+        return [self.search_fn(query, top_k=top_k) for query in queries]
+
+
+class LocalVectorStore:
+    """
+    In-memory stand-in for the Pinecone-backed vector store.
+
+    Implements search() for per-query retrieval and embed_texts() /
+    query_vectors() for batched retrieval, and counts how many embedding and
+    query round trips each path made.
+
+    Usage:
+        store = LocalVectorStore()
+        store.add([
+            {"id": "pmid_12345_chunk_0", "text": "Acetaminophen is effective...", "metadata": {"pmid": "12345"}}
+        ])
+        store.search("knee pain", top_k=5)
+        batch_search(["knee pain", "wound care"], top_k=5, store=store)
+        store.embed_calls   # 1 for the batch, 1 per search() call
+        store.query_calls   # 1 for the batch, 1 per search() call
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+        self.chunks = []
+        self.vectors = []
+        self.embed_calls = 0
+        self.query_calls = 0
+        self._lock = threading.Lock()
+
+    def add(self, chunks: list[dict]) -> None:
+        """Add chunks ({"id", "text", "metadata"}) to the store."""
+        for chunk in chunks:
+            self.chunks.append({
+                "id": chunk["id"],
+                "text": chunk["text"],
+                "metadata": dict(chunk.get("metadata", {}))
+            })
+            self.vectors.append(hashed_embedding(chunk["text"], self.dimensions))
+
+    def embed_texts(self, texts: list[str]) -> list[list[float]]:
+        """Embed a batch of texts in one call."""
+        with self._lock:
+            self.embed_calls += 1
+        return [hashed_embedding(text, self.dimensions) for text in texts]
+
+    def query_vectors(self, vectors: list[list[float]], top_k: int = 5) -> list[list[dict]]:
+        """Run several query vectors in one call."""
+        with self._lock:
+            self.query_calls += 1
+        return [self._top_k(vector, top_k) for vector in vectors]
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        """Same contract as vector_store.search."""
+        return self.query_vectors(self.embed_texts([query]), top_k=top_k)[0]
+
+    def _top_k(self, vector: list[float], top_k: int) -> list[dict]:
+        scored = []
+        for chunk, chunk_vector in zip(self.chunks, self.vectors):
+            score = sum(a * b for a, b in zip(vector, chunk_vector))
+            scored.append((score, chunk))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [
+            {"id": chunk["id"], "text": chunk["text"], "score": round(score, 4), "metadata": dict(chunk["metadata"])}
+            for score, chunk in scored[:top_k]
+        ]
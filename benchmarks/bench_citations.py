@@ -0,0 +1,108 @@
+# bench_citations.py
+"""
+Citation formatter microbenchmarks
+
+Times format_citation, format_reference_list, write_reference_list (with a
+warm CitationCache) and add_citations_to_text on large synthetic inputs. Pure Python, no stand-ins needed.
+
+Usage:
+    python benchmarks/bench_citations.py
+"""
+
+import io
+import json
+import os
+import random
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+import citation_formatter
+
+WORDS = (
+    "pain swelling wound incision fever walking stairs bathing driving ice "
+    "acetaminophen ibuprofen infection bleeding dressing sutures recovery "
+    "physical therapy appointment antibiotics nausea constipation sleep"
+).split()
+
+
+def make_articles(count: int, seed: int = 0) -> list[dict]:
+    """Synthetic article dicts with a realistic mix of optional fields."""
+    rng = random.Random(seed)
+    journals = list(citation_formatter.JOURNAL_ABBREVIATIONS) + ["Some Obscure Journal"]
+    articles = []
+    for i in range(count):
+        article = {
+            "authors": [f"Author{rng.randrange(5000)} {chr(65 + rng.randrange(26))}" for _ in range(rng.randint(1, 9))],
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(5, 12))).capitalize(),
+            "journal": rng.choice(journals),
+            "year": rng.randint(1990, 2025),
+            "pmid": str(10000000 + i)
+        }
+        if rng.random() < 0.9:
+            article["volume"] = str(rng.randint(1, 400))
+        if rng.random() < 0.7:
+            article["issue"] = str(rng.randint(1, 12))
+        if rng.random() < 0.9:
+            first = rng.randint(1, 2000)
+            article["pages"] = f"{first}-{first + rng.randint(3, 20)}"
+        articles.append(article)
+    return articles
+
+
+def make_cited_text(anchors: int, seed: int = 0) -> tuple[str, list[dict]]:
+    """Long handout text with one unique anchor phrase per sentence."""
+    rng = random.Random(seed)
+    sentences = []
+    citations = []
+    for i in range(anchors):
+        phrase = f"finding{i}"
+        sentences.append(" ".join(rng.choices(WORDS, k=12)) + f" {phrase}.")
+        citations.append({"after_phrase": phrase, "reference_numbers": [i % 50 + 1]})
+    rng.shuffle(citations)
+    return " ".join(sentences), citations
+
+
+def measure(fn, repeat: int = 5) -> dict:
+    """Run fn repeat times and report the best and mean wall time in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"best_ms": round(min(times) * 1000, 3), "mean_ms": round(sum(times) / len(times) * 1000, 3)}
+
+
+def bench_citations(articles: int = 20000, anchors: int = 500, repeat: int = 5) -> dict:
+    """
+    Output:
+        {
+            "format_citation": {"best_ms": 61.2, "mean_ms": 63.0, "items": 20000},
+            "format_reference_list": {...},
+            "add_citations_to_text": {...}
+        }
+    """
+    article_list = make_articles(articles)
+    text, citations = make_cited_text(anchors)
+    cache = citation_formatter.CitationCache(max_entries=articles)
+
+    results = {
+        "format_citation": measure(lambda: [citation_formatter.format_citation(a) for a in article_list], repeat),
+        "format_reference_list": measure(lambda: citation_formatter.format_reference_list(article_list), repeat),
+        "write_reference_list_cached": measure(
+            lambda: citation_formatter.write_reference_list(article_list, io.StringIO(), cache=cache), repeat
+        ),
+        "add_citations_to_text": measure(lambda: citation_formatter.add_citations_to_text(text, citations), repeat)
+    }
+    results["format_citation"]["items"] = articles
+    results["format_reference_list"]["items"] = articles
+    results["write_reference_list_cached"]["items"] = articles
+    results["add_citations_to_text"]["items"] = anchors
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(bench_citations(), indent=2))
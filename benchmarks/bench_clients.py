@@ -0,0 +1,77 @@
+# bench_clients.py
+"""
+Pooled client benchmark (offline)
+
+Sends the same embedding requests to the stand-in HTTP backend
+(benchmarks/fakes/http_backend.py) twice: once through a client_pool.Backend
+and once with a new connection per request, and reports throughput and
+how many connections each approach opened.
+
+Usage:
+    python benchmarks/bench_clients.py
+"""
+
+import json
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKES_DIR = os.path.join(BENCH_DIR, "fakes")
+
+
+def _per_request_post(url: str, payload: dict) -> dict:
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def bench_clients(requests: int = 300, workers: int = 8, latency: float = 0.0) -> dict:
+    """
+    Output:
+        {
+            "pooled": {"requests_per_second": 2100.4, "connections": 8},
+            "per_request": {"requests_per_second": 900.2, "connections": 300}
+        }
+    """
+    for path in (REPO_DIR, FAKES_DIR):
+        if path not in sys.path:
+            sys.path.append(path)
+    import client_pool
+    from http_backend import start_server
+
+    payload = {"model": "text-embedding-3-small", "input": ["knee replacement wound care"]}
+    results = {}
+
+    def run(name, send):
+        server = start_server(latency=latency)
+        try:
+            post = send(server.url)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda _: post(payload), range(requests)))
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                "requests_per_second": round(requests / elapsed, 1),
+                "connections": server.stats()["connections"]
+            }
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def pooled(url):
+        backend = client_pool.Backend("bench", url, max_connections=workers)
+        return lambda body: backend.post_json("/v1/embeddings", body)
+
+    run("pooled", pooled)
+    run("per_request", lambda url: lambda body: _per_request_post(f"{url}/v1/embeddings", body))
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(bench_clients(), indent=2))
@@ -0,0 +1,64 @@
+# bench_imports.py
+"""
+Import time benchmark (offline)
+
+Imports each module in a fresh interpreter and reports the best wall time
+of several runs, so startup cost of CLI tools and forked workers shows up in
+the baseline. Also records whether the import pulled in the vector store or
+LLM client, which should only happen on first use.
+
+Usage:
+    python benchmarks/bench_imports.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKES_DIR = os.path.join(BENCH_DIR, "fakes")
+
+MODULES = ("citation_formatter", "rag_pipeline", "batch_generate")
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+clients = [name for name in ("vector_store", "llm_client", "prompt_manager") if name in sys.modules]
+print(elapsed, len(clients))
+"""
+
+
+def import_time(module: str, repeat: int = 5) -> dict:
+    """
+    Best-of-repeat import time of one module in a new interpreter.
+
+    Output:
+        {"best_ms": 18.2, "clients_imported": 0}
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([FAKES_DIR, REPO_DIR]))
+    times = []
+    clients = 0
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module)],
+            capture_output=True, text=True, check=True, env=env, cwd=REPO_DIR
+        ).stdout.split()
+        times.append(float(output[0]))
+        clients = int(output[1])
+    return {"best_ms": round(min(times) * 1000, 3), "clients_imported": clients}
+
+
+def bench_imports(modules: tuple = MODULES, repeat: int = 5) -> dict:
+    """
+    Output:
+        {"citation_formatter": {"best_ms": 9.1, "clients_imported": 0}, "rag_pipeline": {...}, ...}
+    """
+    return {module: import_time(module, repeat) for module in modules}
+
+
+if __name__ == "__main__":
+    print(json.dumps(bench_imports(), indent=2))
@@ -0,0 +1,162 @@
+# bench_pipeline.py
+"""
+Handout pipeline benchmark (offline)
+
+Runs generate_full_handout against the stand-in vector_store, llm_client and
+prompt_manager modules in benchmarks/fakes, at several concurrency levels,
+and reports handout latency percentiles and throughput. bench_prompt_layout
+compares how much of each prompt the stand-in LLM's prefix cache could
+reuse with the standard and prefix-stable prompt layouts.
+
+Usage:
+    python benchmarks/bench_pipeline.py
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKES_DIR = os.path.join(BENCH_DIR, "fakes")
+
+
+def load_pipeline():
+    """Import rag_pipeline with the stand-in modules shadowing the real clients."""
+    for path in (REPO_DIR, FAKES_DIR):
+        if path in sys.path:
+            sys.path.remove(path)
+    sys.path[:0] = [FAKES_DIR, REPO_DIR]
+    import rag_pipeline
+    logging.getLogger("rag_pipeline").setLevel(logging.WARNING)
+    return rag_pipeline
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """Nearest-rank percentile of samples (p in 0-100)."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def bench_handouts(
+    concurrency_levels: tuple = (1, 2, 3, 6),
+    handouts: int = 5,
+    vector_latency: float = 0.05,
+    llm_latency: float = 0.2,
+    jitter_fraction: float = 0.25
+) -> dict:
+    """
+    Time full handouts at each concurrency level.
+
+    Output:
+        {
+            "concurrency_1": {"handouts_per_second": 0.7, "p50_ms": 1502.1, "p95_ms": 1560.3, "max_ms": 1571.0},
+            "concurrency_6": {"handouts_per_second": 3.6, "p50_ms": 276.4, ...}
+        }
+    """
+    rag_pipeline = load_pipeline()
+    import llm_client
+    import vector_store
+
+    results = {}
+    for level in concurrency_levels:
+        vector_store.configure(vector_latency, vector_latency * jitter_fraction, seed=0)
+        llm_client.configure(llm_latency, llm_latency * jitter_fraction, seed=0)
+        latencies = []
+        start = time.perf_counter()
+        for i in range(handouts):
+            handout_start = time.perf_counter()
+            rag_pipeline.generate_full_handout(f"benchmark procedure {i}", max_workers=level)
+            latencies.append(time.perf_counter() - handout_start)
+        elapsed = time.perf_counter() - start
+        results[f"concurrency_{level}"] = {
+            "handouts_per_second": round(handouts / elapsed, 3),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "max_ms": round(max(latencies) * 1000, 1)
+        }
+    return results
+
+
+def check_failed_sections(sections: tuple = ("pain_management", "wound_care")) -> None:
+    """
+    Raise AssertionError unless failed sections keep their titles.
+
+    Generates a handout whose every LLM call fails and checks that each
+    section is still reported under its own name, with an error.
+    """
+    rag_pipeline = load_pipeline()
+
+    def failing_generate(prompt, context, system_prompt=None):
+        raise TimeoutError("stand-in LLM failure")
+
+    previous = rag_pipeline.get_pipeline()
+    rag_pipeline.set_pipeline(rag_pipeline.RAGPipeline(generate_fn=failing_generate))
+    try:
+        handout = rag_pipeline.generate_full_handout("benchmark procedure", sections=list(sections))
+    finally:
+        rag_pipeline.set_pipeline(previous)
+    names = [entry["name"] for entry in handout["sections"]]
+    expected = [section.replace("_", " ").title() for section in sections]
+    assert names == expected, f"failed sections reported as {names}, expected {expected}"
+    assert all("error" in entry for entry in handout["sections"]), "failed sections lost their error"
+    assert handout["quality_metrics"]["failed_sections"] == list(sections)
+
+
+def _layout_corpus(procedures: list[str], sections: list[str]) -> list[dict]:
+    """General chunks per procedure, which every section retrieves, plus chunks per section."""
+    chunks = []
+    for p, procedure in enumerate(procedures):
+        for i in range(4):
+            chunks.append({
+                "id": f"pmid_{200000 + p * 100 + i}_chunk_0",
+                "text": f"Most patients recover at home after {procedure} within weeks. " * 6,
+                "metadata": {"pmid": str(200000 + p * 100 + i)}
+            })
+        for s, section in enumerate(sections):
+            for i in range(3):
+                pmid = 300000 + p * 1000 + s * 10 + i
+                chunks.append({
+                    "id": f"pmid_{pmid}_chunk_0",
+                    "text": f"For {section.replace('_', ' ')} after {procedure}, finding {i} applies. " * 6,
+                    "metadata": {"pmid": str(pmid)}
+                })
+    return chunks
+
+
+def bench_prompt_layout(procedures: tuple = ("knee replacement", "hip replacement", "appendectomy")) -> dict:
+    """
+    Generate the same handouts with each prompt layout and report prefix reuse.
+
+    Output:
+        {
+            "standard": {"cached_ratio": 0.081, "shared_prefix_tokens": 37},
+            "prefix_stable": {"cached_ratio": 0.451, "shared_prefix_tokens": 477}
+        }
+    """
+    rag_pipeline = load_pipeline()
+    import llm_client
+    from batch_retrieval import LocalVectorStore
+
+    store = LocalVectorStore()
+    store.add(_layout_corpus(list(procedures), rag_pipeline.DEFAULT_SECTIONS))
+    results = {}
+    for layout in ("standard", "prefix_stable"):
+        llm_client.configure(0.0, 0.0, seed=0)
+        prefix_tokens = []
+        for procedure in procedures:
+            handout = rag_pipeline.generate_full_handout(procedure, store=store, prompt_layout=layout)
+            prefix_tokens.append(handout["quality_metrics"]["shared_prefix_tokens"])
+        results[layout] = {
+            "cached_ratio": llm_client.prefix_stats()["cached_ratio"],
+            "shared_prefix_tokens": min(prefix_tokens)
+        }
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(bench_handouts(), indent=2))
+    print(json.dumps(bench_prompt_layout(), indent=2))
@@ -0,0 +1,136 @@
+# bench_retrieval.py
+"""
+Retrieval recall and latency benchmark (offline)
+
+Builds a synthetic corpus in which a few chunks about the query topic
+mention a specific drug or abbreviation, among many chunks on the same
+topic that do not and chunks on other topics that do, then searches for
+"<topic> <term>" with:
+
+    dense     LocalVectorIndex over the stand-in hashed embedding (top_k results)
+    lexical   BM25Index
+    hybrid    HybridStore: a smaller dense search (dense_top_k) fused with BM25
+
+and reports recall@top_k of the on-topic chunks mentioning the term, plus
+per-query latency in microseconds. Dense latency here is in-process; a
+remote vector store adds its network round trip on top. The corpus is built
+so that only the exact term separates relevant chunks from the rest of the
+topic, which is the case hybrid retrieval is for; on paraphrased queries
+the dense half carries the recall instead.
+
+Hybrid recall lands between dense and lexical here, by construction: the
+dense results are all wrong on this corpus, and RRF with equal weights lets
+them take about half of the top_k slots. Weighting the lexical ranking 1.5x
+reaches lexical recall only because no dense-only chunk can then enter the
+top 5, which would also shut dense out on paraphrased queries. The stand-in
+hashed embedding cannot model paraphrases, so the default weights are kept.
+
+Usage:
+    python benchmarks/bench_retrieval.py
+"""
+
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+COMMON_WORDS = (
+    "patients surgery postoperative pain wound healing mobility recovery physical therapy range "
+    "motion swelling dressing infection risk outcomes trial cohort randomized follow weeks days "
+    "discharge home management protocol"
+).split()
+
+TOPIC = "knee replacement care instructions"
+
+SPECIFIC_TERMS = (
+    "apixaban rivaroxaban enoxaparin warfarin aspirin celecoxib ibuprofen gabapentin pregabalin "
+    "oxycodone tramadol acetaminophen cefazolin vancomycin tranexamic dexamethasone ondansetron "
+    "dvt vte ssi pca nsaid cpm tka tha bmi"
+).split()
+
+
+def _corpus(chunks: int, mentions: int, words: int, rng: random.Random) -> tuple[list[dict], dict]:
+    """
+    Chunks plus {term: ids of the relevant chunks}.
+
+    A quarter of the chunks are about the query topic (knee replacement
+    care). For each term, `mentions` topic chunks mention it (the relevant
+    ones) and as many off-topic chunks mention it too.
+    """
+    topic_rows = set(rng.sample(range(chunks), chunks // 4))
+    corpus = []
+    for row in range(chunks):
+        text = " ".join(rng.choice(COMMON_WORDS) for _ in range(words))
+        if row in topic_rows:
+            text += f" {TOPIC}" * rng.randint(1, 2)
+        corpus.append({"id": f"pmid_{10000000 + row}_chunk_0", "text": text, "metadata": {"pmid": str(10000000 + row)}})
+
+    topic, other = sorted(topic_rows), sorted(set(range(chunks)) - topic_rows)
+    relevant = {}
+    for term in SPECIFIC_TERMS:
+        rows = rng.sample(topic, mentions)
+        for row in rows + rng.sample(other, mentions):
+            corpus[row]["text"] += f" {term}" * rng.randint(1, 2)
+        relevant[term] = {corpus[row]["id"] for row in rows}
+    return corpus, relevant
+
+
+def _run(search, queries: list[str], relevant: list[set], top_k: int) -> dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, relevant):
+        start = time.perf_counter()
+        chunks = search(query, top_k=top_k)
+        latencies.append((time.perf_counter() - start) * 1_000_000)
+        recalls.append(len(expected & {chunk["id"] for chunk in chunks}) / len(expected))
+    latencies.sort()
+    return {
+        "recall": round(statistics.mean(recalls), 3),
+        "p50_us": round(latencies[len(latencies) // 2], 1),
+        "p95_us": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1)
+    }
+
+
+def bench_retrieval(chunks: int = 5000, mentions: int = 5, words: int = 60, top_k: int = 5, dense_top_k: int = 3) -> dict:
+    """
+    Output:
+        {
+            "dense": {"recall": 0.031, "p50_us": 609.0, "p95_us": 1386.0},
+            "lexical": {"recall": 1.0, "p50_us": 334.0, "p95_us": 625.0},
+            "hybrid": {"recall": 0.415, "p50_us": 1311.0, "p95_us": 1843.0, "dense_top_k": 3}
+        }
+    """
+    if REPO_DIR not in sys.path:
+        sys.path.append(REPO_DIR)
+    from batch_retrieval import hashed_embedding
+    from lexical_index import BM25Index, HybridStore
+    from local_index import LocalVectorIndex
+
+    rng = random.Random(0)
+    corpus, relevant = _corpus(chunks, mentions, words, rng)
+    queries = [f"{TOPIC} {term}" for term in SPECIFIC_TERMS]
+    expected = [relevant[term] for term in SPECIFIC_TERMS]
+
+    def embed(texts):
+        return [hashed_embedding(text) for text in texts]
+
+    with tempfile.TemporaryDirectory() as directory:
+        dense = LocalVectorIndex.build(os.path.join(directory, "dense"), corpus, embed)
+        lexical = BM25Index.build(os.path.join(directory, "bm25"), corpus)
+        hybrid = HybridStore(dense=dense, lexical=lexical, dense_top_k=dense_top_k)
+        results = {
+            "dense": _run(dense.search, queries, expected, top_k),
+            "lexical": _run(lexical.search, queries, expected, top_k),
+            "hybrid": _run(hybrid.search, queries, expected, top_k)
+        }
+    results["hybrid"]["dense_top_k"] = dense_top_k
+    return results
+
+
+if __name__ == "__main__":
+    print(json.dumps(bench_retrieval(), indent=2))
@@ -0,0 +1,160 @@
+# http_backend.py
+"""
+Stand-in HTTP backend for client_pool.py
+
+A local HTTP/1.1 keep-alive server answering the three endpoints the pooled
+clients call, with configurable latency and an optional rate limit:
+
+    POST /v1/chat/completions   OpenAI-style chat completion
+    POST /v1/embeddings         OpenAI-style embeddings (hashed bag of words)
+    POST /query                 Pinecone-style vector query
+
+Requests over the rate limit get a 429 with a Retry-After header. The
+server counts connections and requests so a run can show how many
+connections were actually opened.
+
+Usage:
+    server = start_server(latency=0.05, rate_limit=50)
+    pipeline = client_pool.pooled_pipeline(llm_url=server.url, vector_url=server.url)
+    ...
+    server.stats()   # {"connections": 6, "requests": 42, "rate_limited": 0}
+    server.shutdown()
+
+    python benchmarks/fakes/http_backend.py --port 8765 --latency 0.05
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from batch_retrieval import hashed_embedding  # noqa: E402
+
+DIMENSIONS = 64
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count("requests")
+
+        retry_after = self.server.admit()
+        if retry_after is not None:
+            self.server.count("rate_limited")
+            self._send_json(429, {"error": "rate limited"}, {"Retry-After": f"{retry_after:.3f}"})
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.path.endswith("/v1/chat/completions"):
+            user = payload["messages"][-1]["content"]
+            prompt = user.rsplit("\n\n", 1)[-1]
+            content = f"Content for {prompt} ({len(user)} chars context)"
+            self._send_json(200, {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]})
+        elif self.path.endswith("/v1/embeddings"):
+            texts = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            data = [
+                {"index": i, "embedding": hashed_embedding(text, DIMENSIONS)}
+                for i, text in enumerate(texts)
+            ]
+            self._send_json(200, {"data": data})
+        elif self.path.endswith("/query"):
+            vector = payload["vector"]
+            seed = sum(i for i, value in enumerate(vector) if value > 0)
+            matches = [
+                {
+                    "id": f"pmid_{seed + i}_chunk_0",
+                    "score": round(0.9 - i * 0.05, 3),
+                    "metadata": {"pmid": str(seed + i), "text": f"Stand-in literature chunk {seed + i}. " * 5}
+                }
+                for i in range(payload.get("topK", 5))
+            ]
+            self._send_json(200, {"matches": matches})
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, latency: float = 0.0, rate_limit: Optional[float] = None):
+        super().__init__(address, StandInHandler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self._counters = {"connections": 0, "requests": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def admit(self) -> Optional[float]:
+        """None if the request is within the rate limit, else seconds until the next window."""
+        if not self.rate_limit:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            if self._window_count >= self.rate_limit:
+                return 1.0 - (now - self._window_start)
+            self._window_count += 1
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+def start_server(latency: float = 0.0, rate_limit: Optional[float] = None, port: int = 0) -> StandInServer:
+    """Start a stand-in server on a background thread; port 0 picks a free port."""
+    server = StandInServer(("127.0.0.1", port), latency=latency, rate_limit=rate_limit)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in LLM and vector store HTTP backend")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--rate-limit", type=float, default=None, help="Requests per second before 429s")
+    args = parser.parse_args()
+
+    server = StandInServer(("127.0.0.1", args.port), latency=args.latency, rate_limit=args.rate_limit)
+    print(f"Serving on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,104 @@
+# llm_client.py (benchmark stand-in)
+"""
+Offline stand-in for llm_client.py used by the benchmarks.
+
+Produces deterministic text after a simulated generation delay. Latency and
+jitter are set with configure() (or the BENCH_LLM_LATENCY / BENCH_LLM_JITTER
+environment variables, in seconds).
+
+Also models a provider prompt cache: each prompt (system prompt, then
+"Context:", the context and the instruction, as client_pool.OpenAIClient
+sends them) is matched against every earlier prompt in blocks of
+PREFIX_BLOCK_CHARS, and prefix_stats() reports how many prompt characters
+were served from a previously seen prefix. The provider's minimum cacheable
+prefix (1024 tokens for OpenAI) is not modelled.
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Iterator, Optional
+
+LATENCY_SECONDS = float(os.environ.get("BENCH_LLM_LATENCY", "0.2"))
+JITTER_SECONDS = float(os.environ.get("BENCH_LLM_JITTER", "0.05"))
+STREAM_CHUNKS = 8
+PREFIX_BLOCK_CHARS = 512  # ~128 tokens, the provider's cache granularity
+
+_random = random.Random(0)
+_lock = threading.Lock()
+calls = 0
+_prefixes = set()
+_prefix_counts = {"prompt_chars": 0, "cached_chars": 0}
+
+
+def configure(latency: float = None, jitter: float = None, seed: int = None) -> None:
+    """Change simulated latency/jitter and reset the call counter, prefix cache and random seed."""
+    global LATENCY_SECONDS, JITTER_SECONDS, calls
+    if latency is not None:
+        LATENCY_SECONDS = latency
+    if jitter is not None:
+        JITTER_SECONDS = jitter
+    if seed is not None:
+        _random.seed(seed)
+    calls = 0
+    with _lock:
+        _prefixes.clear()
+        _prefix_counts.update(prompt_chars=0, cached_chars=0)
+
+
+def _count_prefix(prompt: str, context: str, system_prompt: Optional[str]) -> None:
+    """Record how much of this prompt an earlier prompt already started with."""
+    text = f"{system_prompt or ''}\nContext:\n{context}\n\n{prompt}".encode("utf-8")
+    digest = hashlib.sha1()
+    cached = 0
+    with _lock:
+        for end in range(PREFIX_BLOCK_CHARS, len(text) + 1, PREFIX_BLOCK_CHARS):
+            digest.update(text[end - PREFIX_BLOCK_CHARS:end])
+            key = digest.digest()
+            if key in _prefixes:
+                cached = end
+            else:
+                _prefixes.add(key)
+        _prefix_counts["prompt_chars"] += len(text)
+        _prefix_counts["cached_chars"] += cached
+
+
+def prefix_stats() -> dict:
+    """
+    Output:
+        {"prompt_chars": 48210, "cached_chars": 30720, "cached_ratio": 0.637}
+    """
+    with _lock:
+        stats = dict(_prefix_counts)
+    stats["cached_ratio"] = round(stats["cached_chars"] / stats["prompt_chars"], 3) if stats["prompt_chars"] else 0.0
+    return stats
+
+
+def _next_delay() -> float:
+    global calls
+    with _lock:
+        calls += 1
+        return max(0.0, LATENCY_SECONDS + _random.uniform(-JITTER_SECONDS, JITTER_SECONDS))
+
+
+def _content(prompt: str, context: str) -> str:
+    digest = hashlib.sha1(f"{prompt}|{context}".encode("utf-8")).hexdigest()
+    return f"## {prompt}\n\n" + " ".join(f"Instruction {digest[i:i + 6]}." for i in range(0, 36, 6))
+
+
+def generate_with_context(prompt: str, context: str, system_prompt: Optional[str] = None) -> str:
+    _count_prefix(prompt, context, system_prompt)
+    time.sleep(_next_delay())
+    return _content(prompt, context)
+
+
+def stream_with_context(prompt: str, context: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+    _count_prefix(prompt, context, system_prompt)
+    delay = _next_delay()
+    content = _content(prompt, context)
+    step = max(1, len(content) // STREAM_CHUNKS)
+    for start in range(0, len(content), step):
+        time.sleep(delay / STREAM_CHUNKS)
+        yield content[start:start + step]
@@ -0,0 +1,7 @@
+# prompt_manager.py (benchmark stand-in)
+"""Offline stand-in for prompt_manager.py used by the benchmarks."""
+
+
+class PromptManager:
+    def get_prompt(self, name: str, **variables) -> str:
+        return f"Write the {name.replace('_', ' ')} section for {variables.get('procedure_name', '')}.\n\n{variables.get('context', '')}"
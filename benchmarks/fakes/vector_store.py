@@ -0,0 +1,67 @@
+# vector_store.py (benchmark stand-in)
+"""
+Offline stand-in for vector_store.py used by the benchmarks.
+
+Returns deterministic chunks for any query after a simulated network delay.
+Latency and jitter are set with configure() (or the BENCH_VECTOR_LATENCY /
+BENCH_VECTOR_JITTER environment variables, in seconds).
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+
+LATENCY_SECONDS = float(os.environ.get("BENCH_VECTOR_LATENCY", "0.05"))
+JITTER_SECONDS = float(os.environ.get("BENCH_VECTOR_JITTER", "0.01"))
+CORPUS_SIZE = 500
+
+_random = random.Random(0)
+_lock = threading.Lock()
+calls = 0
+
+
+def configure(latency: float = None, jitter: float = None, seed: int = None) -> None:
+    """Change simulated latency/jitter and reset the call counter and random seed."""
+    global LATENCY_SECONDS, JITTER_SECONDS, calls
+    if latency is not None:
+        LATENCY_SECONDS = latency
+    if jitter is not None:
+        JITTER_SECONDS = jitter
+    if seed is not None:
+        _random.seed(seed)
+    calls = 0
+
+
+def _delay() -> None:
+    global calls
+    with _lock:
+        calls += 1
+        delay = LATENCY_SECONDS + _random.uniform(-JITTER_SECONDS, JITTER_SECONDS)
+    if delay > 0:
+        time.sleep(delay)
+
+
+def _chunks(query: str, top_k: int) -> list[dict]:
+    chunks = []
+    for rank in range(top_k):
+        digest = hashlib.sha1(f"{query}|{rank}".encode("utf-8")).hexdigest()
+        pmid = str(10000000 + int(digest[:8], 16) % CORPUS_SIZE)
+        chunks.append({
+            "id": f"pmid_{pmid}_chunk_{rank % 3}",
+            "text": f"Finding {digest[:12]} about {query}. " * 8,
+            "score": round(0.95 - rank * 0.03, 4),
+            "metadata": {"pmid": pmid, "section": "results"}
+        })
+    return chunks
+
+
+def search(query: str, top_k: int = 5) -> list[dict]:
+    _delay()
+    return _chunks(query, top_k)
+
+
+def search_batch(queries: list[str], top_k: int = 5) -> list[list[dict]]:
+    _delay()
+    return [_chunks(query, top_k) for query in queries]
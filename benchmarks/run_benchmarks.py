@@ -0,0 +1,149 @@
+# run_benchmarks.py
+"""
+Benchmark runner for PostopCare
+
+Checks that failed handout sections keep their titles, then runs the
+offline pipeline, prompt layout, citation, client pool, import time and
+retrieval benchmarks, writes the results as JSON and compares them
+against a stored baseline. Exits with status 1 when any metric is worse than
+the baseline by more than the tolerance, so it can gate CI.
+
+Metric direction is read from the name: *_per_second and *recall are better
+when higher, *_ms is better when lower. Other metrics (e.g. the microsecond
+retrieval timings, too noisy to gate on) are reported but not compared.
+
+Usage:
+    python benchmarks/run_benchmarks.py                      # full run, compare to baseline.json
+    python benchmarks/run_benchmarks.py --quick              # smaller inputs for a fast check
+    python benchmarks/run_benchmarks.py --update-baseline    # accept the current numbers
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+
+from bench_citations import bench_citations
+from bench_clients import bench_clients
+from bench_imports import bench_imports
+from bench_pipeline import bench_handouts, bench_prompt_layout, check_failed_sections
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "latest_results.json")
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """
+    Flatten nested results into dotted metric names.
+
+    Input:
+        {"pipeline": {"concurrency_1": {"p50_ms": 1502.1}}}
+    Output:
+        {"pipeline.concurrency_1.p50_ms": 1502.1}
+    """
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return a description of every metric that regressed beyond tolerance."""
+    current = flatten(results["benchmarks"])
+    previous = flatten(baseline["benchmarks"])
+    regressions = []
+    for name, old in sorted(previous.items()):
+        new = current.get(name)
+        if new is None or not old:
+            continue
+        if name.endswith("_per_second") or name.endswith("recall"):
+            change = (old - new) / old
+        elif name.endswith("_ms"):
+            change = (new - old) / old
+        else:
+            continue
+        if change > tolerance:
+            regressions.append(f"{name}: {old} -> {new} ({change:+.0%} worse)")
+    return regressions
+
+
+def retrieval_benchmark(quick: bool = False) -> dict:
+    """bench_retrieval results, or {} when numpy is not installed."""
+    if importlib.util.find_spec("numpy") is None:
+        print("numpy is not installed; skipping the retrieval benchmark")
+        return {}
+    # Imported here so the other benchmarks run without numpy
+    from bench_retrieval import bench_retrieval
+    return bench_retrieval(chunks=2000) if quick else bench_retrieval()
+
+
+def run(quick: bool = False) -> dict:
+    # Correctness checks first: numbers from a broken pipeline mean nothing
+    check_failed_sections()
+    if quick:
+        pipeline = bench_handouts(concurrency_levels=(1, 6), handouts=2)
+        prompt_layout = bench_prompt_layout(procedures=("knee replacement",))
+        citations = bench_citations(articles=2000, anchors=100, repeat=3)
+        clients = bench_clients(requests=100)
+        imports = bench_imports(repeat=2)
+    else:
+        pipeline = bench_handouts()
+        prompt_layout = bench_prompt_layout()
+        citations = bench_citations()
+        clients = bench_clients()
+        imports = bench_imports()
+    retrieval = retrieval_benchmark(quick)
+    return {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "quick": quick,
+        "benchmarks": {"pipeline": pipeline, "prompt_layout": prompt_layout, "citations": citations,
+                       "clients": clients, "imports": imports, "retrieval": retrieval}
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run PostopCare benchmarks offline")
+    parser.add_argument("--quick", action="store_true", help="Smaller inputs for a fast check")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write the results JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed fractional slowdown per metric")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    args = parser.parse_args()
+
+    results = run(quick=args.quick)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["benchmarks"], indent=2))
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        sys.exit(0)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("quick") != results["quick"]:
+        print("Baseline was recorded with a different --quick setting; comparison skipped")
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions against baseline")
@@ -0,0 +1,296 @@
+# cache.py
+"""
+Caches for PostopCare
+
+Section queries are deterministic, so the same retrieval runs again every
+time a handout is regenerated. This module keeps those results around:
+
+    - TieredCache: bounded in-memory LRU with optional TTL, backed by an
+      optional sqlite file so entries survive process restarts. The file is
+      bounded too: expired rows are purged and the oldest rows dropped
+      beyond max_disk_entries, on open and every DISK_PURGE_INTERVAL writes
+    - RetrievalCache: TieredCache in front of vector_search, keyed on the
+      normalized query, top_k and an index version tag
+    - GenerationCache: TieredCache in front of generate_with_context, keyed
+      on a hash of prompt, context, system prompt and model
+
+Setup:
+    No additional pip installs required (sqlite3 ships with Python)
+
+Usage:
+    cache = RetrievalCache(index_version="2025-01-15", max_entries=2048,
+                           ttl_seconds=7 * 24 * 3600, path="retrieval_cache.sqlite")
+    chunks = cache.search(search_query, top_k=5, search_fn=vector_search)
+    cache.stats()
+    # {"hits": 5, "misses": 1, "disk_hits": 0, "evictions": 0, "disk_evictions": 0,
+    #  "expirations": 0, "entries": 6, "disk_entries": 6, "hit_rate": 0.833}
+
+    gen_cache = GenerationCache(max_entries=4096, path="generation_cache.sqlite")
+    content, cached = gen_cache.generate(prompt, context, system_prompt, "gpt-4o-mini",
+                                         generate_fn=generate_with_context)
+
+Bump index_version whenever the Pinecone index is rebuilt so stale results
+are never served.
+"""
+
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# sqlite writes between two purges of the disk tier; the table can exceed
+# max_disk_entries by at most this many rows in between
+DISK_PURGE_INTERVAL = 128
+
+# Sentinel for "not in cache" so cached falsy values (e.g. []) still count as hits
+MISSING = object()
+
+
+class TieredCache:
+    """
+    Bounded LRU cache with optional TTL and an optional sqlite tier.
+
+    Lookups check memory first, then the sqlite file (if a path was given).
+    Disk hits are promoted back into memory. Values must be JSON-serializable
+    when a path is used. get() returns a copy, so callers can modify what
+    they get back without corrupting the cache.
+
+    The sqlite tier holds at most max_disk_entries rows (default: 10x
+    max_entries). Expired rows and the rows written longest ago beyond
+    that limit are deleted when the cache opens and every
+    DISK_PURGE_INTERVAL writes, so a long-running service's file stops
+    growing.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: Optional[float] = None,
+        path: Optional[str] = None,
+        table: str = "cache",
+        max_disk_entries: Optional[int] = None
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        if max_disk_entries is not None and max_disk_entries < 1:
+            raise ValueError("max_disk_entries must be at least 1")
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table!r}")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.table = table
+        self.max_disk_entries = max_disk_entries if max_disk_entries is not None else 10 * max_entries
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "disk_evictions": 0, "expirations": 0
+        }
+        self._db = None
+        self._disk_writes = 0
+        if path is not None:
+            import sqlite3  # only needed for the disk tier
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_stored_at ON {table} (stored_at)")
+            with self._lock:
+                self._purge_disk(time.time())
+            self._db.commit()
+
+    def _is_expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, key: str, default=MISSING):
+        """Return the cached value for key, or default on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._is_expired(stored_at, now):
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._is_expired(row[1], now):
+                        value = json.loads(row[0])
+                        self._store_in_memory(key, row[1], value)
+                        self._counters["hits"] += 1
+                        self._counters["disk_hits"] += 1
+                        return copy.deepcopy(value)
+                    self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._counters["expirations"] += 1
+
+            self._counters["misses"] += 1
+            return default
+
+    def set(self, key: str, value) -> None:
+        """Store value under key in memory and, if configured, on disk."""
+        now = time.time()
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._store_in_memory(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), now)
+                )
+                self._disk_writes += 1
+                if self._disk_writes % DISK_PURGE_INTERVAL == 0:
+                    self._purge_disk(now)
+                self._db.commit()
+
+    def _purge_disk(self, now: float) -> None:
+        """Delete expired rows, then the oldest rows beyond max_disk_entries. Caller holds the lock and commits."""
+        if self.ttl_seconds is not None:
+            expired = self._db.execute(
+                f"DELETE FROM {self.table} WHERE stored_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            self._counters["expirations"] += expired
+        excess = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY stored_at LIMIT ?)",
+                (excess,)
+            )
+            self._counters["disk_evictions"] += excess
+
+    def _store_in_memory(self, key: str, stored_at: float, value) -> None:
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        """Drop every entry from memory and disk. Counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table}")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """Hit, miss and eviction counters plus the current in-memory (and sqlite) size."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            if self._db is not None:
+                stats["disk_entries"] = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        """Close the sqlite connection, if any."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so trivially different strings share a cache key.
+
+    Input:
+        query = "  Knee Replacement   pain management "
+    Output:
+        "knee replacement pain management"
+    """
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+class RetrievalCache(TieredCache):
+    """
+    Cache of vector store results keyed on (index_version, top_k, query).
+
+    Usage:
+        cache = RetrievalCache(index_version="2025-01-15")
+        chunks = cache.search("knee replacement pain management ...", top_k=5, search_fn=vector_search)
+    """
+
+    def __init__(self, index_version: str = "v1", **kwargs):
+        kwargs.setdefault("table", "retrieval_cache")
+        super().__init__(**kwargs)
+        self.index_version = index_version
+
+    def make_key(self, query: str, top_k: int) -> str:
+        return f"{self.index_version}|{top_k}|{normalize_query(query)}"
+
+    def search(self, query: str, top_k: int, search_fn: Callable[..., list[dict]]) -> list[dict]:
+        """Return cached chunks for the query, calling search_fn(query, top_k=top_k) on a miss."""
+        key = self.make_key(query, top_k)
+        chunks = self.get(key)
+        if chunks is MISSING:
+            chunks = search_fn(query, top_k=top_k)
+            self.set(key, chunks)
+        return chunks
+
+
+def generation_key(prompt: str, context: str, system_prompt: Optional[str], model: str) -> str:
+    """
+    Content address for one LLM call: a SHA-256 of every input that shapes the output.
+
+    Input:
+        prompt = "Write pain management instructions for knee replacement"
+        context = "[Source 1: PMID 12345]\nStudies show..."
+        system_prompt = "You are a medical writer..."
+        model = "gpt-4o-mini"
+    Output:
+        "3f7a9c..."  # 64 hex characters
+    """
+    payload = json.dumps([prompt, context, system_prompt, model], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache(TieredCache):
+    """
+    Cache of LLM outputs keyed on a hash of prompt, context, system prompt and model.
+
+    Usage:
+        cache = GenerationCache(max_entries=4096, path="generation_cache.sqlite")
+        content, cached = cache.generate(
+            prompt, context, system_prompt, model="gpt-4o-mini", generate_fn=generate_with_context
+        )
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("table", "generation_cache")
+        super().__init__(**kwargs)
+
+    def generate(
+        self,
+        prompt: str,
+        context: str,
+        system_prompt: Optional[str],
+        model: str,
+        generate_fn: Callable[..., str]
+    ) -> tuple[str, bool]:
+        """Return (content, was_cached), calling generate_fn on a miss."""
+        key = generation_key(prompt, context, system_prompt, model)
+        content = self.get(key)
+        if content is not MISSING:
+            return content, True
+        content = generate_fn(prompt=prompt, context=context, system_prompt=system_prompt)
+        self.set(key, content)
+        return content, False
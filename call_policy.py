@@ -0,0 +1,243 @@
+# call_policy.py
+"""
+Deadline-Aware LLM Calls for PostopCare
+
+Step 5 of generate_handout_section used to make one blocking
+generate_with_context call with no timeout, so a single slow response set
+the latency of the whole handout. call_with_policy() wraps that call with:
+
+    - A per-call timeout and an overall Deadline (e.g. for a whole handout)
+    - Retries with full-jitter exponential backoff, never sleeping past the deadline
+    - Optional hedging: if the first request has not answered within the
+      observed p95 LLM latency, a second identical request is sent and
+      whichever finishes first wins
+
+Latencies of successful requests are recorded in the "llm_request"
+histogram of metrics.REGISTRY, which is also where the hedge delay (p95)
+comes from, so hedging adapts to the provider's current latency.
+
+Calls run on a shared worker pool. A request that times out or loses a
+hedge cannot be cancelled mid-flight; it finishes in the background and its
+result is discarded, so pair this with the client's own socket timeout.
+
+Setup:
+    No additional pip installs required
+
+Usage:
+    policy = CallPolicy(timeout_seconds=20, max_attempts=3, hedge=True)
+    content, stats = call_with_policy(
+        generate_with_context, policy, deadline=Deadline(60),
+        prompt=instruction, context=context, system_prompt=SYSTEM_PROMPT
+    )
+    # stats = {"attempts": 1, "retries": 0, "hedges": 1, "hedge_wins": 1, "timeouts": 0}
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from metrics import REGISTRY, MetricsRegistry
+
+# Histogram of individual LLM request latencies (successful requests only)
+REQUEST_HISTOGRAM = "llm_request"
+
+# Worker pool shared by every policy-wrapped call
+MAX_CALL_WORKERS = 64
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_CALL_WORKERS, thread_name_prefix="llm-call")
+    return _executor
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call (or the handout it belongs to) ran out of time."""
+
+
+class Deadline:
+    """
+    A point in time work must finish by.
+
+    Usage:
+        deadline = Deadline(60)       # 60 seconds from now
+        deadline.remaining()          # seconds left, never negative
+        deadline.expired()
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self, what: str = "Deadline") -> None:
+        """Raise DeadlineExceeded if the deadline has passed."""
+        if self.expired():
+            raise DeadlineExceeded(f"{what} exceeded its {self.seconds:g}s deadline")
+
+
+class CallPolicy:
+    """
+    Timeout, retry and hedging settings for one kind of call.
+
+    timeout_seconds     limit for one attempt (None: only the deadline applies)
+    max_attempts        total attempts, including the first
+    backoff_seconds     base of the exponential backoff between attempts
+    max_backoff_seconds cap on one backoff sleep
+    hedge               send a second request when the first is slower than hedge_after_seconds
+    hedge_after_seconds fixed hedge delay; None uses the p95 of the llm_request histogram
+    hedge_min_samples   observations needed before the p95 is trusted (no hedging until then)
+    """
+
+    def __init__(
+        self,
+        timeout_seconds: Optional[float] = None,
+        max_attempts: int = 1,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 8.0,
+        hedge: bool = False,
+        hedge_after_seconds: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        registry: Optional[MetricsRegistry] = None
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.hedge = hedge
+        self.hedge_after_seconds = hedge_after_seconds
+        self.hedge_min_samples = hedge_min_samples
+        self.registry = REGISTRY if registry is None else registry
+        self._random = random.Random()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None to not hedge this call."""
+        if not self.hedge:
+            return None
+        if self.hedge_after_seconds is not None:
+            return self.hedge_after_seconds
+        histogram = self.registry.histogram(REQUEST_HISTOGRAM)
+        if histogram.count < self.hedge_min_samples:
+            return None
+        return histogram.percentile(95)
+
+    def backoff(self, retry: int) -> float:
+        """Full-jitter backoff before the given retry (1 for the first retry)."""
+        ceiling = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (retry - 1))
+        return self._random.uniform(0, ceiling)
+
+
+def call_with_policy(
+    fn: Callable,
+    policy: CallPolicy,
+    deadline: Optional[Deadline] = None,
+    **kwargs
+) -> tuple[object, dict]:
+    """
+    Call fn(**kwargs) under the policy and return (result, stats).
+
+    Raises DeadlineExceeded when the deadline passes or the last attempt
+    times out, and the last error when every attempt failed. The raised
+    error carries the stats of the failed call as error.call_stats.
+
+    Output:
+        ("## Pain Management...", {"attempts": 2, "retries": 1, "hedges": 1, "hedge_wins": 0, "timeouts": 1})
+    """
+    stats = {"attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0}
+    try:
+        return _call_attempts(fn, policy, deadline, stats, kwargs)
+    except Exception as e:
+        # Retries, hedges and timeouts of a failed call are what callers most need to see
+        e.call_stats = stats
+        raise
+
+
+def _call_attempts(
+    fn: Callable,
+    policy: CallPolicy,
+    deadline: Optional[Deadline],
+    stats: dict,
+    kwargs: dict
+) -> tuple[object, dict]:
+    """The attempt loop of call_with_policy, counting into stats."""
+    executor = _get_executor()
+    last_error = None
+
+    def timed_call():
+        start = time.perf_counter()
+        result = fn(**kwargs)
+        policy.registry.observe(REQUEST_HISTOGRAM, time.perf_counter() - start)
+        return result
+
+    for attempt in range(1, policy.max_attempts + 1):
+        if attempt > 1:
+            stats["retries"] += 1
+            pause = policy.backoff(attempt - 1)
+            if deadline is not None:
+                pause = min(pause, deadline.remaining())
+            time.sleep(pause)
+        if deadline is not None:
+            deadline.check("LLM call")
+
+        stats["attempts"] += 1
+        attempt_start = time.monotonic()
+        limit = policy.timeout_seconds
+        if deadline is not None:
+            limit = deadline.remaining() if limit is None else min(limit, deadline.remaining())
+        ends_at = attempt_start + limit if limit is not None else None
+
+        def time_left():
+            return None if ends_at is None else max(0.0, ends_at - time.monotonic())
+
+        pending = {executor.submit(timed_call)}
+        primary = next(iter(pending))
+        hedge_delay = policy.hedge_delay()
+        if hedge_delay is not None:
+            left = time_left()
+            done, pending = wait(pending, timeout=hedge_delay if left is None else min(hedge_delay, left))
+            if not done and (left is None or left > hedge_delay):
+                stats["hedges"] += 1
+                pending.add(executor.submit(timed_call))
+            pending |= done
+
+        result = _first_success(pending, time_left)
+        if result is not None:
+            future, value = result
+            if future is not primary:
+                stats["hedge_wins"] += 1
+            return value, stats
+
+        errors = [f.exception() for f in pending if f.done() and f.exception() is not None]
+        if len(errors) < len(pending):
+            stats["timeouts"] += 1
+            last_error = DeadlineExceeded(f"LLM call timed out after {time.monotonic() - attempt_start:.1f}s")
+        else:
+            last_error = errors[-1]
+
+    raise last_error
+
+
+def _first_success(futures: set, time_left: Callable[[], Optional[float]]):
+    """(future, result) of the first future to succeed, or None if all failed or time ran out."""
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=time_left(), return_when=FIRST_COMPLETED)
+        if not done:
+            return None
+        for future in done:
+            if future.exception() is None:
+                return future, future.result()
+    return None
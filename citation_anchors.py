@@ -0,0 +1,174 @@
+# citation_anchors.py
+"""
+Citation Anchor Matching for PostopCare
+
+add_citations_to_text() used to call text.find() once per citation to sort
+them and again to insert, rebuilding the whole string after every insertion.
+With hundreds of anchors in a long handout that is quadratic. This module
+does it in one pass instead:
+
+    1. Compile every "after_phrase" into one Aho-Corasick automaton
+    2. Scan the text once to find every anchor occurrence
+    3. Build the output with a single "".join()
+
+A compiled CitationPhraseSet only depends on the citations, so it can be
+reused for any number of documents.
+
+Matching rules:
+    - Phrases only match on word boundaries ("ice" does not match "notice")
+    - mode="first" cites the first occurrence of each phrase,
+      mode="all" cites every occurrence
+    - Citations landing at the same point are merged into one marker
+    - Markers go after a period or comma directly following the phrase (AMA)
+
+Setup:
+    No additional pip installs required
+"""
+
+from collections import deque
+from typing import Iterator
+
+from citation_formatter import create_inline_citation
+
+MODES = ("first", "all")
+
+# AMA places superscript citations outside periods and commas
+TRAILING_PUNCTUATION = ".,"
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class PhraseAutomaton:
+    """
+    Aho-Corasick automaton over a fixed set of phrases.
+
+    Usage:
+        automaton = PhraseAutomaton(["ice", "ice therapy", "swelling"])
+        list(automaton.find_all("Ice therapy helps swelling; ice again."))
+        # [(18, 26, 2), (28, 31, 0)]  -> (start, end, phrase_index)
+    """
+
+    def __init__(self, phrases: list[str], word_boundaries: bool = True):
+        self.phrases = list(phrases)
+        self.word_boundaries = word_boundaries
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for index, phrase in enumerate(self.phrases):
+            if not phrase:
+                raise ValueError("Citation phrases must not be empty")
+            self._add(phrase, index)
+        self._build_failure_links()
+
+    def _add(self, phrase: str, index: int) -> None:
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(index)
+
+    def _build_failure_links(self) -> None:
+        """Breadth-first pass linking each state to its longest proper suffix state."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> Iterator[tuple[int, int, int]]:
+        """Yield (start, end, phrase_index) for every match, in order of end position."""
+        goto, fail, output, phrases = self._goto, self._fail, self._output, self.phrases
+        check_boundaries = self.word_boundaries
+        length = len(text)
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+            end = position + 1
+            for index in output[state]:
+                start = end - len(phrases[index])
+                if check_boundaries:
+                    phrase = phrases[index]
+                    if _is_word_char(phrase[0]) and start > 0 and _is_word_char(text[start - 1]):
+                        continue
+                    if _is_word_char(phrase[-1]) and end < length and _is_word_char(text[end]):
+                        continue
+                yield start, end, index
+
+
+class CitationPhraseSet:
+    """
+    Compiled set of citation anchors, reusable across documents.
+
+    Usage:
+        citations = CitationPhraseSet([
+            {"after_phrase": "acetaminophen", "reference_numbers": [1]},
+            {"after_phrase": "swelling", "reference_numbers": [2, 3]}
+        ])
+        citations.apply(handout_text)
+        citations.apply(other_text, mode="all")
+    """
+
+    def __init__(self, citation_positions: list[dict], word_boundaries: bool = True):
+        # One automaton entry per distinct phrase; repeated phrases share their reference numbers
+        references_by_phrase = {}
+        for citation in citation_positions:
+            numbers = references_by_phrase.setdefault(citation["after_phrase"], [])
+            numbers.extend(citation["reference_numbers"])
+        self.phrases = list(references_by_phrase)
+        self.reference_numbers = [references_by_phrase[phrase] for phrase in self.phrases]
+        self.automaton = PhraseAutomaton(self.phrases, word_boundaries=word_boundaries)
+
+    def apply(self, text: str, mode: str = "first") -> str:
+        """
+        Return text with a superscript marker after each cited phrase.
+
+        Input:
+            text = "Pain management typically includes acetaminophen. Ice therapy is recommended for swelling."
+        Output:
+            "Pain management typically includes acetaminophen.¹ Ice therapy is recommended for swelling.²˒³"
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown citation mode: {mode!r} (expected one of {MODES})")
+
+        insertions = {}  # insert position -> reference numbers
+        cited = set()
+        remaining = len(self.phrases)
+        length = len(text)
+        for start, end, index in self.automaton.find_all(text):
+            if mode == "first":
+                if index in cited:
+                    continue
+                cited.add(index)
+                remaining -= 1
+            position = end
+            while position < length and text[position] in TRAILING_PUNCTUATION:
+                position += 1
+            insertions.setdefault(position, []).extend(self.reference_numbers[index])
+            if mode == "first" and not remaining:
+                break
+
+        parts = []
+        previous = 0
+        for position in sorted(insertions):
+            parts.append(text[previous:position])
+            parts.append(create_inline_citation(insertions[position]))
+            previous = position
+        parts.append(text[previous:])
+        return "".join(parts)
@@ -14,7 +14,10 @@ Examples:
     - 6+ authors: Smith J, Johnson M, Williams K, et al. Title. JAMA. 2023;330:45-52.
 """
 
-from typing import Optional
+# json, hashlib and journal_index are imported on first use, so callers that
+# only format citations do not pay for them at import time
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional, TextIO
 
 
 def format_citation(article: dict) -> str:
@@ -60,52 +63,44 @@ def format_citation(article: dict) -> str:
     Output:
         "Smith J. Brief report. Surgery Today. 2023."
     """
-    # TODO: Implement
-    # 1. Format authors using format_authors()
-    # 2. Get title (ensure it ends with period)
-    # 3. Abbreviate journal name
-    # 4. Build the citation string
-    # 5. Handle missing fields gracefully
-    #
-    # parts = []
-    # 
-    # # Authors
-    # authors_str = format_authors(article.get("authors", []))
-    # if authors_str:
-    #     parts.append(authors_str)
-    #
-    # # Title
-    # title = article.get("title", "")
-    # if title:
-    #     if not title.endswith("."):
-    #         title += "."
-    #     parts.append(title)
-    #
-    # # Journal
-    # journal = article.get("journal", "")
-    # if journal:
-    #     journal_abbr = abbreviate_journal(journal)
-    #     parts.append(journal_abbr + ".")
-    #
-    # # Year, volume, issue, pages
-    # year = article.get("year", "")
-    # volume = article.get("volume", "")
-    # issue = article.get("issue", "")
-    # pages = article.get("pages", "")
-    #
-    # if year:
-    #     year_part = str(year)
-    #     if volume:
-    #         year_part += f";{volume}"
-    #         if issue:
-    #             year_part += f"({issue})"
-    #         if pages:
-    #             year_part += f":{pages}"
-    #     year_part += "."
-    #     parts.append(year_part)
-    #
-    # return " ".join(parts)
-    pass
+    parts = []
+    
+    # Authors
+    authors_str = format_authors(article.get("authors", []))
+    if authors_str:
+        parts.append(authors_str)
+    
+    # Title
+    title = article.get("title", "")
+    if title:
+        if not title.endswith("."):
+            title += "."
+        parts.append(title)
+    
+    # Journal
+    journal = article.get("journal", "")
+    if journal:
+        journal_abbr = abbreviate_journal(journal)
+        parts.append(journal_abbr + ".")
+    
+    # Year, volume, issue, pages
+    year = article.get("year", "")
+    volume = article.get("volume", "")
+    issue = article.get("issue", "")
+    pages = article.get("pages", "")
+    
+    if year:
+        year_part = str(year)
+        if volume:
+            year_part += f";{volume}"
+            if issue:
+                year_part += f"({issue})"
+            if pages:
+                year_part += f":{pages}"
+        year_part += "."
+        parts.append(year_part)
+    
+    return " ".join(parts)
 
 
 def format_authors(authors: list[str]) -> str:
@@ -134,16 +129,14 @@ def format_authors(authors: list[str]) -> str:
     Output:
         "Smith J."
     """
-    # TODO: Implement
-    # if not authors:
-    #     return ""
-    #
-    # if len(authors) > 6:
-    #     # More than 6 authors: list first 3, then et al.
-    #     return ", ".join(authors[:3]) + ", et al."
-    # else:
-    #     return ", ".join(authors) + "."
-    pass
+    if not authors:
+        return ""
+    
+    if len(authors) > 6:
+        # More than 6 authors: list first 3, then et al.
+        return ", ".join(authors[:3]) + ", et al."
+    else:
+        return ", ".join(authors) + "."
 
 
 # Common journal abbreviations (expand as needed)
@@ -175,10 +168,40 @@ JOURNAL_ABBREVIATIONS = {
     "Journal of Neurosurgery": "J Neurosurg"
 }
 
+# Full NLM catalog plus the entries above, created by the first lookup that
+# misses JOURNAL_ABBREVIATIONS (see journal_index.py)
+_journal_index = None
+
+
+def get_journal_index():
+    """
+    The shared JournalIndex, created on first use.
+    
+    No lock (threading is slow to import): two threads racing here build
+    two empty indexes and one is dropped, and JournalIndex loads its catalog
+    under its own lock.
+    """
+    global _journal_index
+    if _journal_index is None:
+        from journal_index import JournalIndex
+        _journal_index = JournalIndex(extra=JOURNAL_ABBREVIATIONS)
+    return _journal_index
+
+
+def __getattr__(name: str):
+    # JOURNAL_INDEX used to be a module global; keep it readable without importing eagerly
+    if name == "JOURNAL_INDEX":
+        return get_journal_index()
+    raise AttributeError(f"module 'citation_formatter' has no attribute '{name}'")
+
 
 def abbreviate_journal(journal_name: str) -> str:
     """
-    Abbreviate common journal names.
+    Abbreviate journal names.
+    
+    Exact matches in JOURNAL_ABBREVIATIONS are returned directly; anything
+    else goes through JOURNAL_INDEX, which folds case, punctuation, "&" and a
+    leading "The" and covers the full NLM catalog when it is installed.
     
     Input:
         journal_name = "Journal of Bone and Joint Surgery"
@@ -190,20 +213,30 @@ def abbreviate_journal(journal_name: str) -> str:
     Output:
         "N Engl J Med"
     
+    Input (other spellings - matched through the normalized NLM index):
+        journal_name = "the journal of arthroplasty."
+    Output:
+        "J Arthroplasty"
+    
     Input (unknown journal - return as-is):
         journal_name = "Some Obscure Journal"
     Output:
         "Some Obscure Journal"
     """
-    # TODO: Implement
-    # return JOURNAL_ABBREVIATIONS.get(journal_name, journal_name)
-    pass
+    abbreviation = JOURNAL_ABBREVIATIONS.get(journal_name)
+    if abbreviation is None:
+        abbreviation = get_journal_index().lookup(journal_name)
+    return abbreviation if abbreviation is not None else journal_name
 
 
-def format_reference_list(articles: list[dict]) -> str:
+def format_reference_list(articles: list[dict], cache: Optional["CitationCache"] = None) -> str:
     """
     Format a numbered reference list from multiple articles.
     
+    Builds the whole list in memory; use write_reference_list() to stream a
+    very large bibliography to a file instead. Pass a CitationCache to reuse
+    citations already formatted for other handouts.
+    
     Input:
         articles = [
             {"authors": ["Smith J"], "title": "First article", "journal": "JAMA", "year": 2023, "volume": "330", "pages": "45-50"},
@@ -216,21 +249,122 @@ def format_reference_list(articles: list[dict]) -> str:
         1. Smith J. First article. JAMA. 2023;330:45-50.
         2. Johnson M, Williams K. Second article. Lancet. 2024;403:112-118."
     """
-    # TODO: Implement
-    # if not articles:
-    #     return "References\n\nNo references cited."
-    #
-    # lines = ["References", ""]
-    # for i, article in enumerate(articles, 1):
-    #     citation = format_citation(article)
-    #     lines.append(f"{i}. {citation}")
-    #
-    # return "\n".join(lines)
-    pass
+    if not articles:
+        return "References\n\nNo references cited."
+    
+    lines = ["References", ""]
+    lines.extend(iter_reference_lines(articles, cache=cache))
+    
+    return "\n".join(lines)
+
+
+class CitationCache:
+    """
+    Bounded LRU cache of formatted citations.
+    
+    Articles (dicts or article_store.ArticleRecords) are keyed by PMID when
+    they have one, otherwise by a hash of their content, so the same article
+    appearing in many handouts is only formatted once.
+    
+    Usage:
+        cache = CitationCache(max_entries=50000)
+        cache.format(article)  # formats and stores
+        cache.format(article)  # served from the cache
+        cache.hits, cache.misses
+    """
+    
+    def __init__(self, max_entries: int = 10000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._citations = OrderedDict()
+    
+    @staticmethod
+    def key(article: dict) -> str:
+        pmid = article.get("pmid")
+        if pmid:
+            return f"pmid:{pmid}"
+        if not isinstance(article, dict):
+            article = article.to_dict()  # e.g. an article_store.ArticleRecord
+        import hashlib
+        import json
+        payload = json.dumps(article, sort_keys=True, default=str, ensure_ascii=False)
+        return "sha1:" + hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    
+    def format(self, article: dict) -> str:
+        """Return format_citation(article), reusing an earlier result for the same article."""
+        key = self.key(article)
+        citation = self._citations.get(key)
+        if citation is not None:
+            self._citations.move_to_end(key)
+            self.hits += 1
+            return citation
+        self.misses += 1
+        citation = format_citation(article)
+        self._citations[key] = citation
+        if len(self._citations) > self.max_entries:
+            self._citations.popitem(last=False)
+        return citation
+    
+    def __len__(self) -> int:
+        return len(self._citations)
+
+
+def iter_reference_lines(
+    articles: Iterable[dict],
+    cache: Optional[CitationCache] = None,
+    start: int = 1
+) -> Iterator[str]:
+    """
+    Yield numbered reference lines one at a time.
+    
+    articles can be any iterable (e.g. a generator reading a JSONL file), so
+    only one article is held in memory at a time.
+    
+    Input:
+        articles = [{"authors": ["Smith J"], "title": "First article", "journal": "JAMA", "year": 2023}]
+    Output (yielded):
+        "1. Smith J. First article. JAMA. 2023."
+    """
+    for i, article in enumerate(articles, start):
+        citation = cache.format(article) if cache is not None else format_citation(article)
+        yield f"{i}. {citation}"
+
+
+def write_reference_list(
+    articles: Iterable[dict],
+    fp: TextIO,
+    cache: Optional[CitationCache] = None
+) -> int:
+    """
+    Stream a numbered reference list to a file-like object.
+    
+    Writes the same text as format_reference_list() but line by line, so a
+    bibliography of 100k+ articles uses constant memory. Returns the number
+    of references written.
+    
+    Usage:
+        with open("bibliography.txt", "w", encoding="utf-8") as f:
+            write_reference_list(read_articles("corpus.jsonl"), f, cache=CitationCache())
+    """
+    fp.write("References\n\n")
+    count = 0
+    for line in iter_reference_lines(articles, cache=cache):
+        if count:
+            fp.write("\n")
+        fp.write(line)
+        count += 1
+    if not count:
+        fp.write("No references cited.")
+    return count
 
 
 # Superscript number mapping for inline citations
 SUPERSCRIPT_MAP = str.maketrans("0123456789", "⁰¹²³⁴⁵⁶⁷⁸⁹")
+SUPERSCRIPT_SEPARATOR = "˒"
+SUPERSCRIPT_RANGE = "⁻"
 
 
 def create_inline_citation(reference_numbers: list[int]) -> str:
@@ -257,14 +391,24 @@ def create_inline_citation(reference_numbers: list[int]) -> str:
     Output:
         "¹²"
     """
-    # TODO: Implement
-    # Simple version:
-    # numbers_str = ",".join(str(n) for n in reference_numbers)
-    # return numbers_str.translate(SUPERSCRIPT_MAP)
-    pass
+    # Collapse runs of 3+ consecutive numbers into ranges: [1, 2, 3, 5] -> "1-3,5"
+    numbers = sorted(set(reference_numbers))
+    groups = []
+    i = 0
+    while i < len(numbers):
+        j = i
+        while j + 1 < len(numbers) and numbers[j + 1] == numbers[j] + 1:
+            j += 1
+        if j - i >= 2:
+            groups.append(f"{numbers[i]}{SUPERSCRIPT_RANGE}{numbers[j]}".translate(SUPERSCRIPT_MAP))
+            i = j + 1
+        else:
+            groups.append(str(numbers[i]).translate(SUPERSCRIPT_MAP))
+            i += 1
+    return SUPERSCRIPT_SEPARATOR.join(groups)
 
 
-def add_citations_to_text(text: str, citation_positions: list[dict]) -> str:
+def add_citations_to_text(text: str, citation_positions, mode: str = "first") -> str:
     """
     Add inline citation markers to generated text.
     
@@ -279,27 +423,20 @@ def add_citations_to_text(text: str, citation_positions: list[dict]) -> str:
         "Pain management typically includes acetaminophen.¹ Ice therapy is recommended for swelling.²˒³ Rest is important for recovery."
     
     Implementation approach:
-        1. Sort citations by position in text (end to beginning to preserve indices)
-        2. For each citation, find the phrase and insert superscript after it
-        3. Return modified text
+        1. Compile all phrases into one automaton (see citation_anchors.py)
+        2. Scan the text once, matching phrases on word boundaries
+        3. Join the text pieces and superscripts in a single pass
+    
+    mode="first" cites the first occurrence of each phrase, mode="all" every
+    occurrence. citation_positions may also be a CitationPhraseSet compiled
+    once and reused across many documents.
     """
-    # TODO: Implement
-    # Process in reverse order so indices don't shift
-    # sorted_citations = sorted(citation_positions, key=lambda c: text.find(c["after_phrase"]), reverse=True)
-    #
-    # for citation in sorted_citations:
-    #     phrase = citation["after_phrase"]
-    #     ref_nums = citation["reference_numbers"]
-    #     superscript = create_inline_citation(ref_nums)
-    #     
-    #     # Find phrase and insert superscript after it
-    #     pos = text.find(phrase)
-    #     if pos != -1:
-    #         insert_pos = pos + len(phrase)
-    #         text = text[:insert_pos] + superscript + text[insert_pos:]
-    #
-    # return text
-    pass
+    # Imported here because citation_anchors builds on create_inline_citation above
+    from citation_anchors import CitationPhraseSet
+    
+    if not isinstance(citation_positions, CitationPhraseSet):
+        citation_positions = CitationPhraseSet(citation_positions)
+    return citation_positions.apply(text, mode=mode)
 
 
 # Test the module
@@ -0,0 +1,392 @@
+# client_pool.py
+"""
+Pooled HTTP Clients for PostopCare
+
+Every vector_search and generate_with_context call used to be its own
+network request: a new connection (and TLS handshake) each time, no cap on
+how many run at once and nothing stopping a burst of concurrent sections
+from tripping the provider's 429 limits. This module is the shared client
+layer both calls go through:
+
+    ConnectionPool  bounded pool of keep-alive http.client connections
+    TokenBucket     requests-per-second limit with a burst allowance
+    Backend         one upstream service: pool + concurrency semaphore + rate limit
+    OpenAIClient    chat completions and embeddings over a Backend
+    PineconeStore   vector search over a Backend (embeds queries with OpenAIClient)
+
+pooled_pipeline() wires them into a RAGPipeline (see rag_pipeline.py), so
+section, handout and batch generation all share the same pools.
+
+Setup:
+    No additional pip installs required (uses http.client)
+
+    Set OPENAI_API_KEY, PINECONE_API_KEY and PINECONE_INDEX_HOST, or pass the
+    URLs and keys to pooled_pipeline(). For offline use point both URLs at
+    the stand-in server in benchmarks/fakes/http_backend.py.
+
+Usage:
+    pipeline = pooled_pipeline(llm_rate_per_second=8, vector_rate_per_second=20)
+    rag_pipeline.set_pipeline(pipeline)
+    rag_pipeline.generate_full_handout("knee replacement", max_workers=6)
+"""
+
+import http.client
+import json
+import logging
+import os
+import socket
+import ssl
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("client_pool")
+
+# Errors that mean a kept-alive connection was closed by the server while idle
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError
+)
+
+
+class BackendError(Exception):
+    """A backend answered with an HTTP error status."""
+
+    def __init__(self, backend: str, status: int, body: str, retry_after: Optional[float] = None):
+        super().__init__(f"{backend} returned HTTP {status}: {body[:200]}")
+        self.backend = backend
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter.
+
+    Tokens refill at rate per second up to capacity. acquire() takes a token,
+    sleeping just long enough when the bucket is empty. Callers that arrive
+    while it is empty queue up behind each other (the balance goes negative),
+    so a burst is spread out at exactly rate per second.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens, blocking until they are available. Returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class ConnectionPool:
+    """
+    Bounded pool of keep-alive connections to one host.
+
+    At most max_connections are open at once; a request that finds them all
+    busy waits for one to be returned. Idle connections are reused most
+    recently used first. A reused connection the server has already closed is
+    replaced and the request is sent again once.
+    """
+
+    def __init__(self, base_url: str, max_connections: int = 10, timeout: float = 30.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {base_url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context() if self.scheme == "https" else None
+        self.stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def _checkout(self) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle:
+                self.stats["reused"] += 1
+                return self._idle.pop(), True
+            self.stats["opened"] += 1
+        if self.scheme == "https":
+            connection = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=self._ssl_context
+            )
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return connection, False
+
+    def _discard(self, connection: http.client.HTTPConnection) -> None:
+        connection.close()
+        with self._lock:
+            self.stats["discarded"] += 1
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[dict] = None
+    ) -> tuple[int, dict, bytes]:
+        """Send one request and return (status, lower-cased headers, body)."""
+        with self._slots:
+            for attempt in range(2):
+                connection, reused = self._checkout()
+                try:
+                    if connection.sock is None:
+                        connection.connect()
+                        # Small JSON requests on a kept-alive connection must not wait on Nagle
+                        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    connection.request(method, self.base_path + path, body=body, headers=headers or {})
+                    response = connection.getresponse()
+                    data = response.read()
+                except _STALE_CONNECTION_ERRORS:
+                    self._discard(connection)
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    self._discard(connection)
+                    raise
+                if response.will_close:
+                    self._discard(connection)
+                else:
+                    with self._lock:
+                        self._idle.append(connection)
+                return response.status, {k.lower(): v for k, v in response.getheaders()}, data
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class Backend:
+    """
+    One upstream service shared by every pipeline thread.
+
+    Requests pass a per-backend concurrency semaphore, then the token bucket
+    (when rate_per_second is set), then the connection pool. A 429 or any
+    other error status raises BackendError; for 429 its retry_after holds the
+    server's Retry-After hint in seconds.
+
+    Usage:
+        llm = Backend("llm", "https://api.openai.com", max_connections=8, rate_per_second=5,
+                      headers={"Authorization": f"Bearer {api_key}"})
+        llm.post_json("/v1/chat/completions", {...})
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        max_connections: int = 10,
+        max_concurrency: Optional[int] = None,
+        rate_per_second: Optional[float] = None,
+        burst: Optional[float] = None,
+        headers: Optional[dict] = None,
+        timeout: float = 30.0
+    ):
+        self.name = name
+        self.pool = ConnectionPool(base_url, max_connections=max_connections, timeout=timeout)
+        self.max_concurrency = max_concurrency or max_connections
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self.rate_limiter = TokenBucket(rate_per_second, burst) if rate_per_second else None
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "errors": 0, "rate_limited": 0, "throttled_seconds": 0.0}
+
+    def _count(self, **increments) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                self._counters[name] += value
+
+    def post_json(self, path: str, payload: dict) -> dict:
+        """POST payload as JSON and return the decoded JSON response."""
+        body = json.dumps(payload).encode("utf-8")
+        with self._semaphore:
+            throttled = self.rate_limiter.acquire() if self.rate_limiter is not None else 0.0
+            status, headers, data = self.pool.request("POST", path, body=body, headers=self.headers)
+        self._count(requests=1, throttled_seconds=throttled)
+        if status >= 400:
+            retry_after = None
+            if status == 429:
+                self._count(rate_limited=1)
+                try:
+                    retry_after = float(headers.get("retry-after", ""))
+                except ValueError:
+                    pass
+            self._count(errors=1)
+            raise BackendError(self.name, status, data.decode("utf-8", "replace"), retry_after)
+        return json.loads(data)
+
+    def stats(self) -> dict:
+        """
+        Output:
+            {"requests": 120, "errors": 0, "rate_limited": 0, "throttled_seconds": 3.2,
+             "connections_opened": 6, "connections_reused": 114, "connections_discarded": 0}
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        stats.update({f"connections_{name}": count for name, count in self.pool.stats.items()})
+        return stats
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class OpenAIClient:
+    """Chat completions and embeddings over a pooled Backend."""
+
+    def __init__(
+        self,
+        backend: Backend,
+        model: str = "gpt-4o-mini",
+        embedding_model: str = "text-embedding-3-small",
+        temperature: float = 0.3
+    ):
+        self.backend = backend
+        self.model = model
+        self.embedding_model = embedding_model
+        self.temperature = temperature
+
+    def generate_with_context(self, prompt: str, context: str, system_prompt: Optional[str] = None) -> str:
+        """Same contract as llm_client.generate_with_context."""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": f"Context:\n{context}\n\n{prompt}"})
+        response = self.backend.post_json("/v1/chat/completions", {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature
+        })
+        return response["choices"][0]["message"]["content"]
+
+    def embed_texts(self, texts: list[str]) -> list[list[float]]:
+        """One embeddings request for all texts, returned in input order."""
+        response = self.backend.post_json("/v1/embeddings", {"model": self.embedding_model, "input": list(texts)})
+        data = sorted(response["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+
+class PineconeStore:
+    """
+    Vector search over a pooled Backend pointed at a Pinecone index host.
+
+    Provides search(query, top_k) like vector_store.search, plus
+    embed_texts/query_vectors so batch_search() (see batch_retrieval.py) can
+    embed all section queries in one request.
+
+    Only the embedding is batched. Pinecone's /query endpoint takes a single
+    vector (the multi-vector "queries" field is deprecated), so
+    query_vectors still sends one query per vector; they reuse the pool's
+    kept-alive connections but cost one round trip each.
+    """
+
+    def __init__(self, backend: Backend, embedder: OpenAIClient, namespace: Optional[str] = None):
+        self.backend = backend
+        self.embedder = embedder
+        self.namespace = namespace
+
+    def embed_texts(self, texts: list[str]) -> list[list[float]]:
+        return self.embedder.embed_texts(texts)
+
+    def query_vectors(self, vectors: list[list[float]], top_k: int = 5) -> list[list[dict]]:
+        """One /query request per vector, in order (see the class docstring)."""
+        return [self._query(vector, top_k) for vector in vectors]
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        return self._query(self.embed_texts([query])[0], top_k)
+
+    def _query(self, vector: list[float], top_k: int) -> list[dict]:
+        payload = {"vector": vector, "topK": top_k, "includeMetadata": True}
+        if self.namespace:
+            payload["namespace"] = self.namespace
+        response = self.backend.post_json("/query", payload)
+        results = []
+        for match in response.get("matches", []):
+            metadata = dict(match.get("metadata") or {})
+            results.append({
+                "id": match["id"],
+                "text": metadata.pop("text", ""),
+                "score": match.get("score", 0.0),
+                "metadata": metadata
+            })
+        return results
+
+
+def pooled_pipeline(
+    llm_url: str = "https://api.openai.com",
+    vector_url: Optional[str] = None,
+    openai_api_key: Optional[str] = None,
+    pinecone_api_key: Optional[str] = None,
+    max_connections: int = 10,
+    llm_concurrency: Optional[int] = None,
+    vector_concurrency: Optional[int] = None,
+    llm_rate_per_second: Optional[float] = None,
+    vector_rate_per_second: Optional[float] = None,
+    model: Optional[str] = None
+):
+    """
+    Build a RAGPipeline whose search and generation go through pooled Backends.
+
+    The PineconeStore is the pipeline's store, so batched retrieval embeds
+    all section queries in one request (the searches are still one request
+    per query, see PineconeStore). The pipeline does not stream;
+    stream_full_handout() falls back to one chunk per section. The backends
+    are available as pipeline.backends for stats() and close().
+    """
+    from rag_pipeline import MODEL_NAME, RAGPipeline
+
+    openai_api_key = openai_api_key or os.environ.get("OPENAI_API_KEY", "")
+    pinecone_api_key = pinecone_api_key or os.environ.get("PINECONE_API_KEY", "")
+    vector_url = vector_url or os.environ.get("PINECONE_INDEX_HOST")
+    if not vector_url:
+        raise ValueError("vector_url (or PINECONE_INDEX_HOST) is required")
+    if "://" not in vector_url:
+        vector_url = f"https://{vector_url}"
+
+    llm_backend = Backend(
+        "llm", llm_url,
+        max_connections=max_connections,
+        max_concurrency=llm_concurrency,
+        rate_per_second=llm_rate_per_second,
+        headers={"Authorization": f"Bearer {openai_api_key}"} if openai_api_key else None
+    )
+    vector_backend = Backend(
+        "vector_store", vector_url,
+        max_connections=max_connections,
+        max_concurrency=vector_concurrency,
+        rate_per_second=vector_rate_per_second,
+        headers={"Api-Key": pinecone_api_key} if pinecone_api_key else None
+    )
+    model = model or MODEL_NAME
+    llm = OpenAIClient(llm_backend, model=model)
+    store = PineconeStore(vector_backend, embedder=llm)
+
+    pipeline = RAGPipeline(generate_fn=llm.generate_with_context, store=store, model=model)
+    pipeline.backends = {"llm": llm_backend, "vector_store": vector_backend}
+    logger.info(f"Pooled pipeline: llm={llm_url} vector_store={vector_url} max_connections={max_connections}")
+    return pipeline
@@ -0,0 +1,123 @@
+# context_packing.py
+"""
+Context Packing for PostopCare
+
+Retrieved chunks often overlap heavily (the same abstract split into
+neighbouring chunks, or the same finding reported twice), and joining all of
+them verbatim inflates the prompt. pack_context() trims the retrieved chunks
+before they are formatted into the LLM context:
+
+    1. Order chunks by retrieval score (best first; the fused rrf_score for
+       HybridStore results, see lexical_index.py)
+    2. Drop near-duplicates: chunks whose word-shingle overlap (Jaccard)
+       with an already-kept chunk is at or above the threshold
+    3. Greedily keep chunks while they fit in the token budget
+
+The packed chunks are returned in the order they should be labelled, so
+"[Source N: PMID ...]" in the context always refers to sources[N-1].
+
+Setup:
+    No additional pip installs required
+"""
+
+import math
+import re
+from typing import Optional
+
+# Rough tokens-per-character ratio for English text with GPT-style tokenizers
+CHARS_PER_TOKEN = 4
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens in text.
+
+    Input:
+        text = "Apply ice for 20 minutes."
+    Output:
+        7
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def shingles(text: str, size: int = 5) -> set[int]:
+    """
+    Hashed word shingles (overlapping runs of `size` words) of text.
+
+    Texts shorter than `size` words produce a single shingle of all their words.
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {hash(tuple(words))} if words else set()
+    return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    """Jaccard similarity of two sets (0.0 when both are empty)."""
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def ranking_score(chunk: dict) -> float:
+    """Score to order a retrieved chunk by: rrf_score when the chunk comes from a fused ranking, else score."""
+    return chunk.get("rrf_score", chunk.get("score", 0.0))
+
+
+def pack_context(
+    chunks: list[dict],
+    token_budget: Optional[int] = 2000,
+    similarity_threshold: float = 0.8,
+    shingle_size: int = 5
+) -> tuple[list[dict], dict]:
+    """
+    Deduplicate chunks and fit them into a token budget.
+
+    The best-scoring chunk is always kept, even if it alone exceeds the
+    budget, so the LLM never gets an empty context. Pass token_budget=None
+    to only deduplicate.
+
+    Input:
+        chunks = [
+            {"id": "pmid_1_chunk_0", "text": "Ice therapy reduces swelling...", "score": 0.91, "metadata": {...}},
+            {"id": "pmid_1_chunk_1", "text": "Ice therapy reduces swelling...", "score": 0.90, "metadata": {...}},
+            {"id": "pmid_2_chunk_0", "text": "Acetaminophen is effective...", "score": 0.85, "metadata": {...}}
+        ]
+        token_budget = 2000
+
+    Output:
+        (
+            [<pmid_1_chunk_0 chunk>, <pmid_2_chunk_0 chunk>],
+            {"duplicates_removed": 1, "over_budget": 0, "context_tokens": 412}
+        )
+    """
+    ordered = sorted(chunks, key=ranking_score, reverse=True)
+
+    kept = []
+    kept_shingles = []
+    duplicates_removed = 0
+    over_budget = 0
+    used_tokens = 0
+
+    for chunk in ordered:
+        chunk_shingles = shingles(chunk["text"], shingle_size)
+        if any(jaccard(chunk_shingles, other) >= similarity_threshold for other in kept_shingles):
+            duplicates_removed += 1
+            continue
+
+        tokens = estimate_tokens(chunk["text"])
+        if kept and token_budget is not None and used_tokens + tokens > token_budget:
+            over_budget += 1
+            continue
+
+        kept.append(chunk)
+        kept_shingles.append(chunk_shingles)
+        used_tokens += tokens
+
+    return kept, {
+        "duplicates_removed": duplicates_removed,
+        "over_budget": over_budget,
+        "context_tokens": used_tokens
+    }
@@ -0,0 +1,94 @@
+# handout_codec.py
+"""
+Compact Handout Serialization for PostopCare
+
+Handouts are stored and sent by the thousand, and most of their bytes are
+source chunk text. This module encodes a handout (see
+rag_pipeline.generate_full_handout) to bytes in one of:
+
+    json      standard library, no whitespace
+    orjson    same JSON, several times faster to encode and decode
+    msgpack   binary, smaller than JSON
+
+With include_text=False the chunk text is left out of all_sources; ids,
+scores and metadata (PMIDs) are kept, so citations can still be built and
+the text can be fetched again by chunk id.
+
+Setup:
+    pip install orjson    # for format="orjson"
+    pip install msgpack   # for format="msgpack"
+
+Usage:
+    data = encode_handout(handout, format="orjson", include_text=False)
+    handout = decode_handout(data, format="orjson")
+"""
+
+import json
+
+FORMATS = ("json", "orjson", "msgpack")
+
+FILE_EXTENSIONS = {"json": ".json", "orjson": ".json", "msgpack": ".msgpack"}
+
+
+def _check_format(format: str) -> None:
+    if format not in FORMATS:
+        raise ValueError(f"Unknown handout format: {format!r} (expected one of {FORMATS})")
+
+
+def without_source_text(handout: dict) -> dict:
+    """
+    Copy of the handout whose all_sources entries have no "text".
+
+    Only the handout dict and the source entries are copied; sections and
+    metadata are shared with the original.
+    """
+    compact = dict(handout)
+    compact["all_sources"] = [
+        {key: value for key, value in source.items() if key != "text"}
+        for source in handout.get("all_sources", [])
+    ]
+    return compact
+
+
+def encode_handout(handout: dict, format: str = "json", include_text: bool = True) -> bytes:
+    """
+    Serialize a handout.
+
+    Input:
+        handout = generate_full_handout("knee replacement")
+        format = "orjson"
+        include_text = False
+
+    Output:
+        b'{"procedure":"knee replacement","title":"After Your Knee Replacement: Recovery Guide",...}'
+    """
+    _check_format(format)
+    if not include_text:
+        handout = without_source_text(handout)
+
+    if format == "orjson":
+        import orjson
+        return orjson.dumps(handout)
+    if format == "msgpack":
+        import msgpack
+        return msgpack.packb(handout, use_bin_type=True)
+
+    return json.dumps(handout, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_handout(data: bytes, format: str = "json") -> dict:
+    """Inverse of encode_handout. JSON written by either JSON format can be read by both."""
+    _check_format(format)
+    if format == "orjson":
+        import orjson
+        return orjson.loads(data)
+    if format == "msgpack":
+        import msgpack
+        return msgpack.unpackb(data, raw=False)
+
+    return json.loads(data)
+
+
+def format_for_path(path: str) -> str:
+    """Format to decode a handout file with, from its extension (.msgpack or JSON)."""
+    return "msgpack" if path.endswith(FILE_EXTENSIONS["msgpack"]) else "json"
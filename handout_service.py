@@ -0,0 +1,385 @@
+# handout_service.py
+"""
+Async Handout Service for PostopCare
+
+Handouts used to be generated by synchronous generate_full_handout calls
+behind a web endpoint, so under load requests piled up without limit. This
+module puts an asyncio service in front of the pipeline:
+
+    - Jobs wait in a bounded priority queue: "interactive" (a clinician is
+      waiting) always runs before "batch" (index refreshes, bulk jobs)
+    - Admission control: when the queue is full an interactive job sheds the
+      newest queued batch job; otherwise the new job is rejected. Both get
+      ServiceOverloaded with a retry-after hint based on the current backlog.
+      A job whose caller gives up (its future is cancelled) leaves the queue
+      depth at once, so it never causes a rejection
+    - A fixed number of workers run generate_full_handout on a thread pool
+    - stats() reports queue depth, queue wait percentiles, worker
+      utilization and admission counters
+
+A small local HTTP front end is included for testing:
+
+    POST /handouts   {"procedure": "knee replacement", "priority": "interactive", ...}
+                     -> 200 handout JSON, 400 for a malformed request,
+                        or 503 with a Retry-After header
+    GET  /stats      -> service stats
+
+Setup:
+    Same as rag_pipeline.py
+
+Usage:
+    python handout_service.py --port 8080 --workers 4 --max-queue 50
+
+    # or from asyncio code
+    service = HandoutService(workers=4, max_queue=50)
+    await service.start()
+    handout = await service.generate("knee replacement", priority="interactive")
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from metrics import REGISTRY, MetricsRegistry
+
+logger = logging.getLogger("handout_service")
+
+# Lower runs first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# Options a job may pass through to generate_full_handout
+HANDOUT_OPTIONS = ("sections", "max_workers", "top_k", "batch_retrieval", "token_budget", "deadline_seconds")
+
+
+class ServiceOverloaded(Exception):
+    """The job was rejected or shed; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    """One queued handout request."""
+
+    def __init__(self, job_id: int, procedure: str, priority: str, options: dict, future: asyncio.Future):
+        self.id = job_id
+        self.procedure = procedure
+        self.priority = priority
+        self.options = options
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.queued = True  # False once popped, shed or cancelled
+
+
+class HandoutService:
+    """
+    Bounded priority queue of handout jobs served by a fixed worker pool.
+
+    generate_fn defaults to rag_pipeline.generate_full_handout and is called
+    as generate_fn(procedure, **options) on a worker thread.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 100,
+        generate_fn: Optional[Callable] = None,
+        registry: Optional[MetricsRegistry] = None
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.generate_fn = generate_fn
+        self.registry = REGISTRY if registry is None else registry
+        self._heap = []          # (priority, sequence, job); shed and cancelled jobs stay until popped
+        self._queued = {name: 0 for name in PRIORITIES}
+        self._sequence = itertools.count()
+        self._available = None
+        self._executor = None
+        self._worker_tasks = []
+        self._running = set()
+        self._busy_seconds = 0.0
+        self._started_at = None
+        self._service_seconds_avg = None
+        self._counters = {"accepted": 0, "rejected": 0, "shed": 0, "cancelled": 0, "completed": 0, "failed": 0}
+
+    async def start(self) -> None:
+        if self.generate_fn is None:
+            from rag_pipeline import generate_full_handout
+            self.generate_fn = generate_full_handout
+        self._available = asyncio.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="handout-service")
+        self._started_at = time.monotonic()
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Handout service started: {self.workers} workers, queue limit {self.max_queue}")
+
+    async def stop(self) -> None:
+        """
+        Stop the workers and fail every job still queued or running.
+
+        A running generation cannot be interrupted on its thread; it finishes
+        in the background and its result is discarded.
+        """
+        for job in self._running:
+            if not job.future.done():
+                job.future.set_exception(ServiceOverloaded("Service stopped", self.retry_after()))
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        while self._heap:
+            _, _, job = heapq.heappop(self._heap)
+            if job.queued and not job.future.done():
+                job.future.set_exception(ServiceOverloaded("Service stopped", self.retry_after()))
+        self._queued = {name: 0 for name in PRIORITIES}
+        self._executor.shutdown(wait=False)
+
+    def queue_depth(self) -> int:
+        return sum(self._queued.values())
+
+    def retry_after(self) -> float:
+        """Seconds until the backlog should have drained enough to admit a job."""
+        service_seconds = self._service_seconds_avg or 1.0
+        backlog = self.queue_depth() + len(self._running)
+        return round(max(1.0, backlog * service_seconds / self.workers), 1)
+
+    async def submit(self, procedure: str, priority: str = "interactive", **options) -> asyncio.Future:
+        """
+        Queue a job and return a future for its handout.
+
+        Raises ServiceOverloaded when the queue is full and nothing can be
+        shed. The future fails with ServiceOverloaded if the job is shed later.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority!r} (expected one of {tuple(PRIORITIES)})")
+        unknown = set(options) - set(HANDOUT_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unsupported handout options: {sorted(unknown)}")
+
+        if self.queue_depth() >= self.max_queue and not self._shed_for(priority):
+            self._counters["rejected"] += 1
+            self.registry.increment("service_rejected")
+            retry_after = self.retry_after()
+            logger.warning(f"Rejected {priority} job for '{procedure}': queue full (retry after {retry_after}s)")
+            raise ServiceOverloaded(f"Queue full ({self.max_queue} jobs)", retry_after)
+
+        job = Job(next(self._sequence), procedure, priority, options, asyncio.get_running_loop().create_future())
+        job.future.add_done_callback(lambda future: self._dequeue_cancelled(job))
+        async with self._available:
+            heapq.heappush(self._heap, (PRIORITIES[priority], job.id, job))
+            self._queued[priority] += 1
+            self._available.notify()
+        self._counters["accepted"] += 1
+        return job.future
+
+    async def generate(self, procedure: str, priority: str = "interactive", **options) -> dict:
+        """Submit a job and wait for its handout."""
+        return await (await self.submit(procedure, priority, **options))
+
+    def _dequeue_cancelled(self, job: Job) -> None:
+        """Stop counting a job whose caller cancelled it while it was queued."""
+        if job.future.cancelled() and job.queued:
+            job.queued = False
+            self._queued[job.priority] -= 1
+            self._counters["cancelled"] += 1
+
+    def _shed_for(self, priority: str) -> bool:
+        """Drop the newest queued job of a lower priority to make room. True if one was shed."""
+        rank = PRIORITIES[priority]
+        candidates = [job for _, _, job in self._heap if job.queued and PRIORITIES[job.priority] > rank]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda job: (PRIORITIES[job.priority], job.id))
+        victim.queued = False
+        self._queued[victim.priority] -= 1
+        self._counters["shed"] += 1
+        self.registry.increment("service_shed")
+        victim.future.set_exception(
+            ServiceOverloaded(f"Shed to make room for {priority} work", self.retry_after())
+        )
+        logger.warning(f"Shed {victim.priority} job for '{victim.procedure}' to admit {priority} work")
+        return True
+
+    async def _next_job(self) -> Job:
+        async with self._available:
+            while True:
+                while not self._heap:
+                    await self._available.wait()
+                _, _, job = heapq.heappop(self._heap)
+                if job.queued:
+                    job.queued = False
+                    self._queued[job.priority] -= 1
+                    return job
+
+    async def _worker(self, index: int) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._next_job()
+            if job.future.done():  # the caller gave up while it was queued
+                continue
+            job.started_at = time.monotonic()
+            self.registry.observe_labeled(
+                "queue_wait_seconds", "priority", job.priority, job.started_at - job.enqueued_at
+            )
+            self._running.add(job)
+            try:
+                handout = await loop.run_in_executor(
+                    self._executor, lambda: self.generate_fn(job.procedure, **job.options)
+                )
+            except Exception as e:
+                self._counters["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self._counters["completed"] += 1
+                if not job.future.done():
+                    job.future.set_result(handout)
+            finally:
+                elapsed = time.monotonic() - job.started_at
+                self._running.discard(job)
+                self._busy_seconds += elapsed
+                self._service_seconds_avg = (
+                    elapsed if self._service_seconds_avg is None
+                    else 0.8 * self._service_seconds_avg + 0.2 * elapsed
+                )
+
+    def stats(self) -> dict:
+        """
+        Output:
+            {
+                "queue_depth": 3, "queued": {"interactive": 1, "batch": 2}, "max_queue": 50,
+                "workers": 4, "busy_workers": 4, "utilization": 0.83,
+                "queue_wait_ms": {"interactive": {"p50_ms": 12.1, "p95_ms": 310.4, ...}, "batch": {...}},
+                "accepted": 120, "rejected": 3, "shed": 5, "cancelled": 1, "completed": 110, "failed": 2,
+                "retry_after_seconds": 8.5
+            }
+        """
+        now = time.monotonic()
+        uptime = now - self._started_at if self._started_at else 0.0
+        busy_seconds = self._busy_seconds + sum(now - job.started_at for job in self._running)
+        return {
+            "queue_depth": self.queue_depth(),
+            "queued": dict(self._queued),
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "busy_workers": len(self._running),
+            "utilization": round(busy_seconds / (uptime * self.workers), 3) if uptime else 0.0,
+            "queue_wait_ms": {
+                priority: self.registry.labeled_histogram("queue_wait_seconds", "priority", priority).snapshot()
+                for priority in PRIORITIES
+            },
+            **self._counters,
+            "retry_after_seconds": self.retry_after()
+        }
+
+
+async def _read_request(reader: asyncio.StreamReader) -> tuple[str, str, bytes]:
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    method, path = request_line.split(" ")[:2]
+    length = 0
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    body = await reader.readexactly(length) if length else b""
+    return method, path, body
+
+
+def _response(status: int, payload: dict, headers: Optional[dict] = None) -> bytes:
+    reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    lines = [
+        f"HTTP/1.1 {status} {reasons.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        "Connection: close"
+    ]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def _handout_request(body: bytes) -> dict:
+    """The JSON object in a POST /handouts body; ValueError if there is none."""
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError as e:  # JSONDecodeError, or UnicodeDecodeError for bad UTF-8
+        raise ValueError(f"Invalid JSON body: {e}") from e
+    if not isinstance(request, dict):
+        raise ValueError("Request body must be a JSON object")
+    return request
+
+
+async def serve_http(service: HandoutService, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+    """
+    Minimal local HTTP front end for a started HandoutService (one request per connection).
+
+    POST /handouts with {"procedure": ..., "priority": "interactive"|"batch", <HANDOUT_OPTIONS>}
+    GET  /stats
+    """
+    async def handle(reader, writer):
+        try:
+            method, path, body = await _read_request(reader)
+            if method == "GET" and path == "/stats":
+                response = _response(200, service.stats())
+            elif method == "POST" and path == "/handouts":
+                try:
+                    request = _handout_request(body)
+                    procedure = request.pop("procedure", None)
+                    priority = request.pop("priority", "interactive")
+                    if not procedure:
+                        raise ValueError("procedure is required")
+                    handout = await service.generate(procedure, priority, **request)
+                    response = _response(200, handout)
+                except ServiceOverloaded as e:
+                    response = _response(
+                        503,
+                        {"error": str(e), "retry_after": e.retry_after},
+                        {"Retry-After": str(max(1, round(e.retry_after)))}
+                    )
+                except ValueError as e:
+                    response = _response(400, {"error": str(e)})
+            else:
+                response = _response(404, {"error": f"No route for {method} {path}"})
+        except Exception as e:
+            logger.error(f"Request failed: {e}")
+            response = _response(500, {"error": f"{type(e).__name__}: {e}"})
+        writer.write(response)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Handout service listening on http://{host}:{port}")
+    return server
+
+
+async def _main(args) -> None:
+    service = HandoutService(workers=args.workers, max_queue=args.max_queue)
+    await service.start()
+    server = await serve_http(service, args.host, args.port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve handout generation over local HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4, help="Handouts generated at once")
+    parser.add_argument("--max-queue", type=int, default=100, help="Queued jobs before load is shed")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_main(args))
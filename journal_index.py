@@ -0,0 +1,223 @@
+# journal_index.py
+"""
+NLM Journal Abbreviation Index for PostopCare
+
+abbreviate_journal() only knew the 25 journals in JOURNAL_ABBREVIATIONS and
+needed an exact match. This module adds the full NLM catalog (~30k titles)
+behind a normalized index, so "the journal of arthroplasty",
+"J. Arthroplasty" and "Journal of Arthroplasty." all resolve to
+"J Arthroplasty".
+
+    - The catalog is read lazily on the first lookup, so importing
+      citation_formatter stays fast
+    - Keys are normalized: case folded, punctuation removed, "&" read as
+      "and", a leading "the" dropped
+    - Lookups are a single dict access; prefix_search() finds partial titles
+
+Catalog file:
+    Gzipped (or plain) TSV, one journal per line:
+        <title>\t<MEDLINE abbreviation>\t<ISO abbreviation (optional)>
+    Build it from NLM's J_Medline.txt
+    (https://ftp.ncbi.nlm.nih.gov/pubmed/J_Medline.txt):
+        python journal_index.py J_Medline.txt data/nlm_journals.tsv.gz
+
+    The catalog is read from data/nlm_journals.tsv.gz next to this file, or
+    from the path in the POSTOPCARE_JOURNAL_CATALOG environment variable. If
+    it is missing, only the built-in abbreviations are indexed.
+
+Setup:
+    No additional pip installs required
+"""
+
+import bisect
+import logging
+import os
+import re
+import sys
+import threading
+from typing import Optional
+
+logger = logging.getLogger("journal_index")
+
+DEFAULT_CATALOG_PATH = os.environ.get(
+    "POSTOPCARE_JOURNAL_CATALOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "nlm_journals.tsv.gz")
+)
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+# Raw spellings remembered by lookup() so repeated names skip normalization
+RAW_LOOKUP_CACHE_SIZE = 65536
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalize a journal title or abbreviation for lookup.
+
+    Input:
+        title = "The Journal of Bone & Joint Surgery."
+    Output:
+        "journal of bone and joint surgery"
+
+    Input:
+        title = "J. Arthroplasty"
+    Output:
+        "j arthroplasty"
+    """
+    text = title.casefold().replace("&", " and ")
+    text = _NON_WORD.sub(" ", text).replace("_", " ").strip()
+    text = " ".join(text.split())
+    if text.startswith("the "):
+        text = text[4:]
+    return text
+
+
+def _open_catalog(path: str):
+    if path.endswith(".gz"):
+        import gzip
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+class JournalIndex:
+    """
+    Lazily built normalized index of journal titles to abbreviations.
+
+    Usage:
+        index = JournalIndex(extra=JOURNAL_ABBREVIATIONS)
+        index.lookup("the journal of arthroplasty")   # "J Arthroplasty"
+        index.prefix_search("journal of bone", limit=3)
+        # [("Journal of Bone and Joint Surgery", "J Bone Joint Surg"), ...]
+    """
+
+    def __init__(self, catalog_path: Optional[str] = DEFAULT_CATALOG_PATH, extra: Optional[dict] = None):
+        self.catalog_path = catalog_path
+        self.extra = dict(extra or {})
+        self._abbreviations = None  # normalized title or abbreviation -> abbreviation
+        self._sorted_keys = []      # normalized titles, sorted, for prefix search
+        self._titles = {}           # normalized title -> display title
+        self._raw_lookups = {}      # journal name as given -> abbreviation or None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self) -> dict:
+        if self._abbreviations is None:
+            with self._lock:
+                if self._abbreviations is None:
+                    self._load()
+        return self._abbreviations
+
+    def _load(self) -> None:
+        abbreviations = {}
+        titles = {}
+
+        def add(title, abbreviation, iso_abbreviation=""):
+            key = normalize_title(title)
+            if not key or not abbreviation:
+                return
+            abbreviations[key] = abbreviation
+            titles[key] = title
+            # Abbreviated spellings map to themselves ("J. Arthroplasty" -> "J Arthroplasty")
+            for alias in (abbreviation, iso_abbreviation):
+                alias_key = normalize_title(alias) if alias else ""
+                if alias_key:
+                    abbreviations.setdefault(alias_key, abbreviation)
+
+        count = 0
+        if self.catalog_path and os.path.exists(self.catalog_path):
+            with _open_catalog(self.catalog_path) as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) >= 2:
+                        add(fields[0], fields[1], fields[2] if len(fields) > 2 else "")
+                        count += 1
+        elif self.catalog_path:
+            logger.info(f"Journal catalog not found at '{self.catalog_path}'; using built-in abbreviations only")
+
+        # Hand-curated entries win over the catalog
+        for title, abbreviation in self.extra.items():
+            add(title, abbreviation)
+
+        self._titles = titles
+        self._sorted_keys = sorted(titles)
+        self._abbreviations = abbreviations
+        logger.info(f"Journal index loaded: {count} catalog titles, {len(abbreviations)} lookup keys")
+
+    def lookup(self, journal_name: str) -> Optional[str]:
+        """Abbreviation for a journal title or abbreviation in any spelling, or None."""
+        try:
+            return self._raw_lookups[journal_name]
+        except KeyError:
+            pass
+        abbreviation = self._ensure_loaded().get(normalize_title(journal_name))
+        if len(self._raw_lookups) >= RAW_LOOKUP_CACHE_SIZE:
+            self._raw_lookups.clear()
+        self._raw_lookups[journal_name] = abbreviation
+        return abbreviation
+
+    def prefix_search(self, partial_title: str, limit: int = 10) -> list[tuple[str, str]]:
+        """
+        Journals whose normalized title starts with the normalized partial title.
+
+        Input:
+            partial_title = "Journal of Bone"
+        Output:
+            [("Journal of Bone and Joint Surgery", "J Bone Joint Surg"), ...]
+        """
+        abbreviations = self._ensure_loaded()
+        prefix = normalize_title(partial_title)
+        if not prefix:
+            return []
+        matches = []
+        position = bisect.bisect_left(self._sorted_keys, prefix)
+        while position < len(self._sorted_keys) and len(matches) < limit:
+            key = self._sorted_keys[position]
+            if not key.startswith(prefix):
+                break
+            matches.append((self._titles[key], abbreviations[key]))
+            position += 1
+        return matches
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded())
+
+
+def build_catalog(j_medline_path: str, output_path: str) -> int:
+    """
+    Convert NLM's J_Medline.txt into the compact catalog TSV.
+
+    J_Medline.txt is a series of records separated by dashed lines, with
+    "JournalTitle:", "MedAbbr:" and "IsoAbbr:" fields. Returns the number of
+    journals written.
+    """
+    records = []
+    record = {}
+    with open(j_medline_path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("---"):
+                if record.get("JournalTitle") and record.get("MedAbbr"):
+                    records.append(record)
+                record = {}
+                continue
+            field, _, value = line.partition(":")
+            record[field.strip()] = value.strip()
+    if record.get("JournalTitle") and record.get("MedAbbr"):
+        records.append(record)
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    import gzip
+    opener = gzip.open if output_path.endswith(".gz") else open
+    with opener(output_path, "wt", encoding="utf-8") as out:
+        for record in records:
+            fields = (record["JournalTitle"], record["MedAbbr"], record.get("IsoAbbr", ""))
+            out.write("\t".join(field.replace("\t", " ") for field in fields) + "\n")
+    return len(records)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python journal_index.py J_Medline.txt data/nlm_journals.tsv.gz")
+        sys.exit(1)
+    written = build_catalog(sys.argv[1], sys.argv[2])
+    print(f"Wrote {written} journals to {sys.argv[2]}")
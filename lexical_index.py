@@ -0,0 +1,359 @@
+# lexical_index.py
+"""
+Local BM25 Index for PostopCare
+
+Dense retrieval alone sometimes misses exact clinical terms (drug names,
+abbreviations such as "DVT") because one rare word barely moves a query
+embedding. BM25Index is an in-process inverted index over the same chunk
+corpus that scores those terms by how rare they are, and HybridStore fuses
+its ranking with the dense results using reciprocal-rank fusion (RRF):
+
+    fused_score(chunk) = sum over rankings of weight / (rrf_k + rank)
+
+Both have the same search(query, top_k) contract as vector_store.search and
+return the same chunk dicts (id/text/score/metadata), so they can be passed
+anywhere the pipeline accepts a store. Hybrid results keep the score of the
+retriever that found them and add the fused "rrf_score", which
+context_packing orders them by:
+
+    index = BM25Index.open("literature_bm25")
+    store = HybridStore(dense=LocalVectorIndex.open("literature_index", embed_texts), lexical=index, dense_top_k=3)
+    generate_full_handout("knee replacement", store=store, batch_retrieval=True)
+
+A lexical lookup costs microseconds, so the dense search can ask for fewer
+results (dense_top_k) and let the lexical ranking fill in the exact-term
+matches. benchmarks/bench_retrieval.py reports recall and latency for
+dense, lexical and hybrid retrieval.
+
+On-disk layout (one directory per index):
+    bm25_terms.json    {"term": [start, end], ...} slice of each term's postings
+    bm25_docs.npy      uint32 chunk rows, grouped by term (memory-mapped)
+    bm25_tfs.npy       uint16 term frequency of each posting (memory-mapped)
+    bm25_lengths.npy   uint32 token count of each chunk
+    bm25_meta.json     {"k1", "b", "chunks", "avg_length"}
+    chunks.jsonl       metadata sidecar, same format as local_index.py
+
+Building into the directory of a LocalVectorIndex is fine: both write the
+same chunks.jsonl for the same chunks.
+
+Setup:
+    pip install numpy
+"""
+
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+from batch_retrieval import batch_search
+from local_index import _top_positions
+
+logger = logging.getLogger("lexical_index")
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Words too common in clinical text and handout queries to help ranking
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it of on or that the this to was were with".split()
+)
+
+MAX_TERM_FREQUENCY = np.iinfo(np.uint16).max
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lower-cased word tokens without stopwords. No stemming, so drug names
+    and abbreviations only match exactly.
+
+    Input:
+        text = "Apixaban reduces the risk of DVT after TKA."
+    Output:
+        ["apixaban", "reduces", "risk", "dvt", "after", "tka"]
+    """
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Memory-mapped inverted index with Okapi BM25 scoring.
+
+    Usage:
+        BM25Index.build("literature_bm25", chunks)
+        index = BM25Index.open("literature_bm25")
+        index.search("apixaban dvt prophylaxis after knee replacement", top_k=5)
+    """
+
+    def __init__(
+        self,
+        terms: dict,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray,
+        chunks: list[dict],
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        if len(lengths) != len(chunks):
+            raise ValueError(f"{len(lengths)} document lengths but {len(chunks)} chunks")
+        self.terms = terms
+        self.docs = docs
+        self.tfs = tfs
+        self.lengths = lengths
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        average = float(lengths.mean()) if len(lengths) else 0.0
+        self.avg_length = average or 1.0
+        # Per-chunk part of the BM25 denominator, computed once instead of per posting
+        self._length_norms = (k1 * (1 - b + b * lengths / self.avg_length)).astype(np.float32)
+
+    @classmethod
+    def build(cls, directory: str, chunks: list[dict], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """
+        Tokenize chunks and write a new index directory.
+
+        Input:
+            directory = "literature_bm25"
+            chunks = [
+                {"id": "pmid_12345_chunk_0", "text": "Studies show...", "metadata": {"pmid": "12345"}}
+            ]
+        """
+        if not chunks:
+            raise ValueError("Cannot build an index with no chunks")
+        os.makedirs(directory, exist_ok=True)
+
+        postings = {}
+        lengths = np.zeros(len(chunks), dtype=np.uint32)
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk["text"])
+            lengths[row] = len(tokens)
+            for term, count in Counter(tokens).items():
+                postings.setdefault(term, []).append((row, min(count, MAX_TERM_FREQUENCY)))
+
+        total = sum(len(entries) for entries in postings.values())
+        docs = np.lib.format.open_memmap(
+            os.path.join(directory, "bm25_docs.npy"), mode="w+", dtype=np.uint32, shape=(total,)
+        )
+        tfs = np.lib.format.open_memmap(
+            os.path.join(directory, "bm25_tfs.npy"), mode="w+", dtype=np.uint16, shape=(total,)
+        )
+        terms = {}
+        start = 0
+        for term in sorted(postings):
+            entries = postings[term]
+            end = start + len(entries)
+            docs[start:end] = [row for row, _ in entries]
+            tfs[start:end] = [count for _, count in entries]
+            terms[term] = [start, end]
+            start = end
+        docs.flush()
+        tfs.flush()
+        del docs, tfs
+
+        np.save(os.path.join(directory, "bm25_lengths.npy"), lengths)
+        with open(os.path.join(directory, "bm25_terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False, separators=(",", ":"))
+        with open(os.path.join(directory, "bm25_meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": k1, "b": b, "chunks": len(chunks), "avg_length": float(lengths.mean())}, f)
+        with open(os.path.join(directory, "chunks.jsonl"), "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                record = {"id": chunk["id"], "text": chunk["text"], "metadata": chunk.get("metadata", {})}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        logger.info(f"Built BM25 index '{directory}' with {len(chunks)} chunks, {len(terms)} terms, {total} postings")
+        return cls.open(directory)
+
+    @classmethod
+    def open(cls, directory: str, k1: Optional[float] = None, b: Optional[float] = None) -> "BM25Index":
+        """Open an index directory, memory-mapping the postings. k1 and b default to the build settings."""
+        with open(os.path.join(directory, "bm25_meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, "bm25_terms.json"), encoding="utf-8") as f:
+            terms = json.load(f)
+        docs = np.load(os.path.join(directory, "bm25_docs.npy"), mmap_mode="r")
+        tfs = np.load(os.path.join(directory, "bm25_tfs.npy"), mmap_mode="r")
+        lengths = np.load(os.path.join(directory, "bm25_lengths.npy"))
+        with open(os.path.join(directory, "chunks.jsonl"), encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        return cls(
+            terms, docs, tfs, lengths, chunks,
+            k1=meta["k1"] if k1 is None else k1,
+            b=meta["b"] if b is None else b
+        )
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def score(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of every chunk that contains at least one query term.
+
+        Output:
+            (rows, scores) - two arrays of the same length, rows in ascending order
+        """
+        row_parts = []
+        score_parts = []
+        for term, query_count in Counter(tokenize(query)).items():
+            span = self.terms.get(term)
+            if span is None:
+                continue
+            start, end = span
+            rows = np.asarray(self.docs[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            idf = math.log(1 + (len(self.chunks) - (end - start) + 0.5) / (end - start + 0.5))
+            row_parts.append(rows)
+            score_parts.append(query_count * idf * tf * (self.k1 + 1) / (tf + self._length_norms[rows]))
+
+        if not row_parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # Sum the postings of the query terms only: work and memory scale with
+        # the matched postings, not with the corpus. Each term's rows are
+        # already ascending, so one term needs no merging.
+        if len(row_parts) == 1:
+            return row_parts[0].astype(np.int64), score_parts[0]
+        rows = np.concatenate(row_parts)
+        contributions = np.concatenate(score_parts)
+        order = np.argsort(rows, kind="stable")
+        rows = rows[order]
+        contributions = contributions[order]
+        starts = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+        return rows[starts].astype(np.int64), np.add.reduceat(contributions, starts)
+
+    def _chunk(self, row: int, score: float) -> dict:
+        """Chunk dict in the vector_store.search shape."""
+        chunk = self.chunks[row]
+        return {
+            "id": chunk["id"],
+            "text": chunk["text"],
+            "score": float(score),
+            "metadata": dict(chunk["metadata"])
+        }
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        """
+        Same contract as vector_store.search. Chunks without any query term
+        are never returned, so fewer than top_k results are possible.
+
+        Input:
+            query = "knee replacement pain management post operative care instructions"
+            top_k = 5
+        Output:
+            [{"id": "pmid_12345_chunk_0", "text": "...", "score": 11.42, "metadata": {"pmid": "12345"}}, ...]
+        """
+        rows, scores = self.score(query)
+        return [self._chunk(int(rows[position]), scores[position]) for position in _top_positions(scores, top_k)]
+
+    def search_batch(self, queries: list[str], top_k: int = 5) -> list[list[dict]]:
+        """Search each query (see batch_retrieval.batch_search)."""
+        return [self.search(query, top_k=top_k) for query in queries]
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[dict]],
+    top_k: int = 5,
+    rrf_k: int = 60,
+    weights: Optional[list[float]] = None
+) -> list[dict]:
+    """
+    Merge several ranked chunk lists into one with reciprocal-rank fusion.
+
+    Only ranks matter, so dense cosine scores and BM25 scores never need to
+    be put on the same scale. A chunk found by several rankings keeps the
+    dict, and score, from the first ranking it appears in; the fused score
+    is added as rrf_score.
+
+    Input:
+        rankings = [dense_chunks, lexical_chunks]
+        top_k = 5
+    Output:
+        [{"id": "pmid_12345_chunk_0", "text": "...", "score": 0.89, "rrf_score": 0.0328, "metadata": {...}}, ...]
+    """
+    if weights is None:
+        weights = [1.0] * len(rankings)
+    if len(weights) != len(rankings):
+        raise ValueError(f"{len(weights)} weights for {len(rankings)} rankings")
+
+    fused = {}
+    chunks = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk in enumerate(ranking, start=1):
+            chunk_id = chunk["id"]
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + weight / (rrf_k + rank)
+            chunks.setdefault(chunk_id, chunk)
+
+    ordered = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [dict(chunks[chunk_id], rrf_score=round(fused[chunk_id], 6)) for chunk_id in ordered]
+
+
+class HybridStore:
+    """
+    Dense search fused with BM25 search by reciprocal-rank fusion.
+
+    dense           any store with search(query, top_k) (None: the active pipeline's search)
+    lexical         a BM25Index over the same chunks
+    dense_top_k     results to request from the dense store (None: the caller's top_k)
+    lexical_top_k   results to take from the lexical index (at least the caller's top_k)
+    rrf_k           RRF rank offset; larger values flatten the difference between ranks
+    weights         (dense, lexical) weight of each ranking in the fused score
+
+    Usage:
+        store = HybridStore(dense=index, lexical=BM25Index.open("literature_bm25"), dense_top_k=3)
+        store.search("knee replacement dvt prophylaxis", top_k=5)
+    """
+
+    def __init__(
+        self,
+        dense: Optional[object],
+        lexical: BM25Index,
+        dense_top_k: Optional[int] = None,
+        lexical_top_k: int = 20,
+        rrf_k: int = 60,
+        weights: tuple[float, float] = (1.0, 1.0)
+    ):
+        self.dense = dense
+        self.lexical = lexical
+        self.dense_top_k = dense_top_k
+        self.lexical_top_k = lexical_top_k
+        self.rrf_k = rrf_k
+        self.weights = list(weights)
+
+    def _dense_store(self) -> Optional[object]:
+        """
+        The dense store to search: self.dense, else the active pipeline's
+        store or injected search_fn, else None for the vector_store module.
+        A pipeline whose store is this HybridStore also gets None, so the
+        dense half never searches itself.
+        """
+        if self.dense is not None:
+            return self.dense
+        # Imported here: rag_pipeline imports the retrieval modules, not the other way round
+        from rag_pipeline import get_pipeline
+        store = get_pipeline().batch_store
+        if store is self or getattr(store, "search_fn", None) == self.search:
+            return None
+        return store
+
+    def _fuse(self, dense: list[dict], lexical: list[dict], top_k: int) -> list[dict]:
+        return reciprocal_rank_fusion([dense, lexical], top_k=top_k, rrf_k=self.rrf_k, weights=self.weights)
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        """Same contract as vector_store.search, in fused order; rrf_score holds the fused score."""
+        dense_store = self._dense_store()
+        if dense_store is None:
+            from vector_store import search as dense_search
+        else:
+            dense_search = dense_store.search
+        dense = dense_search(query, top_k=self.dense_top_k or top_k)
+        lexical = self.lexical.search(query, top_k=max(top_k, self.lexical_top_k))
+        return self._fuse(dense, lexical, top_k)
+
+    def search_batch(self, queries: list[str], top_k: int = 5) -> list[list[dict]]:
+        """Batched dense search (see batch_retrieval.batch_search), fused per query."""
+        dense = batch_search(queries, top_k=self.dense_top_k or top_k, store=self._dense_store())
+        lexical = self.lexical.search_batch(queries, top_k=max(top_k, self.lexical_top_k))
+        return [self._fuse(d, l, top_k) for d, l in zip(dense, lexical)]
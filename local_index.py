@@ -0,0 +1,270 @@
+# local_index.py
+"""
+Local Vector Index for PostopCare
+
+In-process replacement for the Pinecone-backed vector_store.search. It has
+the same search(query, top_k) contract and returns the same chunk dicts
+(id/text/score/metadata), so it can be passed anywhere the pipeline accepts
+a store:
+
+    index = LocalVectorIndex.open("literature_index", embed_fn=embed_texts)
+    generate_full_handout("knee replacement", store=index, batch_retrieval=True)
+
+On-disk layout (one directory per index):
+    embeddings.npy   float32 matrix, one L2-normalized row per chunk (memory-mapped)
+    chunks.jsonl     metadata sidecar, one {"id", "text", "metadata"} per row
+    ivf_centroids.npy, ivf_order.npy, ivf_offsets.npy
+                     optional cluster partitions for approximate search
+
+Search modes:
+    exact  - one matrix-vector product over every row, then argpartition for top-k
+    ivf    - score the cluster centroids, then only the rows of the nprobe
+             closest clusters (much faster on large corpora, approximate)
+
+Setup:
+    pip install numpy
+
+embed_fn takes a list of texts and returns one vector per text (a list of
+lists or a 2-D array). Use the same embedding model the index was built with.
+"""
+
+import json
+import logging
+import os
+from typing import Callable, Optional
+
+import numpy as np
+
+logger = logging.getLogger("local_index")
+
+EmbedFn = Callable[[list[str]], "np.ndarray | list[list[float]]"]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _kmeans(matrix: np.ndarray, n_clusters: int, iterations: int = 20, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means over normalized rows.
+
+    Returns (centroids, assignments). Rows are assigned to the centroid with
+    the highest dot product, matching how queries are routed at search time.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), size=n_clusters, replace=False)].copy()
+    assignments = np.zeros(len(matrix), dtype=np.int32)
+    for iteration in range(iterations):
+        new_assignments = np.argmax(matrix @ centroids.T, axis=1).astype(np.int32)
+        if np.array_equal(new_assignments, assignments) and iteration > 0:
+            break
+        assignments = new_assignments
+        for cluster in range(n_clusters):
+            members = matrix[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids.astype(np.float32), assignments
+
+
+def _top_positions(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of the top_k scores, best first, without sorting every score."""
+    k = min(top_k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class LocalVectorIndex:
+    """
+    Memory-mapped float32 vector index with exact and IVF search.
+
+    Usage:
+        LocalVectorIndex.build("literature_index", chunks, embed_fn, n_clusters=256)
+        index = LocalVectorIndex.open("literature_index", embed_fn, mode="ivf", nprobe=8)
+        index.search("knee replacement pain management", top_k=5)
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        chunks: list[dict],
+        embed_fn: Optional[EmbedFn] = None,
+        mode: str = "exact",
+        nprobe: int = 8,
+        centroids: Optional[np.ndarray] = None,
+        order: Optional[np.ndarray] = None,
+        offsets: Optional[np.ndarray] = None
+    ):
+        if len(embeddings) != len(chunks):
+            raise ValueError(f"{len(embeddings)} embeddings but {len(chunks)} chunks")
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Unknown search mode: {mode!r}")
+        if mode == "ivf" and centroids is None:
+            raise ValueError("IVF mode needs an index built with n_clusters")
+        self.embeddings = embeddings
+        self.chunks = chunks
+        self.embed_fn = embed_fn
+        self.mode = mode
+        self.nprobe = nprobe
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def build(
+        cls,
+        directory: str,
+        chunks: list[dict],
+        embed_fn: EmbedFn,
+        n_clusters: Optional[int] = None,
+        batch_size: int = 256
+    ) -> "LocalVectorIndex":
+        """
+        Embed chunks and write a new index directory.
+
+        Input:
+            directory = "literature_index"
+            chunks = [
+                {"id": "pmid_12345_chunk_0", "text": "Studies show...", "metadata": {"pmid": "12345"}}
+            ]
+            embed_fn = embed_texts
+            n_clusters = 256  # Optional, enables mode="ivf"
+        """
+        if not chunks:
+            raise ValueError("Cannot build an index with no chunks")
+        os.makedirs(directory, exist_ok=True)
+
+        # Normalize each batch straight into a memmap: only one batch of
+        # embeddings is ever held in memory, however large the matrix
+        path = os.path.join(directory, "embeddings.npy")
+        matrix = None
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            vectors = np.asarray(embed_fn([chunk["text"] for chunk in batch]), dtype=np.float32)
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=np.float32, shape=(len(chunks), vectors.shape[1])
+                )
+            matrix[start:start + len(batch)] = _normalize_rows(vectors)
+        matrix.flush()
+        del matrix
+
+        with open(os.path.join(directory, "chunks.jsonl"), "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                record = {"id": chunk["id"], "text": chunk["text"], "metadata": chunk.get("metadata", {})}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        if n_clusters:
+            n_clusters = min(n_clusters, len(chunks))
+            centroids, assignments = _kmeans(np.load(path, mmap_mode="r"), n_clusters)
+            order = np.argsort(assignments, kind="stable").astype(np.int64)
+            counts = np.bincount(assignments, minlength=n_clusters)
+            offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            np.save(os.path.join(directory, "ivf_centroids.npy"), centroids)
+            np.save(os.path.join(directory, "ivf_order.npy"), order)
+            np.save(os.path.join(directory, "ivf_offsets.npy"), offsets)
+
+        logger.info(f"Built index '{directory}' with {len(chunks)} chunks ({n_clusters or 0} clusters)")
+        return cls.open(directory, embed_fn)
+
+    @classmethod
+    def open(
+        cls,
+        directory: str,
+        embed_fn: Optional[EmbedFn] = None,
+        mode: str = "exact",
+        nprobe: int = 8
+    ) -> "LocalVectorIndex":
+        """Open an index directory, memory-mapping the embedding matrix."""
+        embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "chunks.jsonl"), encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+
+        centroids = order = offsets = None
+        centroids_path = os.path.join(directory, "ivf_centroids.npy")
+        if os.path.exists(centroids_path):
+            centroids = np.load(centroids_path)
+            order = np.load(os.path.join(directory, "ivf_order.npy"))
+            offsets = np.load(os.path.join(directory, "ivf_offsets.npy"))
+
+        return cls(embeddings, chunks, embed_fn, mode, nprobe, centroids, order, offsets)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        if self.embed_fn is None:
+            raise ValueError("This index was opened without an embed_fn; use search_vector() instead")
+        return _normalize_rows(np.asarray(self.embed_fn(texts), dtype=np.float32))
+
+    def _candidates(self, query_vector: np.ndarray) -> Optional[np.ndarray]:
+        """Row ids to score for a query, or None to score every row."""
+        if self.mode != "ivf":
+            return None
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query_vector
+        clusters = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in clusters])
+
+    def search_vector(self, query_vector, top_k: int = 5) -> list[dict]:
+        """Return the top_k chunks for an already-embedded query."""
+        query_vector = np.asarray(query_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+
+        candidates = self._candidates(query_vector)
+        if candidates is None:
+            scores = self.embeddings @ query_vector
+            rows = None
+        else:
+            candidates.sort()  # Sequential reads from the memory map
+            scores = self.embeddings[candidates] @ query_vector
+            rows = candidates
+
+        results = []
+        for position in _top_positions(scores, top_k):
+            row = int(position if rows is None else rows[position])
+            results.append(self._chunk(row, scores[position]))
+        return results
+
+    def _chunk(self, row: int, score: float) -> dict:
+        """Chunk dict in the vector_store.search shape."""
+        chunk = self.chunks[row]
+        return {
+            "id": chunk["id"],
+            "text": chunk["text"],
+            "score": float(score),
+            "metadata": dict(chunk["metadata"])
+        }
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        """
+        Same contract as vector_store.search.
+
+        Input:
+            query = "knee replacement pain management post operative care instructions"
+            top_k = 5
+        Output:
+            [{"id": "pmid_12345_chunk_0", "text": "...", "score": 0.89, "metadata": {"pmid": "12345"}}, ...]
+        """
+        return self.search_vector(self._embed([query])[0], top_k=top_k)
+
+    def search_batch(self, queries: list[str], top_k: int = 5) -> list[list[dict]]:
+        """Embed all queries in one call and search each (see batch_retrieval.batch_search)."""
+        if not queries:
+            return []
+        vectors = self._embed(queries)
+        if self.mode == "exact":
+            # One matrix-matrix product scores every query against every row
+            scores = np.asarray(self.embeddings @ vectors.T)
+            return [
+                [self._chunk(int(row), scores[row, column]) for row in _top_positions(scores[:, column], top_k)]
+                for column in range(scores.shape[1])
+            ]
+        return [self.search_vector(vector, top_k=top_k) for vector in vectors]
@@ -0,0 +1,279 @@
+# metrics.py
+"""
+Stage Latency Metrics for PostopCare
+
+Structured timing for each step of the RAG pipeline, so a slow handout can
+be traced to retrieval, the LLM or our own code:
+
+    semantic_lookup Semantic cache lookup, when one is used (see semantic_cache.py)
+    query_build     Step 1 - build the search query
+    retrieval       Step 2 - vector store search (or cache)
+    context_format  Step 3 - pack and format context
+    prompt_load     Step 4 - load the prompt template
+    llm_call        Step 5 - LLM generation (or cache)
+    assembly        Step 6 - build the result dict
+    section_total   Steps 1-6 together
+    llm_request     One LLM request, per attempt or hedge (see call_policy.py)
+
+Each section records its timings in result["metadata"]["timings_ms"] and in
+a process-wide MetricsRegistry, which keeps a histogram per stage and can be
+exported as a JSON snapshot (with p50/p95/p99) or as Prometheus text format.
+The registry also holds plain event counters (e.g. coalesced requests, see
+single_flight.py) and labeled histograms for latencies that are not pipeline
+stages (e.g. queue wait per priority, see handout_service.py), each exported
+as its own Prometheus metric.
+
+Setup:
+    No additional pip installs required
+
+Usage:
+    from metrics import REGISTRY
+    REGISTRY.snapshot()["retrieval"]
+    # {"count": 120, "sum_seconds": 54.1, "p50_ms": 402.3, "p95_ms": 810.9, "p99_ms": 1210.4, ...}
+    REGISTRY.export_prometheus("metrics.prom")
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Prometheus histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class LatencyHistogram:
+    """
+    Latency histogram with cumulative buckets and a sample reservoir.
+
+    Buckets feed the Prometheus export. Percentiles come from a uniform
+    reservoir sample of at most reservoir_size observations, so memory stays
+    bounded however many sections are generated.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, reservoir_size: int = 4096):
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.reservoir_size = reservoir_size
+        self.samples = []
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+            if len(self.samples) < self.reservoir_size:
+                self.samples.append(seconds)
+            else:
+                slot = self._random.randrange(self.count)
+                if slot < self.reservoir_size:
+                    self.samples[slot] = seconds
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Nearest-rank percentile in seconds (p in 0-100), or None with no samples."""
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        rank = max(1, math.ceil(p / 100 * len(samples)))
+        return samples[rank - 1]
+
+    def buckets_state(self) -> tuple[list[int], int, float]:
+        """Consistent copy of (bucket_counts, count, sum)."""
+        with self._lock:
+            return list(self.bucket_counts), self.count, self.sum
+
+    def snapshot(self) -> dict:
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        with self._lock:
+            count, total = self.count, self.sum
+        return {
+            "count": count,
+            "sum_seconds": round(total, 6),
+            "mean_ms": ms(total / count) if count else None,
+            "p50_ms": ms(self.percentile(50)),
+            "p95_ms": ms(self.percentile(95)),
+            "p99_ms": ms(self.percentile(99))
+        }
+
+
+class MetricsRegistry:
+    """
+    Named latency histograms, one per pipeline stage, named event counters
+    and labeled histograms, one metric per (metric, label) pair.
+    """
+
+    def __init__(self, prefix: str = "postopcare"):
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        # {(metric, label): {label value: LatencyHistogram}}
+        self._labeled = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = LatencyHistogram()
+            return self._histograms[name]
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.histogram(name).observe(seconds)
+
+    def labeled_histogram(self, metric: str, label: str, value: str) -> LatencyHistogram:
+        """
+        Histogram exported as {prefix}_{metric}{label="value"}, apart from
+        the stage latencies.
+
+        Input:
+            metric = "queue_wait_seconds"
+            label = "priority"
+            value = "interactive"
+        """
+        with self._lock:
+            histograms = self._labeled.setdefault((metric, label), {})
+            if value not in histograms:
+                histograms[value] = LatencyHistogram()
+            return histograms[value]
+
+    def observe_labeled(self, metric: str, label: str, value: str, seconds: float) -> None:
+        self.labeled_histogram(metric, label, value).observe(seconds)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._labeled.clear()
+
+    def snapshot(self) -> dict:
+        """
+        Per-stage count, sum and p50/p95/p99 in milliseconds, plus a
+        "counters" entry when any event has been counted and one entry per
+        labeled metric, keyed by label value.
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(sorted(self._counters.items()))
+            labeled = {metric: dict(values) for (metric, _), values in self._labeled.items()}
+        snapshot = {name: histogram.snapshot() for name, histogram in sorted(histograms.items())}
+        if counters:
+            snapshot["counters"] = counters
+        for metric, values in sorted(labeled.items()):
+            snapshot[metric] = {value: histogram.snapshot() for value, histogram in sorted(values.items())}
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """Render every histogram and counter in Prometheus text exposition format."""
+        metric = f"{self.prefix}_stage_latency_seconds"
+        lines = [
+            f"# HELP {metric} Latency of RAG pipeline stages.",
+            f"# TYPE {metric} histogram"
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for name, histogram in histograms:
+            lines.extend(_histogram_lines(metric, "stage", name, histogram))
+
+        with self._lock:
+            labeled = sorted((key, sorted(values.items())) for key, values in self._labeled.items())
+        for (name, label), values in labeled:
+            labeled_metric = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {labeled_metric} Latency by {label}.")
+            lines.append(f"# TYPE {labeled_metric} histogram")
+            for value, histogram in values:
+                lines.extend(_histogram_lines(labeled_metric, label, value, histogram))
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+        if counters:
+            counter_metric = f"{self.prefix}_events_total"
+            lines.append(f"# HELP {counter_metric} Count of pipeline events.")
+            lines.append(f"# TYPE {counter_metric} counter")
+            for name, value in counters:
+                lines.append(f'{counter_metric}{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def export_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def export_prometheus(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+
+def _histogram_lines(metric: str, label: str, value: str, histogram: LatencyHistogram) -> list[str]:
+    """Prometheus bucket, sum and count lines of one histogram."""
+    bucket_counts, count, total = histogram.buckets_state()
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip(histogram.buckets, bucket_counts):
+        cumulative += bucket_count
+        lines.append(f'{metric}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{label}="{value}",le="+Inf"}} {count}')
+    lines.append(f'{metric}_sum{{{label}="{value}"}} {total}')
+    lines.append(f'{metric}_count{{{label}="{value}"}} {count}')
+    return lines
+
+
+# Process-wide registry the pipeline reports into
+REGISTRY = MetricsRegistry()
+
+
+class StageTimer:
+    """
+    Times the stages of one section and reports them to a registry.
+
+    A stage timed in several pieces (e.g. a streamed LLM call) is summed and
+    reported to the registry once, by report().
+
+    Usage:
+        timer = StageTimer()
+        with timer.stage("retrieval"):
+            chunks = vector_search(query, top_k=5)
+        timer.report()  # {"retrieval": 402.31}
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = REGISTRY if registry is None else registry
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def timings_ms(self) -> dict:
+        return {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()}
+
+    def report(self) -> dict:
+        """Send every stage total to the registry and return the timings in milliseconds."""
+        for name, seconds in self.timings.items():
+            self.registry.observe(name, seconds)
+        return self.timings_ms()
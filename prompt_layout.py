@@ -0,0 +1,128 @@
+# prompt_layout.py
+"""
+Prefix-Stable Prompt Layout for PostopCare
+
+LLM providers cache the longest previously seen prompt prefix (OpenAI from
+1024 tokens, in 128-token steps) and bill and serve those tokens faster.
+The standard layout gives every section its own context, ordered by
+retrieval score, so two sections of the same handout share nothing after
+the system prompt and the cache never hits.
+
+The prefix-stable layout orders each section's prompt from most to least
+shared:
+
+    1. System prompt                      identical for every call
+    2. Shared context block               identical for every section of the handout:
+                                          the procedure, then the chunks retrieved
+                                          for at least min_sections sections, by id
+    3. Section-specific chunks            whatever the section retrieved on top of the block
+    4. Instruction                        "Write wound care instructions for ..."
+
+Shared chunks are numbered first, so [Source N] refers to the same chunk in
+every section and sources lists them first.
+
+Setup:
+    No additional pip installs required
+
+Usage:
+    chunks_by_section = retrieve_sections("knee replacement", DEFAULT_SECTIONS)
+    shared = build_shared_context("knee replacement", chunks_by_section, token_budget=1000)
+    generate_handout_section("knee replacement", "wound_care",
+                             retrieved_chunks=chunks_by_section["wound_care"], shared_context=shared)
+"""
+
+from typing import Optional
+
+from context_packing import estimate_tokens, pack_context, ranking_score
+
+PROMPT_LAYOUTS = ("standard", "prefix_stable")
+
+# A chunk must be retrieved for this many sections to join the shared block
+SHARED_MIN_SECTIONS = 2
+
+
+def format_sources(chunks: list[dict], start: int = 1) -> str:
+    """
+    Label chunks as numbered sources for the LLM context.
+
+    Output:
+        "[Source 1: PMID 12345]\nStudies show...\n\n[Source 2: PMID 67890]\nIce therapy..."
+    """
+    parts = []
+    for i, chunk in enumerate(chunks, start=start):
+        source_info = f"[Source {i}: PMID {chunk['metadata'].get('pmid', 'unknown')}]"
+        parts.append(f"{source_info}\n{chunk['text']}")
+    return "\n\n".join(parts)
+
+
+def build_shared_context(
+    procedure: str,
+    chunks_by_section: dict[str, list[dict]],
+    min_sections: int = SHARED_MIN_SECTIONS,
+    token_budget: Optional[int] = None
+) -> dict:
+    """
+    Build the context block shared by every section of one handout.
+
+    Chunks retrieved for at least min_sections sections are packed (near-
+    duplicates dropped, best score first while they fit token_budget) and
+    then ordered by id, so the block does not depend on which section
+    ranked a chunk highest.
+
+    Input:
+        procedure = "knee replacement"
+        chunks_by_section = {"pain_management": [...], "wound_care": [...]}
+        token_budget = 1000
+
+    Output:
+        {
+            "procedure": "knee replacement",
+            "chunks": [{"id": "pmid_12345_chunk_0", ...}, ...],
+            "block": "Procedure: knee replacement\n\n[Source 1: PMID 12345]\n...",
+            "tokens": 640
+        }
+    """
+    counts = {}
+    best = {}
+    for chunks in chunks_by_section.values():
+        for chunk in {chunk["id"]: chunk for chunk in chunks}.values():
+            counts[chunk["id"]] = counts.get(chunk["id"], 0) + 1
+            if chunk["id"] not in best or ranking_score(chunk) > ranking_score(best[chunk["id"]]):
+                best[chunk["id"]] = chunk
+
+    candidates = [best[chunk_id] for chunk_id in sorted(best) if counts[chunk_id] >= min_sections]
+    shared = []
+    if candidates:
+        packed, _ = pack_context(candidates, token_budget=token_budget)
+        shared = sorted(packed, key=lambda chunk: chunk["id"])
+
+    block = f"Procedure: {procedure}"
+    if shared:
+        block += "\n\n" + format_sources(shared)
+    return {"procedure": procedure, "chunks": shared, "block": block, "tokens": estimate_tokens(block)}
+
+
+def layout_context(
+    shared: dict,
+    retrieved_chunks: list[dict],
+    token_budget: Optional[int] = None
+) -> tuple[list[dict], str, dict]:
+    """
+    Shared block followed by the section's own chunks.
+
+    Chunks already in the shared block are skipped; the rest are packed into
+    what is left of token_budget after the block.
+
+    Output:
+        (shared chunks + section chunks, context, pack_context stats of the section chunks)
+    """
+    shared_ids = {chunk["id"] for chunk in shared["chunks"]}
+    own = [chunk for chunk in retrieved_chunks if chunk["id"] not in shared_ids]
+    if token_budget is not None:
+        token_budget = max(0, token_budget - shared["tokens"])
+    section_chunks, packing = pack_context(own, token_budget=token_budget) if own else ([], {"duplicates_removed": 0})
+
+    context = shared["block"]
+    if section_chunks:
+        context += "\n\n" + format_sources(section_chunks, start=len(shared["chunks"]) + 1)
+    return shared["chunks"] + section_chunks, context, packing
@@ -18,39 +18,415 @@ Setup:
     And that Pinecone index has been populated with medical literature (Ticket 1 + 4 + 5)
 """
 
+import copy
+import hashlib
+import json
 import logging
-from typing import Optional
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
 from datetime import datetime
 
 # Import our modules
-from vector_store import search as vector_search
-from llm_client import generate_with_context
-from prompt_manager import PromptManager
-from citation_formatter import format_reference_list
-
-# Set up logging - this helps us debug the pipeline
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# vector_store, llm_client and prompt_manager are imported by RAGPipeline on
+# first use, so importing this module does not start any clients
+from batch_retrieval import SearchFnStore, batch_search
+from call_policy import CallPolicy, Deadline, call_with_policy
+from cache import MISSING, GenerationCache, RetrievalCache, generation_key
+from context_packing import estimate_tokens, pack_context
+from metrics import StageTimer
+from prompt_layout import PROMPT_LAYOUTS, build_shared_context, format_sources, layout_context
+from single_flight import SingleFlight
+
 logger = logging.getLogger("rag_pipeline")
 
-# Initialize prompt manager
-prompt_manager = PromptManager()
+# Model and system prompt used for every section
+MODEL_NAME = "gpt-4o-mini"
+SYSTEM_PROMPT = "You are a medical writer creating patient-friendly post-operative instructions. Write at a 6th-8th grade reading level. Be specific and actionable."
+
+# Token budget for the retrieved literature in each section's LLM context
+CONTEXT_TOKEN_BUDGET = 2000
+
+# Default sections for a complete handout
+DEFAULT_SECTIONS = [
+    "overview",
+    "pain_management",
+    "activity_restrictions",
+    "wound_care",
+    "warning_signs",
+    "follow_up"
+]
+
+# Concurrent identical section requests share one in-flight generation
+SECTION_FLIGHTS = SingleFlight("section_generation")
+
+# Marks a dependency that has not been loaded yet (None is a valid stream_fn)
+_UNSET = object()
+
+
+class RAGPipeline:
+    """
+    The pipeline's external dependencies, created on first use.
+
+    Nothing is imported or connected until a section needs it: the first
+    search imports vector_store, the first generation imports llm_client and
+    the first prompt builds the PromptManager. Tools that only use part of
+    the pipeline (or only citations) never pay for the rest, and forked
+    worker processes create their own clients after the fork.
+
+    Pass search_fn, generate_fn, stream_fn or prompt_manager to use something
+    other than the default modules. A store (any object with
+    search(query, top_k), see batch_retrieval.py) replaces vector_store for
+    both per-section and batched retrieval. Pass model when generate_fn
+    calls a model other than MODEL_NAME, so cache keys and handout metadata
+    name the right one.
+
+    Usage:
+        pipeline = RAGPipeline()
+        pipeline.warmup()            # optional: connect and load templates before traffic
+        set_pipeline(pipeline)       # the module-level functions now use it
+    """
+
+    def __init__(
+        self,
+        search_fn: Optional[Callable] = None,
+        generate_fn: Optional[Callable] = None,
+        stream_fn: Optional[Callable] = None,
+        prompt_manager: Optional[object] = None,
+        store: Optional[object] = None,
+        model: Optional[str] = None
+    ):
+        self._injected_search_fn = search_fn
+        if search_fn is None and store is not None:
+            search_fn = store.search
+        self.store = store
+        # Model the generate_fn calls; recorded in metadata and cache keys
+        self.model = model or MODEL_NAME
+        # Backend clients owned by this pipeline, by name (see client_pool.py)
+        self.backends = {}
+        self._search_fn = _UNSET if search_fn is None else search_fn
+        self._generate_fn = _UNSET if generate_fn is None else generate_fn
+        # An injected generate_fn without a stream_fn means "do not stream"
+        self._stream_fn = _UNSET if stream_fn is None and generate_fn is None else stream_fn
+        self._prompt_manager = _UNSET if prompt_manager is None else prompt_manager
+        self._lock = threading.Lock()
+
+    def _load(self, attribute: str, loader: Callable):
+        value = getattr(self, attribute)
+        if value is _UNSET:
+            with self._lock:
+                value = getattr(self, attribute)
+                if value is _UNSET:
+                    value = loader()
+                    setattr(self, attribute, value)
+        return value
+
+    @property
+    def vector_search(self) -> Callable:
+        """vector_store.search, imported on first use."""
+        def load():
+            from vector_store import search
+            return search
+        return self._load("_search_fn", load)
+
+    @property
+    def batch_store(self) -> Optional[object]:
+        """
+        Store for batched retrieval: the pipeline's store, else an injected
+        search_fn searched query by query, else None (batch_search then uses
+        the vector_store module, which vector_search would load too).
+        """
+        if self.store is not None:
+            return self.store
+        if self._injected_search_fn is not None:
+            return SearchFnStore(self._injected_search_fn)
+        return None
+
+    @property
+    def generate_with_context(self) -> Callable:
+        """llm_client.generate_with_context, imported on first use."""
+        def load():
+            from llm_client import generate_with_context
+            return generate_with_context
+        return self._load("_generate_fn", load)
+
+    @property
+    def stream_with_context(self) -> Optional[Callable]:
+        """llm_client.stream_with_context, or None when the client cannot stream."""
+        def load():
+            import llm_client
+            return getattr(llm_client, "stream_with_context", None)
+        return self._load("_stream_fn", load)
+
+    @property
+    def prompt_manager(self):
+        """The PromptManager, created on first use."""
+        def load():
+            from prompt_manager import PromptManager
+            return PromptManager()
+        return self._load("_prompt_manager", load)
+
+    def warmup(self, sections: Optional[list[str]] = None) -> dict:
+        """
+        Load every dependency now instead of on the first request.
+
+        Imports the clients, calls a module-level warmup() on vector_store and
+        llm_client when they define one (e.g. to open connections), and loads
+        the prompt template for each section. Returns the seconds each step
+        took.
+
+        Output:
+            {"vector_store": 0.41, "llm_client": 0.22, "prompt_manager": 0.03}
+        """
+        timings = {}
+        for name, attributes in (
+            ("vector_store", ("vector_search",)),
+            ("llm_client", ("generate_with_context", "stream_with_context"))
+        ):
+            start = time.perf_counter()
+            functions = [getattr(self, attribute) for attribute in attributes]
+            module = sys.modules.get(getattr(functions[0], "__module__", None) or "")
+            module_warmup = getattr(module, "warmup", None)
+            if callable(module_warmup):
+                module_warmup()
+            timings[name] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        manager = self.prompt_manager
+        for section in (DEFAULT_SECTIONS if sections is None else sections):
+            try:
+                manager.get_prompt(section, procedure_name="", context="")
+            except Exception as e:
+                logger.warning(f"Warmup could not load prompt template '{section}': {e}")
+        timings["prompt_manager"] = round(time.perf_counter() - start, 3)
+        logger.info(f"Pipeline warmed up: {timings}")
+        return timings
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> RAGPipeline:
+    """The pipeline the module-level functions use, created on first call."""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = RAGPipeline()
+    return _pipeline
+
+
+def set_pipeline(pipeline: RAGPipeline) -> None:
+    """Make the module-level functions use pipeline."""
+    global _pipeline
+    with _pipeline_lock:
+        _pipeline = pipeline
+
+
+def __getattr__(name: str):
+    # rag_pipeline.vector_search / generate_with_context / prompt_manager used
+    # to be module globals; keep them readable without importing eagerly
+    if name in ("vector_search", "generate_with_context", "prompt_manager"):
+        return getattr(get_pipeline(), name)
+    raise AttributeError(f"module 'rag_pipeline' has no attribute '{name}'")
+
+
+def build_search_query(procedure: str, section: str) -> str:
+    """
+    Build the vector store query for one section of a handout.
+    
+    Input:
+        procedure = "knee replacement"
+        section = "pain_management"
+    Output:
+        "knee replacement pain management post operative care instructions"
+    """
+    return f"{procedure} {section.replace('_', ' ')} post operative care instructions"
+
+
+def prompt_template_version(section: str) -> str:
+    """
+    Version of the prompt template for a section.
+    
+    Uses prompt_manager.template_version(section) (or a template_version
+    attribute) when the PromptManager provides one; otherwise a hash of the
+    template rendered with placeholder values, so any edit to the template
+    changes the version.
+    """
+    manager = get_pipeline().prompt_manager
+    version = getattr(manager, "template_version", None)
+    if callable(version):
+        version = version(section)
+    if version is None:
+        template = manager.get_prompt(section, procedure_name="{procedure_name}", context="{context}")
+        version = hashlib.sha256(str(template).encode("utf-8")).hexdigest()[:16]
+    return str(version)
+
+
+def section_fingerprint(
+    procedure: str,
+    section: str,
+    chunk_ids: list[str],
+    prompt_version: str,
+    model: str = MODEL_NAME
+) -> str:
+    """
+    Fingerprint of everything that decides a section's content.
+    
+    Two runs with the same fingerprint send the LLM the same chunks with the
+    same template and model, so the earlier content can be reused.
+    
+    Input:
+        procedure = "knee replacement"
+        section = "pain_management"
+        chunk_ids = ["pmid_12345_chunk_0", "pmid_67890_chunk_2"]
+        prompt_version = "a41c09e2d6b7f318"
+    Output:
+        "9b2e5d..."  # 64 hex characters
+    """
+    payload = json.dumps([procedure, section, list(chunk_ids), prompt_version, model, SYSTEM_PROMPT])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def previous_sections(previous_handout: Optional[dict]) -> dict[str, dict]:
+    """Sections of an earlier handout by section key, for incremental regeneration."""
+    if not previous_handout:
+        return {}
+    return {
+        entry["name"].lower().replace(" ", "_"): entry
+        for entry in previous_handout.get("sections", [])
+    }
+
+
+def _search(
+    query: str,
+    top_k: int,
+    store: Optional[object] = None,
+    retrieval_cache: Optional[RetrievalCache] = None
+) -> list[dict]:
+    """Search the given store (or the Pinecone vector store), going through the cache if one is given."""
+    search_fn = get_pipeline().vector_search if store is None else store.search
+    if retrieval_cache is None:
+        return search_fn(query, top_k=top_k)
+    return retrieval_cache.search(query, top_k=top_k, search_fn=search_fn)
+
+
+def retrieve_sections(
+    procedure: str,
+    sections: list[str],
+    top_k: int = 5,
+    store: Optional[object] = None,
+    retrieval_cache: Optional[RetrievalCache] = None
+) -> dict[str, list[dict]]:
+    """
+    Retrieve chunks for every section of a handout in one batched search.
+    
+    All section queries are embedded together and sent as one multi-query
+    search (see batch_retrieval.py), instead of one round trip per section.
+    With a retrieval_cache, only the queries that miss the cache are searched.
+    
+    Input:
+        procedure = "knee replacement"
+        sections = ["pain_management", "wound_care"]
+        top_k = 5
+    
+    Output:
+        {
+            "pain_management": [{"id": "pmid_12345_chunk_0", "text": "...", "score": 0.89, "metadata": {...}}, ...],
+            "wound_care": [{"id": "pmid_67890_chunk_2", "text": "...", "score": 0.85, "metadata": {...}}, ...]
+        }
+    """
+    queries = [build_search_query(procedure, section) for section in sections]
+    results = [MISSING] * len(queries)
+    if retrieval_cache is not None:
+        results = [retrieval_cache.get(retrieval_cache.make_key(query, top_k)) for query in queries]
+    
+    missing = [i for i, chunks in enumerate(results) if chunks is MISSING]
+    if missing:
+        if store is None:
+            store = get_pipeline().batch_store
+        fetched = batch_search([queries[i] for i in missing], top_k=top_k, store=store)
+        for i, chunks in zip(missing, fetched):
+            results[i] = chunks
+            if retrieval_cache is not None:
+                retrieval_cache.set(retrieval_cache.make_key(queries[i], top_k), chunks)
+    logger.info(
+        f"Batch retrieval - {len(missing)} of {len(queries)} queries for '{procedure}' searched in one batch"
+    )
+    return dict(zip(sections, results))
 
 
 def generate_handout_section(
     procedure: str,
     section: str,
-    top_k: int = 5
+    top_k: int = 5,
+    retrieved_chunks: Optional[list[dict]] = None,
+    store: Optional[object] = None,
+    retrieval_cache: Optional[RetrievalCache] = None,
+    generation_cache: Optional[GenerationCache] = None,
+    token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+    previous_section: Optional[dict] = None,
+    call_policy: Optional[CallPolicy] = None,
+    deadline: Optional[Deadline] = None,
+    semantic_cache: Optional[object] = None,
+    shared_context: Optional[dict] = None
 ) -> dict:
     """
     Generate a single handout section using RAG.
     
+    Pass retrieved_chunks to skip step 2 when chunks were already fetched,
+    e.g. by retrieve_sections(). Pass store to search something other than
+    the Pinecone vector store (any object with search(query, top_k)). Pass a
+    RetrievalCache (see cache.py) to serve repeated queries without a search,
+    and a GenerationCache to reuse the LLM output when the prompt, context,
+    system prompt and model all match an earlier call.
+    
+    Step 3 packs the context (see context_packing.py): near-duplicate chunks
+    are dropped and the rest are kept by score until token_budget is full
+    (None disables the budget). "sources" lists only the chunks that made it
+    into the context, in [Source N] order.
+    
+    Every step is timed (see metrics.py): the timings are returned in
+    metadata["timings_ms"] and recorded in the process-wide metrics.REGISTRY
+    histograms.
+    
+    metadata["fingerprint"] identifies the chunks, prompt template and model
+    the content was generated from (see section_fingerprint). Pass the same
+    section of an earlier handout as previous_section: if its fingerprint
+    matches, its content is reused and the LLM is not called
+    (metadata["reused"] is True).
+    
+    Pass a CallPolicy (see call_policy.py) to give the LLM call a timeout,
+    retries with jittered backoff and hedging, and a Deadline to bound it by
+    a handout-wide deadline. A section that starts after the deadline, or
+    reaches its LLM call after it, raises DeadlineExceeded; retrieval itself
+    is not interrupted. metadata reports llm_retries,
+    llm_hedges and llm_timeouts; on failure they are on the error's
+    call_stats.
+    
+    Pass a SemanticCache (see semantic_cache.py) to answer near-duplicate
+    requests ("TKA" vs "total knee arthroplasty") from an earlier section:
+    if the procedure is similar enough to a cached one for the same section,
+    top_k, model, prompt template version and cache index_version, the
+    cached sources and content are returned without retrieval or an LLM
+    call, and metadata["semantic_cache"] records the matched procedure,
+    similarity and original procedure. A served section has no fingerprint,
+    so it is never reused as another procedure's previous_section.
+    
+    Pass the handout's shared_context (see prompt_layout.py) for the
+    prefix-stable layout: the context starts with the block shared by every
+    section, so the provider's prompt cache can reuse it across sections.
+    metadata reports the prompt_layout and how much of the prompt is the
+    shared prefix (shared_prefix_chars, shared_prefix_tokens); in the
+    standard layout that is only the system prompt.
+    
     Pipeline Steps:
         1. Build search query from procedure + section
         2. Retrieve relevant chunks from vector store
-        3. Format context from retrieved chunks
+        3. Pack and format context from retrieved chunks
         4. Load prompt template for section type
         5. Call LLM with context + prompt
         6. Return generated content with sources
@@ -81,79 +457,399 @@ def generate_handout_section(
             ],
             "metadata": {
                 "chunks_retrieved": 5,
-                "chunks_used": 5,
+                "chunks_used": 2,
+                "duplicates_removed": 1,
+                "context_tokens": 1450,
                 "model": "gpt-4o-mini",
-                "generated_at": "2025-01-15T10:30:00Z"
+                "generation_cached": False,
+                "reused": False,
+                "fingerprint": "9b2e5d...",
+                "prompt_layout": "standard",
+                "shared_prefix_chars": 147,
+                "shared_prefix_tokens": 37,
+                "llm_retries": 0,
+                "llm_hedges": 1,
+                "llm_timeouts": 0,
+                "generated_at": "2025-01-15T10:30:00Z",
+                "timings_ms": {
+                    "query_build": 0.012,
+                    "retrieval": 412.7,
+                    "context_format": 0.9,
+                    "prompt_load": 0.2,
+                    "llm_call": 6890.4,
+                    "assembly": 0.05,
+                    "section_total": 7304.3
+                }
             }
         }
     """
     logger.info(f"=== Generating '{section}' section for '{procedure}' ===")
+    if deadline is not None:
+        deadline.check(f"Handout section '{section}'")
+    section_start = time.perf_counter()
+    timer = StageTimer()
+    
+    # A near-duplicate earlier request answers the whole section
+    if semantic_cache is not None:
+        # Only the procedure is embedded: the section text and query suffix
+        # are the same for every procedure and would inflate similarity
+        with timer.stage("semantic_lookup"):
+            scope = (
+                section, top_k, get_pipeline().model, prompt_template_version(section),
+                getattr(semantic_cache, "index_version", None)
+            )
+            hit = semantic_cache.lookup(procedure, scope=scope)
+        if hit is not None:
+            return _semantic_result(procedure, section, hit, timer, section_start)
+    
+    # Steps 1-4: query, retrieval, context and prompt
+    prepared = _prepare_section(
+        procedure, section, top_k, retrieved_chunks, store, retrieval_cache, token_budget, timer, shared_context
+    )
+    
+    # Step 5: Call LLM with context (unless the previous content still applies)
+    generate_with_context = get_pipeline().generate_with_context
+    call_stats = {}
+    if call_policy is not None or deadline is not None:
+        generate_with_context = _with_policy(generate_with_context, call_policy or CallPolicy(), deadline, call_stats)
+    reused = _can_reuse(previous_section, prepared)
+    generation_cached = False
+    with timer.stage("llm_call"):
+        if reused:
+            logger.info("Step 5 - Fingerprint unchanged, reusing previous content")
+            content = previous_section["content"]
+        elif generation_cache is None:
+            logger.info("Step 5 - Calling LLM...")
+            content = generate_with_context(
+                prompt=prepared["instruction"],
+                context=prepared["context"],
+                system_prompt=SYSTEM_PROMPT
+            )
+        else:
+            content, generation_cached = generation_cache.generate(
+                prepared["instruction"], prepared["context"], SYSTEM_PROMPT, get_pipeline().model,
+                generate_fn=generate_with_context
+            )
+    logger.info(f"Step 5 - Generated {len(content)} characters{' (cached)' if generation_cached else ''}")
+    
+    # Step 6: Return result
+    with timer.stage("assembly"):
+        result = _section_result(procedure, section, content, prepared, generation_cached, reused, call_stats)
+    timer.record("section_total", time.perf_counter() - section_start)
+    result["metadata"]["timings_ms"] = timer.report()
+    if semantic_cache is not None:
+        semantic_cache.store(procedure, result, scope=scope)
+    logger.info(f"=== Completed '{section}' section ===\n")
+    return result
+
+
+def _semantic_result(procedure: str, section: str, hit: dict, timer: StageTimer, section_start: float) -> dict:
+    """An earlier section served from the semantic cache, with the reuse recorded for audit."""
+    result = hit["value"]
+    metadata = result["metadata"]
+    metadata["semantic_cache"] = {
+        "hit": True,
+        "matched_query": hit["matched_query"],
+        "similarity": hit["similarity"],
+        "original_procedure": result["procedure"],
+        "original_generated_at": metadata.get("generated_at"),
+        "cached_at": datetime.fromtimestamp(hit["stored_at"]).isoformat()
+    }
+    metadata["generated_at"] = datetime.now().isoformat()
+    # The fingerprint describes the other procedure's generation
+    metadata["fingerprint"] = None
+    result["procedure"] = procedure
+    timer.record("section_total", time.perf_counter() - section_start)
+    metadata["timings_ms"] = timer.report()
+    logger.info(
+        f"=== '{section}' for '{procedure}' served from semantic cache "
+        f"(matched '{hit['matched_query']}', similarity {hit['similarity']}) ==="
+    )
+    return result
+
+
+def generate_section_coalesced(procedure: str, section: str, top_k: int = 5, **kwargs) -> dict:
+    """
+    generate_handout_section, sharing one computation between concurrent identical requests.
+    
+    Callers asking for the same section while a generation is in flight wait
+    for it instead of repeating the retrieval and LLM work. Errors reach
+    every waiter. Every caller, the one that ran the computation included,
+    gets its own copy of the result, with metadata["coalesced"] set to True
+    for the waiters.
+    
+    Requests are the same when procedure, section, top_k and model match and
+    so do the options that change the content (see _coalescing_key): the
+    previous section's fingerprint, the ids of retrieved_chunks and of the
+    shared context, token_budget and the store. Caches, call_policy and
+    deadline come from whichever caller started the computation.
+    
+    The coalescing rate is in SECTION_FLIGHTS.stats() and in the
+    section_generation_calls / section_generation_coalesced counters of
+    metrics.REGISTRY.
+    """
+    key = _coalescing_key(procedure, section, top_k, kwargs)
+    result, shared = SECTION_FLIGHTS.do(key, generate_handout_section, procedure, section, top_k=top_k, **kwargs)
+    # The flight hands the same object to every caller; nobody mutates it
+    result = copy.deepcopy(result)
+    result["metadata"]["coalesced"] = shared
+    if shared:
+        logger.info(f"Section '{section}' for '{procedure}' shared an in-flight generation")
+    return result
+
+
+def _coalescing_key(procedure: str, section: str, top_k: int, options: dict) -> tuple:
+    """Key under which generate_section_coalesced shares a computation."""
+    previous_section = options.get("previous_section")
+    retrieved_chunks = options.get("retrieved_chunks")
+    shared_context = options.get("shared_context")
+    store = options.get("store")
+    return (
+        procedure,
+        section,
+        top_k,
+        get_pipeline().model,
+        previous_section.get("fingerprint") if previous_section and "error" not in previous_section else None,
+        tuple(chunk["id"] for chunk in retrieved_chunks) if retrieved_chunks is not None else None,
+        tuple(chunk["id"] for chunk in shared_context["chunks"]) if shared_context is not None else None,
+        options.get("token_budget", CONTEXT_TOKEN_BUDGET),
+        id(store) if store is not None else None
+    )
+
+
+def _prepare_section(
+    procedure: str,
+    section: str,
+    top_k: int,
+    retrieved_chunks: Optional[list[dict]],
+    store: Optional[object],
+    retrieval_cache: Optional[RetrievalCache],
+    token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+    timer: Optional[StageTimer] = None,
+    shared_context: Optional[dict] = None
+) -> dict:
+    """
+    Run pipeline steps 1-4 and return everything step 5 needs.
+    
+    With a shared_context (see prompt_layout.py) the context starts with the
+    handout's shared block and only the section's other chunks follow it.
+    """
+    if timer is None:
+        timer = StageTimer()
     
     # Step 1: Build search query
-    search_query = f"{procedure} {section.replace('_', ' ')} post operative care instructions"
+    with timer.stage("query_build"):
+        search_query = build_search_query(procedure, section)
     logger.info(f"Step 1 - Search query: '{search_query}'")
     
     # Step 2: Retrieve relevant chunks from vector store
-    # TODO: Implement
-    # retrieved_chunks = vector_search(search_query, top_k=top_k)
-    # logger.info(f"Step 2 - Retrieved {len(retrieved_chunks)} chunks from vector store")
-    # for i, chunk in enumerate(retrieved_chunks):
-    #     logger.debug(f"  Chunk {i+1} (score={chunk['score']:.3f}): {chunk['text'][:50]}...")
-    
-    # Step 3: Format context from retrieved chunks
-    # TODO: Implement
-    # context_parts = []
-    # for i, chunk in enumerate(retrieved_chunks):
-    #     source_info = f"[Source {i+1}: PMID {chunk['metadata'].get('pmid', 'unknown')}]"
-    #     context_parts.append(f"{source_info}\n{chunk['text']}")
-    # context = "\n\n".join(context_parts)
-    # logger.info(f"Step 3 - Formatted context ({len(context)} characters)")
+    if retrieved_chunks is None:
+        with timer.stage("retrieval"):
+            retrieved_chunks = _search(search_query, top_k, store, retrieval_cache)
+        logger.info(f"Step 2 - Retrieved {len(retrieved_chunks)} chunks from vector store")
+    else:
+        logger.info(f"Step 2 - Using {len(retrieved_chunks)} pre-retrieved chunks")
+    for i, chunk in enumerate(retrieved_chunks):
+        logger.debug(f"  Chunk {i+1} (score={chunk['score']:.3f}): {chunk['text'][:50]}...")
+    
+    # Step 3: Pack and format context from retrieved chunks
+    with timer.stage("context_format"):
+        if shared_context is None:
+            used_chunks, packing = pack_context(retrieved_chunks, token_budget=token_budget)
+            context = format_sources(used_chunks)
+            shared_prefix = SYSTEM_PROMPT
+        else:
+            used_chunks, context, packing = layout_context(shared_context, retrieved_chunks, token_budget)
+            shared_prefix = SYSTEM_PROMPT + shared_context["block"]
+    logger.info(
+        f"Step 3 - Formatted context ({len(context)} characters) from {len(used_chunks)} of "
+        f"{len(retrieved_chunks)} chunks ({packing['duplicates_removed']} duplicates removed)"
+    )
     
     # Step 4: Load prompt template
-    # TODO: Implement
-    # prompt = prompt_manager.get_prompt(
-    #     section,
-    #     procedure_name=procedure,
-    #     context=context
-    # )
-    # logger.info(f"Step 4 - Loaded prompt template '{section}'")
-    
-    # Step 5: Call LLM with context
-    # TODO: Implement
-    # logger.info("Step 5 - Calling LLM...")
-    # content = generate_with_context(
-    #     prompt=f"Write {section.replace('_', ' ')} instructions for {procedure}",
-    #     context=context,
-    #     system_prompt="You are a medical writer creating patient-friendly post-operative instructions. Write at a 6th-8th grade reading level. Be specific and actionable."
-    # )
-    # logger.info(f"Step 5 - Generated {len(content)} characters")
+    with timer.stage("prompt_load"):
+        prompt = get_pipeline().prompt_manager.get_prompt(
+            section,
+            procedure_name=procedure,
+            context=context
+        )
+        fingerprint = section_fingerprint(
+            procedure, section, [chunk["id"] for chunk in used_chunks], prompt_template_version(section),
+            model=get_pipeline().model
+        )
+    logger.info(f"Step 4 - Loaded prompt template '{section}'")
     
-    # Step 6: Return result
-    # TODO: Implement
-    # result = {
-    #     "procedure": procedure,
-    #     "section": section,
-    #     "content": content,
-    #     "sources": retrieved_chunks,
-    #     "metadata": {
-    #         "chunks_retrieved": len(retrieved_chunks),
-    #         "model": "gpt-4o-mini",
-    #         "generated_at": datetime.now().isoformat()
-    #     }
-    # }
-    # logger.info(f"=== Completed '{section}' section ===\n")
-    # return result
-    
-    pass
-
-
-def generate_full_handout(procedure: str, sections: Optional[list[str]] = None) -> dict:
+    return {
+        "search_query": search_query,
+        "retrieved_chunks": retrieved_chunks,
+        "chunks": used_chunks,
+        "duplicates_removed": packing["duplicates_removed"],
+        "context": context,
+        "prompt": prompt,
+        "instruction": f"Write {section.replace('_', ' ')} instructions for {procedure}",
+        "fingerprint": fingerprint,
+        "prompt_layout": "standard" if shared_context is None else "prefix_stable",
+        "shared_prefix": shared_prefix
+    }
+
+
+def _with_policy(generate_fn: Callable, call_policy: CallPolicy, deadline: Optional[Deadline], call_stats: dict) -> Callable:
+    """
+    generate_fn run through call_with_policy, with its stats written into call_stats.
+    
+    A failed call raises with its stats still attached as error.call_stats
+    (see call_with_policy), so assemble_handout can count them.
+    """
+    def generate(**kwargs):
+        try:
+            content, stats = call_with_policy(generate_fn, call_policy, deadline, **kwargs)
+        except Exception as e:
+            call_stats.update(getattr(e, "call_stats", {}))
+            raise
+        call_stats.update(stats)
+        return content
+    return generate
+
+
+def _can_reuse(previous_section: Optional[dict], prepared: dict) -> bool:
+    """True if an earlier section was generated from the same fingerprint and did not fail."""
+    return (
+        previous_section is not None
+        and "error" not in previous_section
+        and previous_section.get("fingerprint") == prepared["fingerprint"]
+    )
+
+
+def _section_result(
+    procedure: str,
+    section: str,
+    content: str,
+    prepared: dict,
+    generation_cached: bool,
+    reused: bool = False,
+    call_stats: Optional[dict] = None
+) -> dict:
+    """Build the step 6 result dict for a generated section."""
+    call_stats = call_stats or {}
+    return {
+        "procedure": procedure,
+        "section": section,
+        "content": content,
+        "sources": prepared["chunks"],
+        "metadata": {
+            "chunks_retrieved": len(prepared["retrieved_chunks"]),
+            "chunks_used": len(prepared["chunks"]),
+            "duplicates_removed": prepared["duplicates_removed"],
+            "context_tokens": estimate_tokens(prepared["context"]),
+            "model": get_pipeline().model,
+            "generation_cached": generation_cached,
+            "reused": reused,
+            "fingerprint": prepared["fingerprint"],
+            "prompt_layout": prepared["prompt_layout"],
+            "shared_prefix_chars": len(prepared["shared_prefix"]),
+            "shared_prefix_tokens": estimate_tokens(prepared["shared_prefix"]),
+            "llm_retries": call_stats.get("retries", 0),
+            "llm_hedges": call_stats.get("hedges", 0),
+            "llm_timeouts": call_stats.get("timeouts", 0),
+            "generated_at": datetime.now().isoformat()
+        }
+    }
+
+
+def run_section(
+    procedure: str,
+    section: str,
+    coalesce: bool = False,
+    **kwargs
+) -> tuple[Optional[dict], Optional[Exception], float]:
+    """
+    Run generate_handout_section and capture its result, error and duration.
+    
+    Errors are returned instead of raised so one failing section never
+    discards the sections that did finish. Keyword arguments are passed
+    through to generate_handout_section. With coalesce=True the section goes
+    through generate_section_coalesced.
+    """
+    section_start = time.perf_counter()
+    generate = generate_section_coalesced if coalesce else generate_handout_section
+    try:
+        result = generate(procedure, section, **kwargs)
+        error = None
+    except Exception as e:
+        logger.error(f"Section '{section}' failed for '{procedure}': {e}")
+        result = None
+        error = e
+    return result, error, time.perf_counter() - section_start
+
+
+def generate_full_handout(
+    procedure: str,
+    sections: Optional[list[str]] = None,
+    max_workers: int = 1,
+    top_k: int = 5,
+    batch_retrieval: bool = False,
+    store: Optional[object] = None,
+    retrieval_cache: Optional[RetrievalCache] = None,
+    generation_cache: Optional[GenerationCache] = None,
+    token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+    previous_handout: Optional[dict] = None,
+    call_policy: Optional[CallPolicy] = None,
+    deadline_seconds: Optional[float] = None,
+    coalesce: bool = False,
+    semantic_cache: Optional[object] = None,
+    prompt_layout: str = "standard"
+) -> dict:
     """
     Generate a complete handout with all sections.
     
+    Sections are generated one after another when max_workers is 1. With
+    max_workers > 1 they run on a thread pool of at most that many workers,
+    so the handout takes roughly as long as its slowest sections instead of
+    the sum of all of them. Sections always come back in the requested order,
+    and a failing section is reported in "failed_sections" rather than
+    aborting the handout.
+    
+    With batch_retrieval=True, chunks for all sections are fetched up front
+    with retrieve_sections() (one embedding call and one multi-query search)
+    and handed to each section, instead of one search per section.
+    
+    Pass the handout from an earlier run as previous_handout to regenerate
+    incrementally (e.g. after an index refresh): retrieval still runs for
+    every section, but a section whose fingerprint (chunk ids, prompt
+    template version and model) is unchanged keeps its previous content
+    without an LLM call. quality_metrics reports sections_reused and
+    sections_regenerated.
+    
+    call_policy sets the per-call timeout, retries and hedging for every
+    section's LLM call (see call_policy.py). deadline_seconds bounds the
+    whole handout and starts before any retrieval: LLM calls never run past
+    it, and sections not started by then fail with DeadlineExceeded. A
+    search already running is not interrupted, but its time counts against
+    the deadline. quality_metrics totals llm_retries, llm_hedges and
+    llm_timeouts, including those of failed sections.
+    
+    With coalesce=True, sections share in-flight work with identical
+    section requests from other threads (see generate_section_coalesced);
+    quality_metrics counts them in sections_coalesced.
+    
+    A semantic_cache is passed to every section (see
+    generate_handout_section); quality_metrics counts semantic_cache_hits.
+    
+    prompt_layout="prefix_stable" puts the parts every section shares at the
+    front of each prompt (see prompt_layout.py): chunks are retrieved for all
+    sections up front, as with batch_retrieval, and chunks retrieved for
+    several sections form one shared context block. quality_metrics reports
+    the layout and the shared_prefix_tokens every section's prompt starts with.
+    
+    all_sources holds each chunk once, however many sections used it, and
+    each section refers to its sources by index into it (see
+    assemble_handout). handout_codec.py serializes handouts compactly.
+    
     Input:
         procedure = "appendectomy"
         sections = None  # Uses default sections
+        max_workers = 6  # Generate all six sections concurrently
+        batch_retrieval = True  # One batched search for all six sections
     
     Output:
         {
@@ -163,11 +859,15 @@ def generate_full_handout(procedure: str, sections: Optional[list[str]] = None)
             "sections": [
                 {
                     "name": "Overview",
-                    "content": "You have just had an appendectomy..."
+                    "content": "You have just had an appendectomy...",
+                    "fingerprint": "9b2e5d...",
+                    "sources": [0, 1, 2, 3]
                 },
                 {
                     "name": "Pain Management",
-                    "content": "Some discomfort after surgery is normal..."
+                    "content": "Some discomfort after surgery is normal...",
+                    "fingerprint": "47c1aa...",
+                    "sources": [4, 1, 5]
                 },
                 {
                     "name": "Activity Restrictions",
@@ -183,68 +883,382 @@ def generate_full_handout(procedure: str, sections: Optional[list[str]] = None)
                 },
                 {
                     "name": "Follow-Up",
-                    "content": "Your follow-up appointment is scheduled..."
+                    "content": "",
+                    "error": "TimeoutError: LLM request timed out"
                 }
             ],
-            "all_sources": [...],
+            "all_sources": [
+                {"id": "pmid_12345_chunk_0", "text": "...", "score": 0.89, "metadata": {"pmid": "12345"}},
+                ...
+            ],
             "quality_metrics": {
                 "total_sections": 6,
-                "total_sources_used": 25,
-                "generation_time_seconds": 45.2
+                "total_sources_used": 18,
+                "source_references": 25,
+                "failed_sections": ["follow_up"],
+                "llm_calls": 5,
+                "sections_reused": 0,
+                "sections_regenerated": 5,
+                "llm_retries": 0,
+                "llm_hedges": 1,
+                "llm_timeouts": 1,
+                "sections_coalesced": 0,
+                "semantic_cache_hits": 0,
+                "shared_prefix_tokens": 37,
+                "prompt_layout": "standard",
+                "max_workers": 6,
+                "generation_time_seconds": 9.1,
+                "section_time_seconds_total": 45.2
             }
         }
     """
-    import time
-    start_time = time.time()
+    start_time = time.perf_counter()
     
-    # Default sections for a complete handout
     if sections is None:
-        sections = [
-            "overview",
-            "pain_management",
-            "activity_restrictions",
-            "wound_care",
-            "warning_signs",
-            "follow_up"
-        ]
-    
-    logger.info(f"Generating full handout for '{procedure}' with {len(sections)} sections")
-    
-    # TODO: Implement
-    # generated_sections = []
-    # all_sources = []
-    #
-    # for section in sections:
-    #     logger.info(f"Generating section: {section}")
-    #     result = generate_handout_section(procedure, section)
-    #     
-    #     generated_sections.append({
-    #         "name": section.replace("_", " ").title(),
-    #         "content": result["content"]
-    #     })
-    #     all_sources.extend(result["sources"])
-    #
-    # elapsed_time = time.time() - start_time
-    # logger.info(f"Full handout generated in {elapsed_time:.1f} seconds")
-    #
-    # return {
-    #     "procedure": procedure,
-    #     "title": f"After Your {procedure.replace('_', ' ').title()}: Recovery Guide",
-    #     "generated_at": datetime.now().isoformat(),
-    #     "sections": generated_sections,
-    #     "all_sources": all_sources,
-    #     "quality_metrics": {
-    #         "total_sections": len(generated_sections),
-    #         "total_sources_used": len(all_sources),
-    #         "generation_time_seconds": round(elapsed_time, 1)
-    #     }
-    # }
-    
-    pass
+        sections = DEFAULT_SECTIONS
+    
+    max_workers = max(1, min(max_workers, len(sections) or 1))
+    logger.info(f"Generating full handout for '{procedure}' with {len(sections)} sections (max_workers={max_workers})")
+    deadline = Deadline(deadline_seconds) if deadline_seconds is not None else None
+    
+    chunks_by_section, shared = _retrieve_up_front(
+        procedure, sections, top_k, batch_retrieval, store, retrieval_cache, token_budget, prompt_layout
+    )
+    previous_by_section = previous_sections(previous_handout)
+    
+    def run(section):
+        return run_section(
+            procedure,
+            section,
+            top_k=top_k,
+            retrieved_chunks=chunks_by_section.get(section),
+            store=store,
+            retrieval_cache=retrieval_cache,
+            generation_cache=generation_cache,
+            token_budget=token_budget,
+            previous_section=previous_by_section.get(section),
+            call_policy=call_policy,
+            deadline=deadline,
+            coalesce=coalesce,
+            semantic_cache=semantic_cache,
+            shared_context=shared
+        )
+    
+    if max_workers == 1:
+        outcomes = [run(section) for section in sections]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="handout-section") as executor:
+            # map() yields results in submission order, so section order is preserved
+            outcomes = list(executor.map(run, sections))
+    
+    elapsed_time = time.perf_counter() - start_time
+    handout = assemble_handout(procedure, sections, outcomes, elapsed_time)
+    handout["quality_metrics"]["prompt_layout"] = prompt_layout
+    handout["quality_metrics"]["max_workers"] = max_workers
+    metrics = handout["quality_metrics"]
+    logger.info(
+        f"Full handout generated in {elapsed_time:.1f} seconds "
+        f"({metrics['section_time_seconds_total']:.1f} seconds of section work, "
+        f"{metrics['sections_reused']} reused, {len(metrics['failed_sections'])} failed)"
+    )
+    return handout
+
+
+def _retrieve_up_front(
+    procedure: str,
+    sections: list[str],
+    top_k: int,
+    batch_retrieval: bool,
+    store: Optional[object],
+    retrieval_cache: Optional[RetrievalCache],
+    token_budget: Optional[int],
+    prompt_layout: str
+) -> tuple[dict, Optional[dict]]:
+    """
+    Chunks fetched for every section before generation starts, and the shared context block.
+    
+    Nothing is fetched up front without batch_retrieval or the prefix-stable
+    layout, which needs every section's chunks to find the shared ones. The
+    shared block may use up to half of token_budget.
+    """
+    if prompt_layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt layout: {prompt_layout!r} (expected one of {PROMPT_LAYOUTS})")
+    
+    if not batch_retrieval and prompt_layout == "standard":
+        return {}, None
+    chunks_by_section = retrieve_sections(
+        procedure, sections, top_k=top_k, store=store, retrieval_cache=retrieval_cache
+    )
+    if prompt_layout == "standard":
+        return chunks_by_section, None
+    
+    shared = build_shared_context(
+        procedure, chunks_by_section, token_budget=token_budget // 2 if token_budget is not None else None
+    )
+    logger.info(f"Shared context block: {len(shared['chunks'])} chunks, ~{shared['tokens']} tokens")
+    return chunks_by_section, shared
+
+
+def assemble_handout(
+    procedure: str,
+    sections: list[str],
+    outcomes: list[tuple[Optional[dict], Optional[Exception], float]],
+    elapsed_time: float
+) -> dict:
+    """
+    Combine per-section (result, error, seconds) outcomes into the handout dict.
+    
+    all_sources is a table with one entry per chunk id, in order of first
+    use (a chunk used by several sections keeps the dict, and score, of the
+    first). Each section lists its sources as indexes into that table, in
+    [Source N] order.
+    
+    llm_retries, llm_hedges and llm_timeouts include failed sections, whose
+    call stats travel on the error (see call_with_policy).
+    """
+    generated_sections = []
+    all_sources = []
+    source_index = {}  # chunk id -> position in all_sources
+    source_references = 0
+    failed_sections = []
+    section_time_total = 0.0
+    llm_calls = 0
+    reused = 0
+    coalesced = 0
+    semantic_hits = 0
+    call_totals = {"llm_retries": 0, "llm_hedges": 0, "llm_timeouts": 0}
+    shared_prefix_tokens = []
+    stage_ms_total = {}
+    
+    for section, (result, error, section_time) in zip(sections, outcomes):
+        section_time_total += section_time
+        name = section.replace("_", " ").title()
+        if error is not None:
+            failed_sections.append(section)
+            # A section that ran out of retries or time still made its calls
+            for stat in call_totals:
+                call_totals[stat] += getattr(error, "call_stats", {}).get(stat[len("llm_"):], 0)
+            generated_sections.append({
+                "name": name,
+                "content": "",
+                "error": f"{type(error).__name__}: {error}"
+            })
+            continue
+        generated_sections.append({
+            "name": name,
+            "content": result["content"],
+            "fingerprint": result["metadata"].get("fingerprint"),
+            "sources": _intern_sources(result["sources"], all_sources, source_index)
+        })
+        source_references += len(result["sources"])
+        if result["metadata"].get("coalesced"):
+            coalesced += 1
+        if result["metadata"].get("semantic_cache", {}).get("hit"):
+            semantic_hits += 1
+        elif result["metadata"].get("reused"):
+            reused += 1
+        elif not result["metadata"].get("generation_cached"):
+            llm_calls += 1
+        for stat in call_totals:
+            call_totals[stat] += result["metadata"].get(stat, 0)
+        if "shared_prefix_tokens" in result["metadata"]:
+            shared_prefix_tokens.append(result["metadata"]["shared_prefix_tokens"])
+        for stage, ms in result["metadata"].get("timings_ms", {}).items():
+            stage_ms_total[stage] = stage_ms_total.get(stage, 0.0) + ms
+    
+    return {
+        "procedure": procedure,
+        "title": f"After Your {procedure.replace('_', ' ').title()}: Recovery Guide",
+        "generated_at": datetime.now().isoformat(),
+        "sections": generated_sections,
+        "all_sources": all_sources,
+        "quality_metrics": {
+            "total_sections": len(generated_sections),
+            "total_sources_used": len(all_sources),
+            "source_references": source_references,
+            "failed_sections": failed_sections,
+            "llm_calls": llm_calls,
+            "sections_reused": reused,
+            "sections_regenerated": len(generated_sections) - len(failed_sections) - reused - semantic_hits,
+            **call_totals,
+            "sections_coalesced": coalesced,
+            "semantic_cache_hits": semantic_hits,
+            # Prefix every section's prompt starts with
+            "shared_prefix_tokens": min(shared_prefix_tokens, default=0),
+            "generation_time_seconds": round(elapsed_time, 1),
+            "section_time_seconds_total": round(section_time_total, 1),
+            "stage_seconds_total": {stage: round(ms / 1000, 3) for stage, ms in stage_ms_total.items()}
+        }
+    }
+
+
+def _intern_sources(chunks: list[dict], table: list[dict], index: dict) -> list[int]:
+    """Positions of chunks in the source table, adding chunks it does not have yet."""
+    positions = []
+    for chunk in chunks:
+        position = index.get(chunk["id"])
+        if position is None:
+            position = index[chunk["id"]] = len(table)
+            table.append(chunk)
+        positions.append(position)
+    return positions
+
+
+def _stream_llm(instruction: str, context: str) -> Iterator[str]:
+    """
+    Yield LLM output as it is produced.
+    
+    Uses llm_client.stream_with_context(prompt, context, system_prompt) when
+    the client provides it; otherwise falls back to one blocking
+    generate_with_context call yielded as a single chunk.
+    """
+    pipeline = get_pipeline()
+    stream_with_context = pipeline.stream_with_context
+    if stream_with_context is None:
+        yield pipeline.generate_with_context(prompt=instruction, context=context, system_prompt=SYSTEM_PROMPT)
+        return
+    yield from stream_with_context(prompt=instruction, context=context, system_prompt=SYSTEM_PROMPT)
+
+
+def stream_full_handout(
+    procedure: str,
+    sections: Optional[list[str]] = None,
+    top_k: int = 5,
+    batch_retrieval: bool = False,
+    store: Optional[object] = None,
+    retrieval_cache: Optional[RetrievalCache] = None,
+    generation_cache: Optional[GenerationCache] = None,
+    token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+    previous_handout: Optional[dict] = None,
+    prompt_layout: str = "standard"
+) -> Iterator[dict]:
+    """
+    Generate a handout section by section, yielding events as content is ready.
+    
+    Same pipeline and options as generate_full_handout (except call_policy,
+    deadline_seconds, coalesce and semantic_cache: a streamed call is not
+    retried, hedged or shared), but instead of one dict at the end the
+    caller gets events to render incrementally. Sections
+    run in order so tokens arrive as one readable stream. A failing section
+    yields "section_failed" and the stream moves on to the next section.
+    
+    Input:
+        procedure = "appendectomy"
+        sections = ["overview", "wound_care"]
+    
+    Output (yielded in order):
+        {"event": "section_started", "section": "overview", "index": 0}
+        {"event": "token", "section": "overview", "index": 0, "text": "You have just "}
+        {"event": "token", "section": "overview", "index": 0, "text": "had an appendectomy..."}
+        {"event": "section_completed", "section": "overview", "index": 0, "name": "Overview",
+         "content": "You have just had an appendectomy...", "sources": [...], "metadata": {...}}
+        {"event": "section_started", "section": "wound_care", "index": 1}
+        ...
+        {"event": "handout_completed", "handout": {...}, "quality_metrics": {
+            "total_sections": 2,
+            ...
+            "time_to_first_token_seconds": 1.3
+        }}
+    """
+    start_time = time.perf_counter()
+    first_token_time = None
+    
+    if sections is None:
+        sections = DEFAULT_SECTIONS
+    
+    logger.info(f"Streaming handout for '{procedure}' with {len(sections)} sections")
+    
+    chunks_by_section, shared = _retrieve_up_front(
+        procedure, sections, top_k, batch_retrieval, store, retrieval_cache, token_budget, prompt_layout
+    )
+    previous_by_section = previous_sections(previous_handout)
+    
+    outcomes = []
+    for index, section in enumerate(sections):
+        yield {"event": "section_started", "section": section, "index": index}
+        section_start = time.perf_counter()
+        timer = StageTimer()
+        try:
+            prepared = _prepare_section(
+                procedure, section, top_k, chunks_by_section.get(section), store, retrieval_cache,
+                token_budget, timer, shared
+            )
+            
+            content = None
+            generation_cached = False
+            cache_key = None
+            previous_section = previous_by_section.get(section)
+            reused = _can_reuse(previous_section, prepared)
+            if reused:
+                content = previous_section["content"]
+            elif generation_cache is not None:
+                cache_key = generation_key(prepared["instruction"], prepared["context"], SYSTEM_PROMPT, get_pipeline().model)
+                content = generation_cache.get(cache_key)
+                generation_cached = content is not MISSING
+            
+            if reused or generation_cached:
+                pieces = [content]
+            else:
+                pieces = _stream_llm(prepared["instruction"], prepared["context"])
+            
+            # Only time spent waiting on the LLM counts, not time the consumer holds each event
+            collected = []
+            wait_start = time.perf_counter()
+            for piece in pieces:
+                timer.record("llm_call", time.perf_counter() - wait_start)
+                if piece:
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter() - start_time
+                    collected.append(piece)
+                    yield {"event": "token", "section": section, "index": index, "text": piece}
+                wait_start = time.perf_counter()
+            timer.record("llm_call", time.perf_counter() - wait_start)
+            content = "".join(collected)
+            
+            if cache_key is not None and not generation_cached:
+                generation_cache.set(cache_key, content)
+            
+            with timer.stage("assembly"):
+                result = _section_result(procedure, section, content, prepared, generation_cached, reused)
+            timer.record("section_total", sum(timer.timings.values()))
+            result["metadata"]["timings_ms"] = timer.report()
+        except Exception as e:
+            logger.error(f"Section '{section}' failed for '{procedure}': {e}")
+            outcomes.append((None, e, time.perf_counter() - section_start))
+            yield {
+                "event": "section_failed",
+                "section": section,
+                "index": index,
+                "error": f"{type(e).__name__}: {e}"
+            }
+            continue
+        
+        outcomes.append((result, None, time.perf_counter() - section_start))
+        yield {
+            "event": "section_completed",
+            "section": section,
+            "index": index,
+            "name": section.replace("_", " ").title(),
+            "content": result["content"],
+            "sources": result["sources"],
+            "metadata": result["metadata"]
+        }
+    
+    handout = assemble_handout(procedure, sections, outcomes, time.perf_counter() - start_time)
+    handout["quality_metrics"]["prompt_layout"] = prompt_layout
+    handout["quality_metrics"]["time_to_first_token_seconds"] = (
+        round(first_token_time, 2) if first_token_time is not None else None
+    )
+    yield {"event": "handout_completed", "handout": handout, "quality_metrics": handout["quality_metrics"]}
 
 
 # Test the module
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
     # Example usage - uncomment to test:
     #
     # # Test 1: Generate single section for knee replacement
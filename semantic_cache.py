@@ -0,0 +1,206 @@
+# semantic_cache.py
+"""
+Semantic Section Cache for PostopCare
+
+Procedure names arrive in free text ("knee replacement", "total knee
+arthroplasty", "TKA"), so an exact-key cache misses on every variant. This
+cache embeds the normalized procedure name and reuses an earlier section
+(its retrieved chunks and generated content) when a cached procedure is at
+least `threshold` cosine-similar.
+
+    - Only the procedure is embedded. Text every request shares (the section
+      name, "post operative care instructions") pushes different procedures
+      together: "total knee arthroplasty" and "total hip arthroplasty" must
+      stay well apart, or one patient gets the other procedure's handout
+    - Entries are partitioned by scope (the pipeline uses section, top_k,
+      model, prompt template version and index_version), so a wound care
+      request can never be answered with pain management content, and a
+      template edit or index refresh starts from an empty partition
+    - Small partitions are scanned exactly with one matrix-vector product
+    - Partitions with ann_min_entries or more entries get an IVF index
+      (spherical k-means from local_index.py); lookups score only the rows
+      of the nprobe closest clusters plus rows added since the last build
+    - Each partition holds at most max_entries; the oldest 10% are dropped
+      when it is full
+
+Every hit returns the matched query, its similarity and when it was stored,
+which the pipeline records in the section metadata for auditing.
+
+Setup:
+    pip install numpy
+
+Bump index_version whenever the vector index is rebuilt, as with
+cache.RetrievalCache; entries stored under the old version are no longer
+found, and clear() frees them.
+
+Usage:
+    cache = SemanticCache(embed_fn=store.embed_texts, threshold=0.92, index_version="2025-01-15")
+    generate_handout_section("TKA", "pain_management", semantic_cache=cache)
+"""
+
+import copy
+import logging
+import threading
+import time
+from typing import Callable, Hashable, Optional
+
+import numpy as np
+
+from cache import normalize_query
+from local_index import _kmeans, _top_positions
+
+logger = logging.getLogger("semantic_cache")
+
+
+class _Partition:
+    """Embeddings and values of one scope, in insertion order."""
+
+    def __init__(self, dimensions: int, capacity: int = 64):
+        self.matrix = np.zeros((capacity, dimensions), dtype=np.float32)
+        self.size = 0
+        self.queries = []
+        self.values = []
+        self.stored_at = []
+        self.centroids = None     # IVF centroids, or None for exact scans
+        self.assignments = None   # cluster of each indexed row
+        self.indexed = 0          # rows covered by the IVF index
+
+    def append(self, vector: np.ndarray, query: str, value) -> None:
+        if self.size == len(self.matrix):
+            grown = np.zeros((len(self.matrix) * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+        self.matrix[self.size] = vector
+        self.size += 1
+        self.queries.append(query)
+        self.values.append(value)
+        self.stored_at.append(time.time())
+
+    def drop_oldest(self, count: int) -> None:
+        remaining = self.size - count
+        self.matrix[:remaining] = self.matrix[count:self.size]
+        self.size = remaining
+        del self.queries[:count], self.values[:count], self.stored_at[:count]
+        self.centroids = self.assignments = None
+        self.indexed = 0
+
+    def build_ivf(self) -> None:
+        n_clusters = max(2, int(np.sqrt(self.size)))
+        self.centroids, self.assignments = _kmeans(self.matrix[:self.size], n_clusters)
+        self.indexed = self.size
+
+    def best(self, vector: np.ndarray, nprobe: int) -> tuple[int, float]:
+        """(row, similarity) of the most similar cached query."""
+        if self.centroids is None:
+            scores = self.matrix[:self.size] @ vector
+            row = int(np.argmax(scores))
+            return row, float(scores[row])
+        probe = _top_positions(self.centroids @ vector, nprobe)
+        rows = np.flatnonzero(np.isin(self.assignments, probe))
+        rows = np.concatenate([rows, np.arange(self.indexed, self.size)])
+        if not len(rows):
+            return -1, -1.0
+        scores = self.matrix[rows] @ vector
+        best = int(np.argmax(scores))
+        return int(rows[best]), float(scores[best])
+
+
+class SemanticCache:
+    """
+    Cache of section results looked up by query embedding similarity.
+
+    embed_fn takes a list of texts and returns one vector per text, like
+    local_index.py. Values are deep-copied on the way in and out.
+    index_version is read by the pipeline and made part of every scope.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable,
+        threshold: float = 0.92,
+        max_entries: int = 4096,
+        ann_min_entries: int = 2048,
+        nprobe: int = 4,
+        index_version: str = "v1"
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ann_min_entries = ann_min_entries
+        self.nprobe = nprobe
+        self.index_version = index_version
+        self._partitions = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embed_fn([query]), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query: str, scope: Hashable = "") -> Optional[dict]:
+        """
+        Most similar cached entry in scope, if it clears the threshold.
+
+        Output:
+            {
+                "value": {...},
+                "matched_query": "total knee arthroplasty",
+                "similarity": 0.947,
+                "stored_at": 1736937000.0
+            }
+        """
+        normalized = normalize_query(query)
+        vector = self._embed(normalized)
+        with self._lock:
+            partition = self._partitions.get(scope)
+            row, similarity = (-1, -1.0) if partition is None or not partition.size else partition.best(vector, self.nprobe)
+            if row < 0 or similarity < self.threshold:
+                self._counters["misses"] += 1
+                return None
+            self._counters["hits"] += 1
+            value = partition.values[row]
+            hit = {
+                "matched_query": partition.queries[row],
+                "similarity": round(similarity, 4),
+                "stored_at": partition.stored_at[row]
+            }
+        hit["value"] = copy.deepcopy(value)
+        return hit
+
+    def store(self, query: str, value, scope: Hashable = "") -> None:
+        normalized = normalize_query(query)
+        vector = self._embed(normalized)
+        value = copy.deepcopy(value)
+        with self._lock:
+            partition = self._partitions.get(scope)
+            if partition is None:
+                partition = self._partitions[scope] = _Partition(len(vector))
+            if partition.size >= self.max_entries:
+                dropped = max(1, self.max_entries // 10)
+                partition.drop_oldest(dropped)
+                self._counters["evictions"] += dropped
+            partition.append(vector, normalized, value)
+            self._counters["stores"] += 1
+            # (Re)build the IVF index once a partition is large, and again each time it doubles
+            if partition.size >= self.ann_min_entries and partition.size >= 2 * max(partition.indexed, 1):
+                partition.build_ivf()
+                logger.info(f"Semantic cache partition {scope!r}: IVF index over {partition.size} entries")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._partitions.clear()
+
+    def stats(self) -> dict:
+        """
+        Output:
+            {"hits": 12, "misses": 30, "stores": 30, "evictions": 0, "entries": 30, "hit_rate": 0.2857}
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = sum(partition.size for partition in self._partitions.values())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
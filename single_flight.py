@@ -0,0 +1,177 @@
+# single_flight.py
+"""
+Request Coalescing for PostopCare
+
+When several clinicians open the same procedure at once, each request used
+to run the same retrieval and LLM work independently. A single-flight group
+makes concurrent callers with the same key share one in-flight computation:
+
+    - The first caller for a key (the leader) runs the function
+    - Callers arriving while it runs wait for it and receive the same result
+    - If it raises, every waiter gets the same exception
+    - If the leader is interrupted (KeyboardInterrupt, task cancellation) the
+      waiters are not failed with someone else's cancellation: they retry,
+      and one of them becomes the new leader
+    - Nothing is cached: once the computation finishes the key is free again
+
+SingleFlight is for threads, AsyncSingleFlight for asyncio. In the async
+version a cancelled waiter only stops waiting; the shared task is cancelled
+when its last waiter goes away.
+
+Both count calls and coalesced calls in metrics.REGISTRY as
+"<name>_calls" and "<name>_coalesced"; stats() also reports the
+coalescing rate.
+
+Setup:
+    No additional pip installs required
+
+Usage:
+    flights = SingleFlight("section")
+    result, shared = flights.do(("knee replacement", "wound_care", 5, "gpt-4o-mini"),
+                                generate_handout_section, "knee replacement", "wound_care")
+"""
+
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import Callable, Hashable, Optional
+
+from metrics import REGISTRY, MetricsRegistry
+
+
+class _FlightGroup:
+    def __init__(self, name: str, registry: Optional[MetricsRegistry]):
+        self.name = name
+        self.registry = REGISTRY if registry is None else registry
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0, "coalesced": 0}
+
+    def _count(self, shared: bool) -> None:
+        with self._lock:
+            self._counts["calls"] += 1
+            if shared:
+                self._counts["coalesced"] += 1
+        self.registry.increment(f"{self.name}_calls")
+        if shared:
+            self.registry.increment(f"{self.name}_coalesced")
+
+    def stats(self) -> dict:
+        """
+        Output:
+            {"calls": 40, "coalesced": 31, "coalescing_rate": 0.775, "in_flight": 2}
+        """
+        with self._lock:
+            calls, coalesced = self._counts["calls"], self._counts["coalesced"]
+            in_flight = len(self._calls)
+        return {
+            "calls": calls,
+            "coalesced": coalesced,
+            "coalescing_rate": round(coalesced / calls, 4) if calls else 0.0,
+            "in_flight": in_flight
+        }
+
+
+class SingleFlight(_FlightGroup):
+    """Coalesces concurrent calls with the same key across threads."""
+
+    def __init__(self, name: str = "single_flight", registry: Optional[MetricsRegistry] = None):
+        super().__init__(name, registry)
+        self._calls = {}  # key -> Future of the in-flight call
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> tuple[object, bool]:
+        """
+        Run fn(*args, **kwargs) unless a call with this key is already running.
+
+        Returns (result, shared); shared is True when the result came from
+        another caller's computation. The same result object is returned to
+        every caller, so copy it before mutating.
+        """
+        counted = False
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._calls[key] = future
+            if not counted:
+                self._count(shared=not leader)
+                counted = True
+
+            if not leader:
+                try:
+                    return future.result(), True
+                except CancelledError:
+                    # The leader was interrupted, not this caller: try again
+                    continue
+
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._finish(key, future)
+                future.set_exception(e)
+                raise
+            except BaseException:
+                self._finish(key, future)
+                future.cancel()
+                raise
+            self._finish(key, future)
+            future.set_result(result)
+            return result, False
+
+    def _finish(self, key: Hashable, future: Future) -> None:
+        # Free the key before waking waiters, so new callers start a fresh call
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+
+class AsyncSingleFlight(_FlightGroup):
+    """Coalesces concurrent coroutine calls with the same key on one event loop."""
+
+    def __init__(self, name: str = "single_flight", registry: Optional[MetricsRegistry] = None):
+        super().__init__(name, registry)
+        self._calls = {}  # key -> [task, waiter count]
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> tuple[object, bool]:
+        """
+        Await fn(*args, **kwargs) unless a call with this key is already running.
+
+        Returns (result, shared). Cancelling one caller does not cancel the
+        shared task while other callers still wait for it.
+        """
+        # Imported here so the threaded pipeline does not pay for asyncio at import time
+        import asyncio
+
+        counted = False
+        while True:
+            entry = self._calls.get(key)
+            shared = entry is not None
+            if entry is None:
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                entry = [task, 0]
+                with self._lock:
+                    self._calls[key] = entry
+                task.add_done_callback(lambda done, key=key, entry=entry: self._forget(key, entry))
+            if not counted:
+                self._count(shared=shared)
+                counted = True
+
+            task = entry[0]
+            entry[1] += 1
+            try:
+                return await asyncio.shield(task), shared
+            except asyncio.CancelledError:
+                if task.done() and task.cancelled():
+                    # The shared task was cancelled out from under this waiter: try again
+                    self._forget(key, entry)
+                    continue
+                raise
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0 and not task.done():
+                    task.cancel()
+
+    def _forget(self, key: Hashable, entry: list) -> None:
+        with self._lock:
+            if self._calls.get(key) is entry:
+                del self._calls[key]
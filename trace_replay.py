@@ -0,0 +1,492 @@
+# trace_replay.py
+"""
+Record/Replay Harness for PostopCare
+
+Profiling rag_pipeline against live Pinecone and the live LLM costs money,
+and their latency noise hides our own overhead. This module records every
+vector store and LLM request a run makes, with its response and timing, into
+a local trace file, and replays them later without network access:
+
+    - TraceRecorder + record_pipeline() wrap a pipeline's store,
+      generate_with_context and stream_with_context; each call is appended
+      to the trace as it finishes (failures included)
+    - TraceReplay serves the recorded responses for identical requests, in
+      recorded order, either after the recorded latency (to reproduce a
+      production slowdown) or immediately (to see only in-process time)
+    - profiled() runs a block under cProfile and logs the hottest functions,
+      optionally saving the stats for snakeviz / pstats
+
+Trace file:
+    JSON lines, gzip-compressed when the path ends in .gz. The first line is
+    a header ({"trace_version", "created_at", "metadata"}), then one record
+    per call:
+        {"kind": "search", "key": "3f9a...", "request": {"query": "...", "top_k": 5},
+         "response": [...], "seconds": 0.41, "at": 1.27}
+    kind is search, search_batch, generate or stream. Stream records hold the
+    list of pieces and the seconds spent waiting for each, and
+    "truncated": true when the consumer stopped reading early. Failed calls
+    have "error" instead of a response; a failed stream keeps the pieces it
+    produced.
+
+Requests are matched on kind plus every argument (query and top_k, or
+prompt, context and system prompt), so a replay has to use the same
+procedures, sections and options as the recording. A request that is not in
+the trace raises ReplayMiss.
+
+Setup:
+    No additional pip installs required (recording needs the live clients)
+
+Usage:
+    python trace_replay.py record trace.jsonl.gz "knee replacement" "appendectomy" --max-workers 6
+    python trace_replay.py replay trace.jsonl.gz --latency zero --profile replay.prof
+
+    # or from Python
+    with TraceRecorder("trace.jsonl.gz") as recorder:
+        set_pipeline(record_pipeline(recorder))
+        generate_full_handout("knee replacement")
+    set_pipeline(replay_pipeline("trace.jsonl.gz", latency="zero"))
+    with profiled("replay.prof"):
+        generate_full_handout("knee replacement")
+"""
+
+import argparse
+import copy
+import cProfile
+import hashlib
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+from batch_retrieval import batch_search
+
+logger = logging.getLogger("trace_replay")
+
+TRACE_VERSION = 1
+
+LATENCY_MODES = ("recorded", "zero")
+
+# handout options the CLI records in the trace header and replays with
+CLI_OPTIONS = ("top_k", "max_workers", "batch_retrieval")
+
+
+class ReplayMiss(LookupError):
+    """The replayed run made a request the trace does not contain."""
+
+
+class ReplayedError(RuntimeError):
+    """The recorded call failed; replay fails the same way."""
+
+
+def request_key(kind: str, request: dict) -> str:
+    """Stable identifier of a request, used to match replayed calls to records."""
+    payload = json.dumps([kind, request], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _open_trace(path: str, mode: str):
+    if path.endswith(".gz"):
+        # Imported here so importing this module stays cheap
+        import gzip
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class TraceRecorder:
+    """
+    Appends call records to a trace file. Thread-safe.
+
+    include_requests=False stores only the key of generate and stream
+    requests, which keeps traces of long prompts small; replay only needs
+    the key. Search requests are always stored, since replay answers single
+    searches from the queries of recorded batches.
+    """
+
+    def __init__(self, path: str, metadata: Optional[dict] = None, include_requests: bool = True):
+        self.path = path
+        self.include_requests = include_requests
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._file = _open_trace(path, "wt")
+        header = {"trace_version": TRACE_VERSION, "created_at": datetime.now().isoformat(), "metadata": metadata or {}}
+        self._file.write(json.dumps(header, ensure_ascii=False) + "\n")
+
+    def record(
+        self,
+        kind: str,
+        request: dict,
+        response=None,
+        seconds=0.0,
+        error: Optional[Exception] = None,
+        started: Optional[float] = None,
+        truncated: bool = False
+    ) -> None:
+        record = {"kind": kind, "key": request_key(kind, request)}
+        if self.include_requests or kind in ("search", "search_batch"):
+            record["request"] = request
+        if error is None or response is not None:
+            record["response"] = response
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        if truncated:
+            record["truncated"] = True
+        record["seconds"] = seconds
+        record["at"] = round((started if started is not None else time.monotonic()) - self._start, 6)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def call(self, kind: str, fn: Callable, request: dict):
+        """Run fn(**request), record it, and return its result (or raise its error)."""
+        started = time.monotonic()
+        try:
+            response = fn(**request)
+        except Exception as e:
+            self.record(kind, request, seconds=round(time.monotonic() - started, 6), error=e, started=started)
+            raise
+        self.record(kind, request, response, round(time.monotonic() - started, 6), started=started)
+        return response
+
+    def stream(self, fn: Callable, request: dict) -> Iterator[str]:
+        """Yield from fn(**request), recording the pieces and the time spent waiting for each."""
+        started = time.monotonic()
+        pieces, waits = [], []
+        error = None
+        finished = False
+        iterator = iter(fn(**request))
+        try:
+            while True:
+                wait_start = time.monotonic()
+                try:
+                    piece = next(iterator)
+                except StopIteration:
+                    finished = True
+                    break
+                waits.append(round(time.monotonic() - wait_start, 6))
+                pieces.append(piece)
+                yield piece
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # Also runs when the consumer stops early; the pieces it saw are
+            # recorded, marked as truncated so replay never passes them off as
+            # the whole response
+            self.record(
+                "stream", request, pieces, waits, error=error, started=started,
+                truncated=not finished and error is None
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        logger.info(f"Trace written to {self.path}: {self.counts}")
+
+    def __enter__(self) -> "TraceRecorder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class RecordingStore:
+    """
+    A store (see batch_retrieval.py) that records every search it forwards.
+
+    store is the store to search; without one, search_fn is used for single
+    queries and the vector_store module for batches, like the pipeline does.
+    """
+
+    def __init__(self, recorder: TraceRecorder, store: Optional[object] = None, search_fn: Optional[Callable] = None):
+        self.recorder = recorder
+        self.store = store
+        self.search_fn = store.search if store is not None else search_fn
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        return self.recorder.call("search", self.search_fn, {"query": query, "top_k": top_k})
+
+    def search_batch(self, queries: list[str], top_k: int = 5) -> list[list[dict]]:
+        def search_batch(queries, top_k):
+            return batch_search(queries, top_k=top_k, store=self.store)
+        return self.recorder.call("search_batch", search_batch, {"queries": list(queries), "top_k": top_k})
+
+
+def record_pipeline(recorder: TraceRecorder, pipeline: Optional[object] = None):
+    """
+    A RAGPipeline that forwards to pipeline (default: the current one) and records every call.
+
+    Usage:
+        set_pipeline(record_pipeline(recorder))
+    """
+    from rag_pipeline import RAGPipeline, get_pipeline
+
+    pipeline = get_pipeline() if pipeline is None else pipeline
+    batch_store = pipeline.batch_store
+    store = RecordingStore(recorder, batch_store, pipeline.vector_search if batch_store is None else None)
+    generate_fn = pipeline.generate_with_context
+    stream_fn = pipeline.stream_with_context
+
+    def generate_with_context(prompt: str, context: str, system_prompt: Optional[str] = None) -> str:
+        request = {"prompt": prompt, "context": context, "system_prompt": system_prompt}
+        return recorder.call("generate", generate_fn, request)
+
+    def stream_with_context(prompt: str, context: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        request = {"prompt": prompt, "context": context, "system_prompt": system_prompt}
+        return recorder.stream(stream_fn, request)
+
+    recording = RAGPipeline(
+        generate_fn=generate_with_context,
+        stream_fn=stream_with_context if stream_fn is not None else None,
+        prompt_manager=pipeline.prompt_manager,
+        store=store
+    )
+    recording.backends = pipeline.backends
+    return recording
+
+
+def read_trace(path: str) -> tuple[dict, list[dict]]:
+    """(header, records) of a trace file."""
+    with _open_trace(path, "rt") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or "trace_version" not in lines[0]:
+        raise ValueError(f"{path} is not a trace file")
+    header = lines[0]
+    if header["trace_version"] > TRACE_VERSION:
+        raise ValueError(f"{path} has trace version {header['trace_version']}; this reader supports {TRACE_VERSION}")
+    return header, lines[1:]
+
+
+class TraceReplay:
+    """
+    Serves recorded responses as a store, generate_with_context and stream_with_context.
+
+    Identical requests get their recorded responses in recorded order; once
+    those run out, the last one is repeated. Each response is a fresh copy,
+    as a real client would return. With latency="recorded" every call takes
+    as long as it did when recorded (streams pace each piece); with "zero"
+    it returns immediately.
+
+    A batch search that was recorded as single searches (or the other way
+    round, e.g. replaying with batch_retrieval toggled) is answered from
+    those records; a stream is answered from a recorded generation as one
+    piece, and a generation from a recorded stream. A truncated stream
+    replays only the pieces that were read when it was recorded: reading
+    past them, or asking for it as a whole generation, raises ReplayMiss.
+    """
+
+    def __init__(self, path: str, latency: str = "recorded"):
+        if latency not in LATENCY_MODES:
+            raise ValueError(f"Unknown latency mode: {latency!r} (expected one of {LATENCY_MODES})")
+        self.path = path
+        self.latency = latency
+        self.header, records = read_trace(path)
+        self._records = {}
+        for record in records:
+            self._records.setdefault(record["key"], []).append(record)
+            if record["kind"] == "search_batch" and "request" in record and "error" not in record:
+                # Also answer the batch's queries one at a time
+                request = record["request"]
+                for query, response in zip(request["queries"], record["response"]):
+                    single = {"query": query, "top_k": request["top_k"]}
+                    self._records.setdefault(request_key("search", single), []).append(
+                        {"kind": "search", "response": response, "seconds": record["seconds"]}
+                    )
+        self._positions = {}
+        self._lock = threading.Lock()
+        self.counts = {"served": 0, "misses": 0}
+        logger.info(f"Loaded trace {path}: {len(records)} records, latency={latency}")
+
+    def _take(self, kind: str, request: dict) -> Optional[dict]:
+        key = request_key(kind, request)
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.counts["served"] += 1
+        return records[min(position, len(records) - 1)]
+
+    def _miss(self, kind: str, request: dict) -> ReplayMiss:
+        with self._lock:
+            self.counts["misses"] += 1
+        summary = request.get("query") or request.get("queries") or request.get("prompt")
+        return ReplayMiss(f"No recorded {kind} request for {summary!r}")
+
+    def _truncated(self, request: dict) -> ReplayMiss:
+        with self._lock:
+            self.counts["misses"] += 1
+        return ReplayMiss(
+            f"Recorded stream for {request['prompt']!r} was truncated by its consumer; the rest was never recorded"
+        )
+
+    def _wait(self, seconds: float) -> None:
+        if self.latency == "recorded" and seconds > 0:
+            time.sleep(seconds)
+
+    def _respond(self, record: dict):
+        seconds = record["seconds"]
+        self._wait(sum(seconds) if isinstance(seconds, list) else seconds)
+        if "error" in record:
+            raise ReplayedError(record["error"])
+        return copy.deepcopy(record["response"])
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        request = {"query": query, "top_k": top_k}
+        record = self._take("search", request)
+        if record is None:
+            raise self._miss("search", request)
+        return self._respond(record)
+
+    def search_batch(self, queries: list[str], top_k: int = 5) -> list[list[dict]]:
+        request = {"queries": list(queries), "top_k": top_k}
+        record = self._take("search_batch", request)
+        if record is not None:
+            return self._respond(record)
+        return [self.search(query, top_k=top_k) for query in queries]
+
+    def generate_with_context(self, prompt: str, context: str, system_prompt: Optional[str] = None) -> str:
+        request = {"prompt": prompt, "context": context, "system_prompt": system_prompt}
+        record = self._take("generate", request)
+        if record is None:
+            record = self._take("stream", request)
+            if record is None:
+                raise self._miss("generate", request)
+            if record.get("truncated"):
+                raise self._truncated(request)
+            return "".join(self._respond(record))
+        return self._respond(record)
+
+    def stream_with_context(self, prompt: str, context: str, system_prompt: Optional[str] = None) -> Iterator[str]:
+        request = {"prompt": prompt, "context": context, "system_prompt": system_prompt}
+        record = self._take("stream", request)
+        if record is None:
+            yield self.generate_with_context(prompt, context, system_prompt)
+            return
+        for piece, seconds in zip(record.get("response", []), record["seconds"]):
+            self._wait(seconds)
+            yield piece
+        if "error" in record:
+            raise ReplayedError(record["error"])
+        if record.get("truncated"):
+            raise self._truncated(request)
+
+
+def replay_pipeline(path: str, latency: str = "recorded", prompt_manager: Optional[object] = None):
+    """
+    A RAGPipeline served entirely from a trace. Prompt templates still come
+    from the local PromptManager unless one is passed.
+
+    Usage:
+        set_pipeline(replay_pipeline("trace.jsonl.gz", latency="zero"))
+    """
+    from rag_pipeline import RAGPipeline
+
+    replay = TraceReplay(path, latency)
+    pipeline = RAGPipeline(
+        generate_fn=replay.generate_with_context,
+        stream_fn=replay.stream_with_context,
+        prompt_manager=prompt_manager,
+        store=replay
+    )
+    pipeline.backends["replay"] = replay
+    return pipeline
+
+
+@contextmanager
+def profiled(output: Optional[str] = None, sort: str = "cumulative", limit: int = 25) -> Iterator[cProfile.Profile]:
+    """
+    Run the block under cProfile and log its top `limit` functions.
+
+    Pass output to also save the stats (open with snakeviz or pstats).
+    cProfile only sees the thread that entered the block, so profile
+    handouts with max_workers=1.
+
+    Usage:
+        with profiled("replay.prof"):
+            generate_full_handout("knee replacement")
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output:
+            profiler.dump_stats(output)
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats(sort).print_stats(limit)
+        logger.info(f"Profile ({sort}, top {limit}){' saved to ' + output if output else ''}:\n{report.getvalue()}")
+
+
+def _run_handouts(procedures: list[str], options: dict) -> list[dict]:
+    from rag_pipeline import generate_full_handout
+
+    return [generate_full_handout(procedure, **options) for procedure in procedures]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record live pipeline calls, or replay them offline")
+    parser.add_argument("mode", choices=("record", "replay"))
+    parser.add_argument("trace", help="Trace file (.jsonl or .jsonl.gz)")
+    parser.add_argument("procedures", nargs="*", help="Procedures to generate (replay: defaults to the recorded ones)")
+    parser.add_argument("--top-k", type=int, default=None, help="Chunks retrieved per section")
+    parser.add_argument("--max-workers", type=int, default=None, help="Concurrent sections per handout")
+    parser.add_argument("--batch-retrieval", action="store_true", default=None, help="One batched search per handout")
+    parser.add_argument("--latency", choices=LATENCY_MODES, default="recorded", help="Replay latency")
+    parser.add_argument("--profile", metavar="PATH", help="Profile the run with cProfile and save the stats here")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    from rag_pipeline import set_pipeline
+
+    options = {name: getattr(args, name) for name in CLI_OPTIONS if getattr(args, name) is not None}
+    procedures = args.procedures
+    recorder = None
+    if args.mode == "record":
+        if not procedures:
+            parser.error("record needs at least one procedure")
+        recorder = TraceRecorder(args.trace, metadata={"procedures": procedures, "options": options})
+        set_pipeline(record_pipeline(recorder))
+    else:
+        pipeline = replay_pipeline(args.trace, latency=args.latency)
+        recorded = pipeline.backends["replay"].header["metadata"]
+        procedures = procedures or recorded.get("procedures", [])
+        options = {**recorded.get("options", {}), **options}
+        if args.profile and options.get("max_workers", 1) > 1:
+            logger.warning("cProfile only sees the main thread; replaying with max_workers=1")
+            options["max_workers"] = 1
+        set_pipeline(pipeline)
+
+    start = time.perf_counter()
+    try:
+        if args.profile:
+            with profiled(args.profile):
+                handouts = _run_handouts(procedures, options)
+        else:
+            handouts = _run_handouts(procedures, options)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    summary = {
+        "mode": args.mode,
+        "procedures": procedures,
+        "options": options,
+        "elapsed_seconds": round(time.perf_counter() - start, 3),
+        "failed_sections": {h["procedure"]: h["quality_metrics"]["failed_sections"] for h in handouts},
+        "stage_seconds_total": {h["procedure"]: h["quality_metrics"]["stage_seconds_total"] for h in handouts}
+    }
+    if args.mode == "replay":
+        summary["replay"] = pipeline.backends["replay"].counts
+    print(json.dumps(summary, indent=2))